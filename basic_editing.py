@@ -6,23 +6,76 @@ must be an Ihmacs object containing the global state of the editor.
 """
 
 import re
+import time
+from functools import partial
 from string import (
     ascii_letters,
     digits,
     punctuation,
 )
-from random import randrange
 
 from tree_helpers import build_tree_from_pairs
-from markov import generate_sentence_from_text
-
-
-def self_insert_command(ihmacs_state):
-    """
-    Insert the character you type at point.
+from markov import generate_sentence_from_lines
+from ring_storage import RingStorage
+from syntax_table import CLOSE, OPEN, STRING
+
+
+# The most lines kept in *messages*, like message-log-max in Emacs. Older
+# lines are dropped as new ones come in.
+MESSAGE_LOG_MAX = 1000
+
+# How many characters around point motion by delimiters reads at first. The
+# window doubles until it holds enough units.
+MOTION_WINDOW = 256
+
+# How many characters either side of point thing at point reads at first. The
+# window doubles until it reaches past a boundary on both sides of point.
+THING_WINDOW = 256
+
+# Boundaries things cannot carry on past. Units are matched the same way in a
+# window cut just after boundaries as in the whole text.
+WHITESPACE_BOUNDARY = re.compile(r"\s")
+LINE_BOUNDARY = re.compile(r"\n")
+PARAGRAPH_BOUNDARY = re.compile(r"\n[ \t]*\n")
+
+# What ends a sentence, like sentence-end in Emacs. A sentence cannot go on
+# past the whitespace after its end, or past a blank line.
+SENTENCE_END = r"[.!?]+['\")\]]*(?=\s|$)"
+SENTENCE_BOUNDARY = re.compile(r"[.!?]+['\")\]]*\s|\n[ \t]*\n")
+
+# The kinds of things thing_at_point knows. Each maps to a regex matching the
+# things, and a regex matching boundaries no thing spans. Add an entry to teach
+# it a new kind of thing. The regex can also be a function taking the buffer
+# and returning the regex, for things that depend on the major mode.
+THING_PATTERNS = {
+    "word": (lambda buff: buff.major_mode.word_regex, WHITESPACE_BOUNDARY),
+    "line": (re.compile(r"^.*$", re.MULTILINE), LINE_BOUNDARY),
+    # Runs of the characters symbols are made of in Lisp
+    "symbol": (re.compile(r"[\w!$%&*+\-/:<=>?@^~]+"), WHITESPACE_BOUNDARY),
+    # Up to and including end punctuation followed by whitespace, or up to a
+    # blank line. Quotes and brackets after end punctuation are part of the
+    # sentence ending, so no sentence starts with one.
+    "sentence": (re.compile(r"[^\s.!?'\")\]](?:(?!" + SENTENCE_END + r")[^\n]"
+                            r"|\n(?![ \t]*\n))*(?:" + SENTENCE_END + ")?"),
+                 SENTENCE_BOUNDARY),
+    # Lines that are not blank, and the newline ending the last one
+    "paragraph": (re.compile(r"(?:^[ \t]*\S.*(?:\n|$))+", re.MULTILINE),
+                  PARAGRAPH_BOUNDARY),
+    # Trailing punctuation is taken to end the sentence, not the URL
+    "url": (re.compile(r"\b(?:(?:https?|ftp|file)://|mailto:)"
+                       r"[^\s<>\"'()]*[^\s<>\"'().,;:!?]"),
+            WHITESPACE_BOUNDARY),
+}
+
+
+def self_insert_command(ihmacs_state, num=1):
+    """
+    Insert the character you type at point N times.
 
     Args:
         ihmacs_state: The entire global Ihmacs state as an Ihmacs instance.
+        num: An int representing how many copies of the character to insert.
+            If 0 or negative, insert nothing.
 
     Returns:
         A string representing the inserted text. If the buffer is read only,
@@ -31,9 +84,14 @@ def self_insert_command(ihmacs_state):
     keychord = ihmacs_state.keychord
     # The last stroke typed in the keychord
     char = keychord[-1]
+    if num < 1:
+        return ""
 
     # Side effects
-    return insert(ihmacs_state, char)
+    # Typing a run of characters is undone in one go
+    ihmacs_state.active_buff().undo_amalgamate()
+    # All copies go in with one insertion rather than num separate ones
+    return insert(ihmacs_state, char * num)
 
 
 def insert(ihmacs_state, string):
@@ -90,21 +148,24 @@ def message(ihmacs_state, string):
     """
     Print string in echo area and append to *messages* buffer.
 
+    Only the last message_log_max lines of *messages* are kept. The buffer is
+    held in a ring, so dropping the oldest line costs as little as adding one.
+
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
         string: A message to send.
     """
     buff = ihmacs_state.find_buffer("*messages*")
     if buff is None:
-        create_buffer_no_switch(ihmacs_state,
-                                name="*messages*",
-                                read_only=True)
-        # Recursively call message again
-        message(ihmacs_state, string)
-        return
+        buff = ihmacs_state.create_buffer_no_switch(name="*messages*",
+                                                    read_only=True,
+                                                    storage=RingStorage)
 
     # Print to *messages*
     buff.append(string+"\n")
+    log_max = ihmacs_state.message_log_max
+    if log_max is not None:
+        buff.trim_lines(log_max)
 
     # Echo
     controller = ihmacs_state.controller
@@ -113,10 +174,10 @@ def message(ihmacs_state, string):
 
 def create_buffer_no_switch(ihmacs_state, name=None, read_only=False):
     """
-    Create a new buffer and switch to it.
+    Create a new buffer without switching to it.
 
-    If a name is not specified, give the buffer a random name. This random name
-    is just a random 6 digit integer.
+    If a name is not specified, the buffer is named *untitled*. If the name is
+    taken, a unique name is made from it, like *untitled*<2>.
 
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
@@ -124,7 +185,7 @@ def create_buffer_no_switch(ihmacs_state, name=None, read_only=False):
         read_only: A bool representing the read only state of the new buffer.
     """
     if name is None:
-        name = "*"+str(randrange(100000, 999999))+"*"
+        name = "*untitled*"
     ihmacs_state.create_buffer_no_switch(name=name, read_only=read_only)
 
 
@@ -132,8 +193,8 @@ def create_buffer(ihmacs_state, name=None, read_only=False):
     """
     Create a new buffer and switch to it.
 
-    If a name is not specified, give the buffer a random name. This random name
-    is just a random 6 digit integer.
+    If a name is not specified, the buffer is named *untitled*. If the name is
+    taken, a unique name is made from it, like *untitled*<2>.
 
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
@@ -141,44 +202,38 @@ def create_buffer(ihmacs_state, name=None, read_only=False):
         read_only: A bool representing the read only state of the new buffer.
     """
     if name is None:
-        name = "*"+str(randrange(100000, 999999))+"*"
+        name = "*untitled*"
     ihmacs_state.create_buffer(name=name, read_only=read_only)
 
 
 def next_buffer(ihmacs_state):
     """
-    Switch to the next buffer in the buffer list.
+    Switch to the next buffer, in most recently used order.
 
-    If the active buffer is the last buffer, switch to the first buffer.
+    Repeating the command visits every buffer, from the most recently used to
+    the least, then wraps around. Cycling does not change the order.
 
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
     """
-    buffer_list = ihmacs_state.buffers
-    current_buff_index = ihmacs_state.active_buff_index
-    next_buff_index = current_buff_index + 1
-    if len(buffer_list) == next_buff_index:
-        next_buff_index = 0
-
-    ihmacs_state.switch_buffer(next_buff_index)
+    buff = ihmacs_state.active_buff()
+    registry = ihmacs_state.buffer_registry
+    ihmacs_state.switch_to_buffer(registry.next(buff), record=False)
 
 
 def previous_buffer(ihmacs_state):
     """
-    Switch to the previous buffer in the buffer list.
+    Switch to the previous buffer, in most recently used order.
 
-    If the active buffer is the first buffer, switch to the last buffer.
+    Undoes next_buffer. From the most recently used buffer, switches to the
+    least recently used one.
 
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
     """
-    buffer_list = ihmacs_state.buffers
-    current_buff_index = ihmacs_state.active_buff_index
-    next_buff_index = current_buff_index - 1
-    if next_buff_index < 0:
-        next_buff_index = len(buffer_list) - 1
-
-    ihmacs_state.switch_buffer(next_buff_index)
+    buff = ihmacs_state.active_buff()
+    registry = ihmacs_state.buffer_registry
+    ihmacs_state.switch_to_buffer(registry.previous(buff), record=False)
 
 
 def kill_buffer(ihmacs_state):
@@ -186,12 +241,12 @@ def kill_buffer(ihmacs_state):
     Kill the active buffer.
 
     There is no going back after executing this command. The buffer is gone.
+    The most recently used buffer becomes the active buffer.
 
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
     """
-    active_buff_index = ihmacs_state.active_buff_index
-    ihmacs_state.kill_buffer(active_buff_index)
+    ihmacs_state.remove_buffer(ihmacs_state.active_buff())
 
 
 def kill_ihmacs(ihmacs_state):
@@ -206,6 +261,58 @@ def kill_ihmacs(ihmacs_state):
     ihmacs_state.end_session = True
 
 
+def save_some_buffers(ihmacs_state):
+    """
+    Save every modified buffer that is associated with a file.
+
+    The buffers are saved concurrently on background threads, and editing
+    carries on meanwhile. Once all of them have finished, reports how long it
+    took in *messages*.
+
+    Unlike GNU/Emacs, this does not ask before saving each buffer.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+    """
+    # Indirect buffers share text with their base, only save it once per file
+    buffers = {}
+    for buff in ihmacs_state.buffers:
+        if buff.modified and buff.path != "":
+            base = buff if buff.base is None else buff.base
+            buffers.setdefault((id(base), buff.path), buff)
+    if not buffers:
+        message(ihmacs_state, "(No files need saving)")
+        return
+
+    start = time.perf_counter()
+    results = []
+
+    def report(buff, future, finished):
+        # Run by the editing loop as each save finishes
+        error = future.exception()
+        if error is not None:
+            message(ihmacs_state, f"Saving {buff.name} failed: {error}")
+        results.append((None if error else future.result(), finished))
+        if len(results) < len(buffers):
+            return
+
+        saved = [written for written, _ in results if written is not None]
+        seconds = max(finished for _, finished in results) - start
+        megabytes = sum(saved) / (1024 * 1024)
+        throughput = megabytes / seconds if seconds > 0 else 0
+        message(ihmacs_state,
+                f"Saved {len(saved)} buffers ({megabytes:.2f} MB) in "
+                f"{seconds:.3f} s, {throughput:.1f} MB/s")
+
+    def finish(buff, future):
+        # Run on the thread that did the save, so only note the time
+        finished = time.perf_counter()
+        ihmacs_state.call_soon(lambda: report(buff, future, finished))
+
+    for buff in buffers.values():
+        buff.save_buffer().add_done_callback(partial(finish, buff))
+
+
 def command_undefined(ihmacs_state):
     """
     Tell user typed keychord is not mapped.
@@ -273,8 +380,87 @@ def newline(ihmacs_state, num=1):
         ihmacs_state: The global state of the editor as an Ihmacs instance.
         num: Number of lines to insert. Must be 1 or greater.
     """
+    buff = ihmacs_state.active_buff()
+
+    # Read only check
+    if buff.read_only:
+        message(ihmacs_state, f"{buff.name} is read only.")
+        return
+
+    if num < 1:
+        return
+
+    # All newlines go in with one edit rather than num separate ones
+    point = buff.point
+    with buff.transaction() as edits:
+        edits.insert(point, "\n" * num)
+
+
+def undo(ihmacs_state, num=1):
+    """
+    Undo the last N commands that edited the buffer.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        num: Number of commands to undo.
+    """
+    buff = ihmacs_state.active_buff()
+
+    # Read only check
+    if buff.read_only:
+        message(ihmacs_state, f"{buff.name} is read only.")
+        return
+
+    for _ in range(num):
+        if not buff.undo():
+            message(ihmacs_state, "No further undo information")
+            return
+
+
+def undo_redo(ihmacs_state, num=1):
+    """
+    Redo the last N commands undone.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        num: Number of commands to redo.
+    """
+    buff = ihmacs_state.active_buff()
+
+    # Read only check
+    if buff.read_only:
+        message(ihmacs_state, f"{buff.name} is read only.")
+        return
+
     for _ in range(num):
-        insert(ihmacs_state, "\n")
+        if not buff.redo():
+            message(ihmacs_state, "No further redo information")
+            return
+
+
+def narrow_to_region(ihmacs_state):
+    """
+    Restrict editing in the active buffer to the region.
+
+    The rest of the text is hidden and out of reach of every command until
+    widen is run.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+    """
+    buff = ihmacs_state.active_buff()
+    buff.narrow(buff.point, buff.mark)
+
+
+def widen(ihmacs_state):
+    """
+    Remove any restriction on the active buffer.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+    """
+    buff = ihmacs_state.active_buff()
+    buff.widen()
 
 
 def forward_char(ihmacs_state, num=1):
@@ -313,27 +499,35 @@ def point_max(ihmacs_state):
         ihmacs_state: The global state of the editor as an Ihmacs instance.
     """
     buff = ihmacs_state.active_buff()
-    text = buff.text
-    return len(text)
-
+    return buff.point_max
 
-# This function exists for if I were to add narrowing in the future.
 
-# pylint: disable=W0613
 def point_min(ihmacs_state):
     """
     Return the minimum allowed point of the active buffer.
 
+    This is 0 unless the buffer is narrowed.
+
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
     """
-    return 0
+    buff = ihmacs_state.active_buff()
+    return buff.point_min
 
 
 def point_forward_by_delimiter(ihmacs_state, delimiter_regex, num=1):
     """
     Return the point at the location forward N units separated by a delimiter.
 
+    Only the text after point is searched, a window at a time. The window
+    starts at MOTION_WINDOW characters and doubles until it holds N units or
+    reaches the end, so moving over a few units costs the same in a huge
+    buffer as in a small one.
+
+    Delimiters are expected to match runs of characters, like the word
+    delimiters of a mode or runs of newlines. A match cut short by the edge of
+    a window still starts in the right place, which is all that is needed.
+
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
         delimiter_regex: A compiled regex that searches for instances of the
@@ -352,34 +546,42 @@ def point_forward_by_delimiter(ihmacs_state, delimiter_regex, num=1):
                                            num=-num)
 
     buff = ihmacs_state.active_buff()
-    text = buff.text
     point = buff.point
-
-    delimiters = delimiter_regex.finditer(text)
-    # Units end at the start of delimiters. Find all ends after point.
-    unit_ends = [i.start() for i in delimiters if i.start() > point]
-
-    try:
-        # Find the end of the nth next unit
-        new_point = unit_ends[num-1]
-        return new_point
-    except IndexError:
-        # If we are trying to go too far ahead, that means we are in the
-        # last unit already. Move to the end of it.
-        new_point = point_max(ihmacs_state)
-        return new_point
+    end = buff.point_max
+
+    size = MOTION_WINDOW
+    while True:
+        window_end = min(end, point + size)
+        text = buff.substring(point, window_end)
+        # Units end at the start of delimiters. Find the nth end after point.
+        # A delimiter starting at point is the one point is already on.
+        found = 0
+        for match in delimiter_regex.finditer(text):
+            if match.start() > 0:
+                found += 1
+                if found == num:
+                    return point + match.start()
+        if window_end == end:
+            # If we are trying to go too far ahead, that means we are in the
+            # last unit already. Move to the end of it.
+            return end
+        size *= 2
 
 
 def point_backward_by_delimiter(ihmacs_state, delimiter_regex, num=1):
     """
     Return the point at the location backward N units separated by a delimiter.
 
+    Only the text before point is searched, a window at a time, like
+    point_forward_by_delimiter does after it. A match cut short by the start
+    of a window still ends in the right place, and one cut short by point
+    ends at point, where it does not count either way.
+
     Args:
-        Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
         delimiter_regex: A compiled regex that searches for instances of the
             delimiter.
-        num: The number of units to search forward.
+        num: The number of units to search backward.
 
     Returns:
         An int representing the location of the point moved backward by N
@@ -393,22 +595,25 @@ def point_backward_by_delimiter(ihmacs_state, delimiter_regex, num=1):
                                           num=-num)
 
     buff = ihmacs_state.active_buff()
-    text = buff.text
     point = buff.point
-
-    delimiters = delimiter_regex.finditer(text)
-    # Units start at the end of delimiters. Find all starts before point.
-    unit_starts = [i.end() for i in delimiters if i.end() < point]
-
-    try:
-        # Find the start of the nth previous unit
-        new_point = unit_starts[-num]
-        return new_point
-    except IndexError:
-        # If we are trying to go too far back, that means go to the
-        # first unit, or just the start of the buffer.
-        new_point = point_min(ihmacs_state)
-        return new_point
+    start = buff.point_min
+
+    size = MOTION_WINDOW
+    while True:
+        window_start = max(start, point - size)
+        text = buff.substring(window_start, point)
+        # Units start at the end of delimiters. Find all starts before point.
+        unit_starts = [match.end()
+                       for match in delimiter_regex.finditer(text)
+                       if match.end() < len(text)]
+        if len(unit_starts) >= num:
+            # The start of the nth previous unit
+            return window_start + unit_starts[-num]
+        if window_start == start:
+            # If we are trying to go too far back, that means go to the
+            # first unit, or just the start of the buffer.
+            return start
+        size *= 2
 
 
 def forward_by_delimiter(ihmacs_state, delimiter_regex, num=1):
@@ -483,6 +688,164 @@ def backward_word(ihmacs_state, num=1):
     forward_word(ihmacs_state, num=-num)
 
 
+def _windows_forward(buff, start, end):
+    """
+    Return the text from start to end as windows, each twice the size of the
+    last, starting at MOTION_WINDOW characters.
+
+    Returns:
+        A generator of (position, text) tuples, where position is where the
+        window starts.
+    """
+    size = MOTION_WINDOW
+    while start < end:
+        window_end = min(end, start + size)
+        yield start, buff.substring(start, window_end)
+        start = window_end
+        size *= 2
+
+
+def _windows_backward(buff, start, end):
+    """
+    Return the text from end back to start as windows, each twice the size of
+    the last, starting at MOTION_WINDOW characters.
+
+    Returns:
+        A generator of (position, text) tuples, where position is where the
+        window starts.
+    """
+    size = MOTION_WINDOW
+    while start < end:
+        window_start = max(start, end - size)
+        yield window_start, buff.substring(window_start, end)
+        end = window_start
+        size *= 2
+
+
+def point_forward_by_list(ihmacs_state, num=1):
+    """
+    Return the point after the next N balanced groups of parens.
+
+    Parens, and the string quotes that hide parens between them, come from
+    the syntax table of the major mode. Only the text up to the last paren
+    needed is read.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        num: The number of groups to move over. If negative, move backward.
+
+    Returns:
+        An int representing the position just after the close paren of the
+        Nth group, or just before its open paren if moving backward. None if
+        the parens are unbalanced before N groups are found.
+    """
+    if num < 0:
+        return point_backward_by_list(ihmacs_state, -num)
+    buff = ihmacs_state.active_buff()
+    point = buff.point
+    if num == 0:
+        return point
+    windows = _windows_forward(buff, point, buff.point_max)
+    return _scan_lists(buff.major_mode.syntax_table, windows, num,
+                       forward=True)
+
+
+def point_backward_by_list(ihmacs_state, num=1):
+    """
+    Return the point before the previous N balanced groups of parens.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        num: The number of groups to move over. If negative, move forward.
+
+    Returns:
+        An int representing the position of the open paren of the Nth group
+        back, or None if the parens are unbalanced before N groups are found.
+    """
+    if num < 0:
+        return point_forward_by_list(ihmacs_state, -num)
+    buff = ihmacs_state.active_buff()
+    point = buff.point
+    if num == 0:
+        return point
+    windows = _windows_backward(buff, buff.point_min, point)
+    return _scan_lists(buff.major_mode.syntax_table, windows, num,
+                       forward=False)
+
+
+def _scan_lists(syntax_table, windows, num, forward):
+    """
+    Find where N balanced groups of parens end, reading windows of text.
+
+    Args:
+        syntax_table: The SyntaxTable of the buffer.
+        windows: An iterable of (position, text) tuples, in the order to scan
+            them in.
+        num: An int representing the number of groups to find.
+        forward: A bool representing whether to scan forward or backward.
+
+    Returns:
+        An int representing the position after the last group, or None if
+        the parens are unbalanced.
+    """
+    # Scanning backward, close parens open groups
+    opener, closer = (OPEN, CLOSE) if forward else (CLOSE, OPEN)
+    expected = []
+    quote = None
+    for position, text in windows:
+        matches = syntax_table.paren_regex.finditer(text)
+        if not forward:
+            matches = reversed(list(matches))
+        for match in matches:
+            char = match.group()
+            if quote is not None:
+                # Inside a string, only its closing quote counts
+                if char == quote:
+                    quote = None
+                continue
+            syntax = syntax_table.syntax(char)
+            if syntax == STRING:
+                quote = char
+            elif syntax == opener:
+                expected.append(syntax_table.matching_paren(char))
+            elif syntax == closer:
+                if not expected or expected.pop() != char:
+                    return None
+                if not expected:
+                    num -= 1
+                    if num == 0:
+                        return position + match.end() if forward \
+                            else position + match.start()
+    return None
+
+
+def forward_list(ihmacs_state, num=1):
+    """
+    Move point forward over N balanced groups of parens.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        num: The number of groups to move over. If negative, move backward.
+    """
+    new_point = point_forward_by_list(ihmacs_state, num)
+    if new_point is None:
+        message(ihmacs_state, "Unbalanced parentheses")
+        return
+    buff = ihmacs_state.active_buff()
+    buff.set_point(new_point)
+
+
+def backward_list(ihmacs_state, num=1):
+    """
+    Move point backward over N balanced groups of parens.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        num: The number of groups to move over. If negative, move forward.
+    """
+    forward_list(ihmacs_state, num=-num)
+
+
 def beginning_of_buffer(ihmacs_state):
     """
     Move point to the beginning of the buffer.
@@ -518,12 +881,11 @@ def move_end_of_line(ihmacs_state):
     """
     # Test if we are already at the end of a line
     buff = ihmacs_state.active_buff()
-    text = buff.text
     point = buff.point
-    try:
-        current_char = text[point]
-    except IndexError:
-        # End of File
+    if point < buff.point_max:
+        current_char = buff.substring(point, point + 1)
+    else:
+        # End of File, or of the accessible part
         current_char = "\n"
     if current_char == "\n":
         # We are already at the end of a line.
@@ -552,6 +914,59 @@ def move_beginning_of_line(ihmacs_state):
     backward_by_delimiter(ihmacs_state, newline_regex)
 
 
+def goal_column(ihmacs_state):
+    """
+    Return the column vertical motion from point aims for.
+
+    This is the column point is at, unless point is where the last vertical
+    motion left it and the buffer has not changed since. Then it is the
+    column that motion aimed for, like temporary-goal-column in Emacs. Moving
+    down through a short line and on to a long one goes back to the column
+    started from.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+
+    Returns:
+        An int representing a column.
+    """
+    buff = ihmacs_state.active_buff()
+    goal = buff.temporary_goal_column
+    if goal is not None and goal[1:] == (buff.point, buff.modification_tick):
+        return goal[0]
+    return buff.column
+
+
+def line_move(ihmacs_state, num=1):
+    """
+    Move point N lines, keeping to the goal column.
+
+    Lines are found in the line index of the buffer, so this costs O(log n)
+    however far point moves. If the target line is shorter than the goal
+    column, point goes to the end of it. Moving past the first or last line
+    goes to the start or end of the accessible part.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        num: An int representing the number of lines to move. If negative,
+            move up.
+    """
+    buff = ihmacs_state.active_buff()
+    column = goal_column(ihmacs_state)
+    line = buff.line + num
+
+    if line < 1:
+        new_point = buff.point_min
+    elif line > buff.line_count:
+        new_point = buff.point_max
+    else:
+        line_start = buff.line_start(line)
+        new_point = min(line_start + column, buff.line_end(line))
+
+    buff.set_point(new_point)
+    buff.temporary_goal_column = (column, buff.point, buff.modification_tick)
+
+
 def previous_line(ihmacs_state, num=1):
     """
     Move up one line.
@@ -568,22 +983,7 @@ def previous_line(ihmacs_state, num=1):
     """
     if num == 0:
         return
-    if num < 0:
-        next_line(ihmacs_state, num=-num)
-        return
-
-    # Remember original column
-    buff = ihmacs_state.active_buff()
-    original_column = buff.column
-
-    for _ in range(num):
-        move_beginning_of_line(ihmacs_state)
-        backward_char(ihmacs_state)
-
-    # Adjust column
-    new_column = buff.column
-    adjust_chars = max(0, new_column-original_column)
-    backward_char(ihmacs_state, adjust_chars)
+    line_move(ihmacs_state, -num)
 
 
 def next_line(ihmacs_state, num=1):
@@ -596,28 +996,27 @@ def next_line(ihmacs_state, num=1):
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
         num: An int representing the number of lines to move. If negative, move
-            to the next line.
+            to the previous line.
 
     """
     if num == 0:
         return
-    if num < 0:
-        previous_line(ihmacs_state, num=-num)
-        return
+    line_move(ihmacs_state, num)
 
-    # Remember original column
-    buff = ihmacs_state.active_buff()
-    original_column = buff.column
 
-    for _ in range(num):
-        move_end_of_line(ihmacs_state)
-        forward_char(ihmacs_state)
+def goto_line(ihmacs_state, num=1):
+    """
+    Move point to the start of line N.
 
-    # Adjust column
-    current_line = line_at_point(ihmacs_state)
-    current_line_len = len(current_line)
-    adjust_chars = min(original_column, current_line_len)
-    forward_char(ihmacs_state, adjust_chars)
+    Lines count from 1 at the start of the accessible part. Lines before the
+    first go to the first line, and lines past the last go to the end.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        num: An int representing the line number to go to.
+    """
+    buff = ihmacs_state.active_buff()
+    buff.set_point(buff.line_start(num))
 
 
 def scroll_up(ihmacs_state, num=1):
@@ -666,10 +1065,72 @@ def scroll_down(ihmacs_state, num=1):
     scroll_up(ihmacs_state, num=-num)
 
 
+def bounds_of_regex_at_point(ihmacs_state, thing_regex,
+                             boundary_regex=LINE_BOUNDARY):
+    """
+    Return where the thing defined by a regex at point starts and ends.
+
+    The accessible part of the buffer is split into units, which are matches
+    of the regex. The thing at point is the first unit point is located
+    within, counting either end.
+
+    Only a window of text around point is searched. The window starts at
+    THING_WINDOW characters either side of point, and doubles until it holds
+    a boundary on each side of point. The units are then matched between the
+    nearest boundaries, so the cost depends on how far apart the boundaries
+    are, not on the size of the buffer.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        thing_regex: A compiled regex matching the units.
+        boundary_regex: A compiled regex matching text no unit spans, and that
+            no unit goes on after. Defaults to newlines.
+
+    Returns:
+        A tuple (start, end) of ints representing the bounds of the thing at
+        point, or None if point is not at a unit.
+    """
+    buff = ihmacs_state.active_buff()
+    point = buff.point
+    start = buff.point_min
+    end = buff.point_max
+
+    size = THING_WINDOW
+    while True:
+        window_start = max(start, point - size)
+        window_end = min(end, point + size)
+        text = buff.substring(window_start, window_end)
+        offset = point - window_start
+
+        # Units start just after the last boundary before point at the
+        # earliest, and end at the first one after it at the latest
+        left = 0 if window_start == start else None
+        right = len(text) if window_end == end else None
+        for boundary in boundary_regex.finditer(text):
+            if boundary.end() <= offset:
+                left = boundary.end()
+            elif boundary.start() >= offset:
+                right = boundary.end()
+                break
+        if left is not None and right is not None:
+            break
+        size *= 2
+
+    for unit in thing_regex.finditer(text, left, right):
+        unit_start, unit_end = unit.span()
+        if unit_start > offset:
+            # Units come in order, none later can hold point
+            break
+        if unit_end >= offset:
+            return (window_start + unit_start, window_start + unit_end)
+    return None
+
+
 # This does not do what the actual thing-at-point function does in GNU/Emacs,
 # although it could be used as a helper function do so (or maybe
 # not). Regardless, that doesn't matter.
-def thing_at_point_regex(ihmacs_state, thing_regex):
+def thing_at_point_regex(ihmacs_state, thing_regex,
+                         boundary_regex=LINE_BOUNDARY):
     """
     Return the thing the point is located in that is defined by a regex.
 
@@ -680,22 +1141,65 @@ def thing_at_point_regex(ihmacs_state, thing_regex):
     Args:
         ihmacs_state: The global state of the editor as an Ihmacs instance.
         thing_regex: A compiled regex defining the unit delimiters.
+        boundary_regex: A compiled regex matching text no unit spans.
+            Defaults to newlines.
 
     Returns:
         A string representing the thing at point. If point is not at a unit,
         return the empty string.
     """
+    bounds = bounds_of_regex_at_point(ihmacs_state, thing_regex,
+                                      boundary_regex)
+    if bounds is None:
+        # Point is not at a unit
+        return ""
     buff = ihmacs_state.active_buff()
-    text = buff.text
-    point = buff.point
+    return buff.substring(*bounds)
+
+
+def bounds_of_thing_at_point(ihmacs_state, thing):
+    """
+    Return where a kind of thing at point starts and ends.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        thing: A string naming a kind of thing in THING_PATTERNS, such as
+            "word", "line", "sentence", "paragraph", "symbol", or "url".
+
+    Returns:
+        A tuple (start, end) of ints representing the bounds of the thing at
+        point, or None if point is not at one.
+
+    Raises:
+        KeyError: If there is no such kind of thing.
+    """
+    pattern, boundary_regex = THING_PATTERNS[thing]
+    if callable(pattern):
+        pattern = pattern(ihmacs_state.active_buff())
+    return bounds_of_regex_at_point(ihmacs_state, pattern, boundary_regex)
+
 
-    units = thing_regex.finditer(text)
-    for unit in units:
-        start, end = unit.span()
-        if start <= point <= end:
-            return text[start:end]
-    # Point is not at a unit
-    return ""
+def thing_at_point(ihmacs_state, thing):
+    """
+    Return a kind of thing at point, like thing-at-point in GNU/Emacs.
+
+    Args:
+        ihmacs_state: The global state of the editor as an Ihmacs instance.
+        thing: A string naming a kind of thing in THING_PATTERNS, such as
+            "word", "line", "sentence", "paragraph", "symbol", or "url".
+
+    Returns:
+        A string representing the thing at point, or the empty string if point
+        is not at one.
+
+    Raises:
+        KeyError: If there is no such kind of thing.
+    """
+    bounds = bounds_of_thing_at_point(ihmacs_state, thing)
+    if bounds is None:
+        return ""
+    buff = ihmacs_state.active_buff()
+    return buff.substring(*bounds)
 
 
 def line_at_point(ihmacs_state):
@@ -708,10 +1212,7 @@ def line_at_point(ihmacs_state):
     Returns:
         A string representing the contents of the current line.
     """
-    line_regex_string = "^.*$"
-    line_regex = re.compile(line_regex_string,
-                            re.MULTILINE)
-    return thing_at_point_regex(ihmacs_state, line_regex)
+    return thing_at_point(ihmacs_state, "line")
 
 
 def word_at_point(ihmacs_state):
@@ -724,11 +1225,7 @@ def word_at_point(ihmacs_state):
     Returns:
         A string representing the word at which the point is located in.
     """
-    buff = ihmacs_state.active_buff()
-    major_mode = buff.major_mode
-    word_regex = major_mode.word_regex
-
-    return thing_at_point_regex(ihmacs_state, word_regex)
+    return thing_at_point(ihmacs_state, "word")
 
 
 def kill_append(ihmacs_state, text):
@@ -797,12 +1294,12 @@ def kill_ring_save(ihmacs_state):
         ihmacs_state: The global state of the editor as an Ihmacs instance.
     """
     buff = ihmacs_state.active_buff()
-    text = buff.text
-    points = (buff.point, buff.mark)
+    # Mark may have been left outside a restriction
+    points = (buff.point, min(max(buff.mark, buff.point_min), buff.point_max))
     start = min(points)
     end = max(points)
 
-    kill_text = text[start:end]
+    kill_text = buff.substring(start, end)
     kill_append(ihmacs_state, kill_text)
 
 
@@ -926,9 +1423,9 @@ def generate_sentence_from_buffer(ihmacs_state, num=1):
             0 or negative, generate no sentences.
     """
     buff = ihmacs_state.active_buff()
-    text = buff.text
-
-    text_to_insert = generate_sentence_from_text(text, num=num)
+    # The accessible part is read a line at a time, so the text is never
+    # copied out whole.
+    text_to_insert = generate_sentence_from_lines(buff.iter_lines(), num=num)
     insert(ihmacs_state, text_to_insert)
 
 
@@ -960,6 +1457,9 @@ DEFAULT_GLOBAL_KEYMAP = build_tree_from_pairs(
      [["KEY_PPAGE"], scroll_down],
      [["C-k"], kill_line],
      [["C-y"], yank],
+     [["C-/"], undo],
+     [["C-_"], undo],  # What curses reads C-/ as
+     [["C-M-_"], undo_redo],
      [["C- "], set_mark_command],
      [["C-x", "C-x"], exchange_point_and_mark],
      [["C-w"], kill_region],
@@ -968,6 +1468,10 @@ DEFAULT_GLOBAL_KEYMAP = build_tree_from_pairs(
      [["M-d"], forward_kill_word],
      [["M-<"], beginning_of_buffer],
      [["M->"], end_of_buffer],
+     [["C-M-n"], forward_list],
+     [["C-M-p"], backward_list],
+     [["M-g", "g"], goto_line],
+     [["M-g", "M-g"], goto_line],
      # For fun
      [["C-c", "C-j"], generate_sentence_from_buffer],
      # Extended commands
@@ -975,5 +1479,8 @@ DEFAULT_GLOBAL_KEYMAP = build_tree_from_pairs(
      [["C-x", "b"], next_buffer],  # Real Emacs runs switch-to-buffer
      [["C-x", "C-b"], previous_buffer],  # Real Emacs runs list-buffers
      [["C-x", "k"], kill_buffer],
+     [["C-x", "s"], save_some_buffers],
+     [["C-x", "n", "n"], narrow_to_region],
+     [["C-x", "n", "w"], widen],
      [["C-x", "C-c"], kill_ihmacs], ]
 )
@@ -0,0 +1,299 @@
+"""
+Benchmarks for Ihmacs.
+
+These are not tests. They time the editor internals on large inputs and print
+the results. Run a benchmark by name, for example:
+
+    python benchmarks.py typing
+
+Run `python benchmarks.py --help` to list the benchmarks and their options.
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+import basic_editing
+from buff import Buffer
+from gap_buffer import GapBuffer
+from ihmacs_class import IhmacsSansCurses
+from rope import Rope
+from text_storage import StringStorage
+from utf8_storage import Utf8Storage
+
+
+MEGABYTE = 1024 * 1024
+
+
+def make_text(size):
+    """
+    Make a string of roughly size characters of line based filler text.
+
+    Args:
+        size: An int representing how many characters to generate.
+
+    Returns:
+        A string made of short lines of text.
+    """
+    line = "The quick brown fox jumps over the lazy dog.\n"
+    return line * (size // len(line) + 1)
+
+
+def time_typing(storage, text, chars):
+    """
+    Time typing characters one at a time into the middle of a buffer.
+
+    Args:
+        storage: The TextStorage subclass the buffer should use.
+        text: A string representing the initial text of the buffer.
+        chars: An int representing how many characters to type.
+
+    Returns:
+        A float representing the number of seconds spent typing.
+    """
+    buff = Buffer(storage=storage)
+    buff._text = text
+    buff.set_point(len(text) // 2)
+
+    typed = "hello world\n"
+    start = time.perf_counter()
+    for i in range(chars):
+        buff.insert(typed[i % len(typed)])
+    return time.perf_counter() - start
+
+
+def benchmark_typing(args):
+    """
+    Compare typing into a large buffer with different storage engines.
+
+    Args:
+        args: The parsed command line arguments.
+    """
+    text = make_text(args.size * MEGABYTE)
+    print(f"Typing {args.chars} characters into a {args.size} MB buffer")
+    for storage in (GapBuffer, StringStorage, Utf8Storage):
+        seconds = time_typing(storage, text, args.chars)
+        per_key = seconds / args.chars * 1e6
+        print(f"{storage.__name__:>15}: {seconds:8.3f} s"
+              f" ({per_key:9.1f} us per keystroke)")
+
+
+def undo_log_memory(log):
+    """
+    Add up the memory taken by every object in an undo log.
+
+    Args:
+        log: An UndoLog.
+
+    Returns:
+        An int representing a number of bytes.
+    """
+    total = sys.getsizeof(log._undo) + sys.getsizeof(log._redo)
+    for group in list(log._undo) + log._redo:
+        total += sys.getsizeof(group) + sys.getsizeof(group.records)
+        for record in group.records:
+            total += sum(sys.getsizeof(part) for part in record)
+            total += sys.getsizeof(record)
+    return total
+
+
+def benchmark_undo(args):
+    """
+    Measure how much memory the undo log takes per 100k edits.
+
+    The edits are mostly typing, with some backspacing and pasting, and now
+    and then a jump to a random spot in a large buffer. There is an undo
+    boundary after each one, like the controller sets. The log is given no
+    memory cap so all of it is measured.
+
+    Args:
+        args: The parsed command line arguments.
+    """
+    buff = Buffer()
+    buff._text = make_text(args.size * MEGABYTE)
+    buff._shared.undo_log.limit = float("inf")
+    rand = random.Random(0)
+
+    start = time.perf_counter()
+    for _ in range(args.edits):
+        choice = rand.random()
+        if choice < 0.01:
+            buff.set_point(rand.randrange(buff.length))
+        if choice < 0.8:
+            buff.undo_amalgamate()
+            buff.insert(rand.choice("abcdefghij \n"))
+        elif choice < 0.95:
+            buff.delete_char(-1)
+        else:
+            buff.insert("pasted text\n" * 4)
+        buff.undo_boundary()
+    seconds = time.perf_counter() - start
+
+    per_100k = 100000 / args.edits
+    log = buff._shared.undo_log
+    print(f"{args.edits} edits to a {args.size} MB buffer in {seconds:.3f} s")
+    print(f"{len(log._undo):>10} undo groups")
+    print(f"{log.size * per_100k / MEGABYTE:10.2f} MB per 100k edits,"
+          " as estimated by the log")
+    print(f"{undo_log_memory(log) * per_100k / MEGABYTE:10.2f}"
+          " MB per 100k edits, measured")
+    print(f"{buff.length * 100000 / MEGABYTE:10.2f}"
+          " MB per 100k edits, keeping a copy of the text per edit")
+
+
+# Lines of text in different scripts, for the memory benchmark. Each corpus
+# repeats its lines, and the mixed one ends in a single emoji.
+CORPORA = {
+    "ascii": ["The quick brown fox jumps over the lazy dog.\n"],
+    "latin-1": ["Ça coûte très cher à Zürich, déjà vu ½ fois.\n"],
+    "mixed": ["The quick brown fox jumps over the lazy dog.\n"] * 8 +
+             ["Быстрая лиса, 敏捷的狐狸, ελληνικά.\n"],
+}
+
+
+def make_corpus(name, size):
+    """
+    Make a string of roughly size characters from a corpus.
+
+    Args:
+        name: A string representing a key of CORPORA.
+        size: An int representing how many characters to generate.
+
+    Returns:
+        A string made of the lines of the corpus.
+    """
+    block = "".join(CORPORA[name])
+    text = block * (size // len(block) + 1)
+    if name == "mixed":
+        text += "\N{GRINNING FACE}\n"
+    return text
+
+
+def storage_memory(storage, name, size):
+    """
+    Measure the memory a storage takes to hold a corpus.
+
+    The text is made and dropped while tracing, so only what the storage
+    keeps is counted.
+
+    Args:
+        storage: The TextStorage subclass to measure.
+        name: A string representing a key of CORPORA.
+        size: An int representing how many characters to generate.
+
+    Returns:
+        A tuple (bytes, characters) of the memory the storage takes and the
+        number of characters it holds.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        held = storage(make_corpus(name, size))
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before, len(held))
+
+
+def benchmark_memory(args):
+    """
+    Compare the memory storage engines take for text in different scripts.
+
+    Args:
+        args: The parsed command line arguments.
+    """
+    size = args.size * MEGABYTE
+    print(f"Memory to hold {args.size} M characters, in bytes per character")
+    print(f"{'':>15}" + "".join(f"{name:>10}" for name in CORPORA))
+    for storage in (StringStorage, Rope, Utf8Storage):
+        row = f"{storage.__name__:>15}"
+        for name in CORPORA:
+            memory, chars = storage_memory(storage, name, size)
+            row += f"{memory / chars:10.2f}"
+        print(row)
+
+
+def benchmark_motion(args):
+    """
+    Time moving by words and lines in the middle of a large buffer.
+
+    Moving vertically and going to a line use the line index, so they do not
+    depend on the buffer size either. Looking up the thing at point is timed
+    alongside, as it searches around point the same way.
+
+    Each motion is also timed scanning the whole buffer for delimiters, the
+    way it was done before motion searched outward from point.
+
+    Args:
+        args: The parsed command line arguments.
+    """
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = make_text(args.size * MEGABYTE)
+    middle = buff.length // 2
+    word_regex = buff.major_mode.word_delimiters_regex
+    print(f"Moving around the middle of a {args.size} MB buffer")
+
+    motions = [
+        ("forward_word", basic_editing.forward_word),
+        ("backward_word", basic_editing.backward_word),
+        ("forward_word x 100",
+         lambda state: basic_editing.forward_word(state, num=100)),
+        ("move_end_of_line", basic_editing.move_end_of_line),
+        ("kill_line", basic_editing.kill_line),
+        ("next_line", basic_editing.next_line),
+        ("previous_line", basic_editing.previous_line),
+        ("goto_line",
+         lambda state: basic_editing.goto_line(
+             state, random.randint(1, buff.line_count))),
+        ("word_at_point", basic_editing.word_at_point),
+        ("sentence at point",
+         lambda state: basic_editing.thing_at_point(state, "sentence")),
+    ]
+    for name, motion in motions:
+        buff.set_point(middle)
+        start = time.perf_counter()
+        for _ in range(args.moves):
+            motion(ihmacs)
+        per_move = (time.perf_counter() - start) / args.moves * 1e6
+        print(f"{name:>20}: {per_move:9.1f} us per move")
+
+    text = buff.text
+    start = time.perf_counter()
+    unit_ends = [match.start() for match in word_regex.finditer(text)
+                 if match.start() > middle]
+    scan = (time.perf_counter() - start) * 1e6
+    print(f"{'whole buffer scan':>20}: {scan:9.1f} us per move"
+          f" ({len(unit_ends)} delimiters after point)")
+
+
+BENCHMARKS = {
+    "typing": benchmark_typing,
+    "undo": benchmark_undo,
+    "memory": benchmark_memory,
+    "motion": benchmark_motion,
+}
+
+
+def main():
+    """
+    Parse the command line and run the requested benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    parser.add_argument("--size", type=int, default=10,
+                        help="size of the buffer in megabytes")
+    parser.add_argument("--chars", type=int, default=10000,
+                        help="number of characters to type")
+    parser.add_argument("--edits", type=int, default=100000,
+                        help="number of edits to make")
+    parser.add_argument("--moves", type=int, default=1000,
+                        help="number of motions to make")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
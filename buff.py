@@ -2,8 +2,125 @@
 Ihmacs buffer implementation.
 """
 
+import os
+from contextlib import contextmanager
+
+from file_io import (
+    CHUNK_SIZE,
+    append_to_file,
+    file_state,
+    save_in_background,
+    write_atomic,
+)
 from fundamental_mode import FundamentalMode
-from tree_helpers import merge_trees
+from interval_tree import Interval, IntervalTree
+from keymap import LayeredKeymap
+from marker import Marker, MarkerList
+from mmap_storage import MmapStorage
+from rope import Rope
+from text_storage import PieceTable
+from undo import UndoLog
+from versions import VersionTable
+
+
+# Files larger than this many bytes are loaded into a rope, regardless of the
+# storage the buffer was created with.
+ROPE_THRESHOLD = 64 * 1024 * 1024
+
+
+# pylint: disable=R0902, disable=R0903
+class BufferText:
+    """
+    The text of a buffer, and everything that has to change along with it.
+
+    A buffer and its indirect buffers all share one of these.
+
+    Attributes:
+        storage: A TextStorage instance holding the text.
+        storage_class: The TextStorage subclass used to hold the text when it
+            is reloaded.
+        lines: A line index for the text, kept up to date on every edit.
+        markers: A MarkerList of every marker in the text, whichever buffer
+            it belongs to, kept up to date on every edit.
+        properties: An IntervalTree of the text properties of the text. Each
+            interval holds one property.
+        overlays: An IntervalTree of the overlays on the text, whichever
+            buffer they belong to.
+        versions: A VersionTable of the versions of the text pinned by
+            readers in other threads.
+        undo_log: An UndoLog of the edits made to the text.
+        modified: A bool representing if the text has been modified since
+            last save.
+        save_future: A Future of the last save started, or None.
+        pending_saves: A list of (future, outcome, generation) tuples of the
+            saves whose results have not been published yet, oldest first.
+            outcome is a dict the save fills in from its thread, and
+            generation is the save_generation the save was started at.
+        save_generation: An int counting the saves started.
+        disk_state: The file_state of the associated file as of the last save
+            or revert, or None if unknown.
+        saved_length: An int representing the length of the text as of the
+            last save or revert, or None if the text was never saved.
+        unsaved_start: An int representing the lowest position edited since
+            the last save or revert, or None if nothing was edited.
+        tick: An int counting the changes made to the text. It only ever
+            goes up.
+        before_change: A list of functions called before every change.
+        after_change: A list of functions called after every change.
+    """
+
+    def __init__(self, storage_class):
+        """
+        Initialize empty text.
+
+        Args:
+            storage_class: A TextStorage subclass used to hold the text.
+        """
+        self.storage_class = storage_class
+        self.undo_log = UndoLog()
+        self.markers = MarkerList()
+        self.properties = IntervalTree()
+        self.overlays = IntervalTree()
+        self.versions = VersionTable()
+        self.storage = None
+        self.tick = 0
+        self.before_change = []
+        self.after_change = []
+        self.set_storage(storage_class())
+        self.modified = False
+        self.save_future = None
+        self.pending_saves = []
+        self.save_generation = 0
+
+    def set_storage(self, storage):
+        """
+        Replace the storage holding the text.
+
+        Args:
+            storage: A TextStorage instance holding the new text.
+        """
+        # Properties belong to the old text, but overlays stay where they can.
+        # Only as much of the new text is looked at as is needed to reach the
+        # last overlay and marker, so mapped files open without being read.
+        self.properties = IntervalTree()
+        overlays_end = self.overlays.end
+        end = storage.clamp(overlays_end)
+        if end < overlays_end:
+            self.overlays.replace(end, overlays_end, 0)
+
+        self.storage = storage
+        self.lines = storage.line_index()
+        self.markers.clamp(storage.clamp(self.markers.end))
+
+        # Nothing is known about how the new text relates to the file, and
+        # saves of the old text no longer say anything about it either
+        self.disk_state = None
+        self.pending_saves = []
+        self.saved_length = None
+        self.unsaved_start = None
+
+        # Edits to the old text cannot be undone in the new one
+        self.undo_log.clear()
 
 
 # pylint: disable=R0902, disable=R0904
@@ -11,26 +128,43 @@ class Buffer:
     """
     Ihmacs text buffer.
 
+    A buffer can be indirect, sharing its text with a base buffer. An edit
+    made through either is seen by both, but each keeps its own point, mark,
+    and display line.
+
     Attributes:
-        _text: A string representing the buffer text.
-        _modified: A bool representing if the buffer has been modified since
-            last save.
-        _point: An int representing cursor position in file.
-        _mark: An int representing the mark position in file. Used to define
-            the region.
+        _shared: The BufferText holding the text of the buffer, shared with
+            its base and indirect buffers.
+        _base: The Buffer this buffer shares its text with, or None if this
+            is not an indirect buffer.
+        _point_marker: The Marker for point, the cursor position. Text
+            inserted at point goes before it.
+        _mark_marker: The Marker for mark. Used to define the region.
         _name: A string representing the buffer name
         _path: A string representing the file path on the system associated
             with the buffer. This is the file the buffer is saved to.
         major_mode: A major mode type representing the active major mode.
-        keymap: A dictionary tree representing the keymap for the buffer.
+        minor_modes: A list of the active minor modes, each with a modemap.
+            Earlier ones take priority.
+        local_keymap: A dictionary tree representing the keymap of bindings
+            made in this buffer alone.
+        _global_keymap: A dictionary tree representing the global keymap.
+            This is the keymap of the session, not a copy.
+        temporary_goal_column: A tuple (column, point, tick) holding the
+            column vertical motion aims for, and the point and modification
+            tick it left behind, or None. Motion starting from that same
+            point and tick keeps aiming for the column.
         _display_line: An int representing which line in the buffer is to be
             displayed as the first line of a window in the view. Line number
             indexes at 1, as in, the first line is 1 not 0.
         _read_only: A bool representing if the buffer is read only or not.
+        _restriction: A tuple (start, end) of Markers bounding the part of the
+            text the buffer is narrowed to, or None if it is not narrowed.
     """
 
+    # pylint: disable=R0913
     def __init__(self, name="**", path="", keymap=None,
-                 read_only=False):
+                 read_only=False, storage=PieceTable, base=None):
         """
         Initialize buffer instance.
 
@@ -41,21 +175,37 @@ class Buffer:
                 the global keymap passed through.
             read_only: A bool representing whether or not to make the new
                 buffer read only.
+            storage: A TextStorage subclass used to hold the buffer text.
+                Defaults to a piece table.
+            base: A Buffer to share text with, making this an indirect
+                buffer of it. Storage is ignored if this is given.
         """
-        self._text = ""
-        self._modified = False
-        self._point = 0
-        self._mark = 0
+        if base is None:
+            self._shared = BufferText(storage)
+        else:
+            # Indirect buffers of indirect buffers share with the original
+            if base.base is not None:
+                base = base.base
+            self._shared = base._shared
+        self._base = base
+        self._restriction = None
+
+        point = 0 if base is None else base.point
+        mark = 0 if base is None else base.mark
+        self._point_marker = self.make_marker(point, advance=True)
+        self._mark_marker = self.make_marker(mark)
         self._name = name
         self._path = path
         self._read_only = read_only
 
         self.major_mode = FundamentalMode()
 
+        self.minor_modes = []
+        self.local_keymap = {}
         if keymap is None:
             keymap = {}
-        # Need to write recursive tree merge.
-        self.keymap = merge_trees(keymap, self.major_mode.modemap)
+        self._global_keymap = keymap
+        self.temporary_goal_column = None
 
         # Index at 1 as Emacs and every other editor does for line number.
         self._display_line = 1
@@ -66,6 +216,13 @@ class Buffer:
         # self.revert()
 
     # Properties
+    @property
+    def base(self):
+        """
+        Return the buffer this indirect buffer shares text with, or None.
+        """
+        return self._base
+
     @property
     def read_only(self):
         """
@@ -77,29 +234,118 @@ class Buffer:
     def text(self):
         """
         Return text in buffer.
+
+        The storage caches the materialized string until the next edit, so
+        repeated reads between edits are cheap.
+        """
+        return self._shared.storage.text
+
+    @property
+    def length(self):
+        """
+        Return the number of characters in buffer, without building the text.
+        """
+        return len(self._shared.storage)
+
+    # Assigning to _text replaces the contents of the storage without going
+    # through the editing methods. The test fixtures rely on this.
+    @property
+    def _text(self):
+        """
+        Return text in buffer.
+        """
+        return self._shared.storage.text
+
+    @_text.setter
+    def _text(self, text):
         """
-        return self._text
+        Replace the text in the buffer with a fresh storage holding text.
+        """
+        self._set_storage(self._shared.storage_class(text))
 
     @property
     def modified(self):
         """
         Return modification state of buffer.
         """
-        return self._modified
+        self._publish_saves()
+        return self._shared.modified
+
+    @property
+    def modification_tick(self):
+        """
+        Return a number that goes up every time the text changes.
+
+        A cache over the text can remember the tick it was built at, and is
+        up to date as long as the tick has not moved.
+        """
+        return self._shared.tick
+
+    @property
+    def before_change(self):
+        """
+        Return the list of functions called before every change to the text.
+
+        Each is called with (start, old_end, new_end): the text between start
+        and old_end is about to be replaced by text that will end at new_end.
+        Append to the list to add a hook. Indirect buffers share the list.
+        """
+        return self._shared.before_change
+
+    @property
+    def after_change(self):
+        """
+        Return the list of functions called after every change to the text.
+
+        Each is called with (start, old_end, new_end): the text that was
+        between start and old_end now lies between start and new_end. Append
+        to the list to add a hook. Indirect buffers share the list.
+        """
+        return self._shared.after_change
 
     @property
     def point(self):
         """
         Return position of point in buffer.
         """
-        return self._point
+        return self._point_marker.position
 
     @property
     def mark(self):
         """
         Return position of mark in buffer.
         """
-        return self._mark
+        return self._mark_marker.position
+
+    # Point and mark live in markers, but assigning to _point and _mark still
+    # moves them. The test fixtures rely on this.
+    @property
+    def _point(self):
+        """
+        Return position of point in buffer.
+        """
+        return self._point_marker.position
+
+    @_point.setter
+    def _point(self, pos):
+        """
+        Move point to pos without checking it is in the buffer.
+        """
+        self._shared.markers.move(self._point_marker, pos)
+
+    @property
+    def _mark(self):
+        """
+        Return position of mark in buffer.
+        """
+        return self._mark_marker.position
+
+    @_mark.setter
+    def _mark(self, pos):
+        """
+        Move mark to pos without checking it is in the buffer.
+        """
+        self._shared.markers.move(self._mark_marker, pos)
 
     @property
     def name(self):
@@ -108,6 +354,19 @@ class Buffer:
         """
         return self._name
 
+    @property
+    def keymap(self):
+        """
+        Return the keymap of the buffer.
+
+        The local keymap, the minor mode maps, the major mode map, and the
+        global keymap are looked up in that order, without being merged.
+        """
+        layers = [self.local_keymap]
+        layers += [mode.modemap for mode in self.minor_modes]
+        layers += [self.major_mode.modemap, self._global_keymap]
+        return LayeredKeymap(layers)
+
     @property
     def path(self):
         """
@@ -122,16 +381,57 @@ class Buffer:
         """
         return self._display_line
 
+    @property
+    def point_min(self):
+        """
+        Return the lowest position in the accessible part of the buffer.
+
+        This is 0 unless the buffer is narrowed.
+        """
+        if self._restriction is None:
+            return 0
+        return self._restriction[0].position
+
+    @property
+    def point_max(self):
+        """
+        Return the highest position in the accessible part of the buffer.
+
+        This is the length of the text unless the buffer is narrowed.
+        """
+        if self._restriction is None:
+            return len(self._shared.storage)
+        return self._restriction[1].position
+
+    @property
+    def narrowed(self):
+        """
+        Return whether the buffer is narrowed.
+        """
+        return self._restriction is not None
+
+    def _first_line(self):
+        """
+        Return the line of the text the accessible part starts on.
+
+        Lines index at 0 here, like in the line index.
+        """
+        if self._restriction is None:
+            return 0
+        return self._shared.lines.line_of(self.point_min)
+
     @property
     def line(self):
         """
         Return the line in the buffer the point is located at.
+
+        If the buffer is narrowed, lines count from the start of the
+        accessible part.
         """
         point = self.point
-        text_before_point = self.text[:point]
         # Because of the bloody convention that the first line of text is 1 not
         # 0 add 1
-        return 1 + text_before_point.count("\n")
+        return 1 + self._shared.lines.line_of(point) - self._first_line()
 
     @property
     def column(self):
@@ -139,23 +439,168 @@ class Buffer:
         Return the column in the buffer the point is located at.
         """
         point = self.point
-        text = self.text
-        # Count how many characters it takes to find a newline char before
-        # point
-        col = 0
-        while point - col > 0:
-            if text[point-col-1] == "\n":  # Hard coding Unix newline...
-                return col
-            col += 1
-        return col
+        lines = self._shared.lines
+        line_start = lines.line_start(lines.line_of(point))
+        return point - max(line_start, self.point_min)
 
     @property
     def line_count(self):
         """
-        Return the number of lines in the buffer.
+        Return the number of lines in the accessible part of the buffer.
+        """
+        if self._restriction is None:
+            return self._shared.lines.line_count
+        lines = self._shared.lines
+        return lines.line_of(self.point_max) - self._first_line() + 1
+
+    def _clamp_accessible(self, pos):
+        """
+        Clamp a position to the accessible part of the buffer.
+        """
+        if self._restriction is None:
+            # Asking the storage keeps mapped files from being read through
+            return max(0, self._shared.storage.clamp(pos))
+        return max(self.point_min, min(pos, self.point_max))
+
+    def line_start(self, line):
+        """
+        Return the position a line starts at.
+
+        Args:
+            line: An int representing a line number. Line numbers index at 1,
+                counting from the start of the accessible part.
+
+        Returns:
+            An int representing the position of the first character of the
+            line. If the line does not exist, the end of the accessible part.
+        """
+        # Lines index at 1 in the buffer, but at 0 in the index.
+        line = max(1, line) - 1 + self._first_line()
+        return self._clamp_accessible(self._shared.lines.line_start(line))
+
+    def line_end(self, line):
+        """
+        Return the position a line ends at.
+
+        Args:
+            line: An int representing a line number. Line numbers index at 1,
+                counting from the start of the accessible part.
+
+        Returns:
+            An int representing the position of the newline ending the line,
+            or the end of the accessible part for the last line.
+        """
+        line = line - 1 + self._first_line()
+        return self._clamp_accessible(self._shared.lines.line_end(line))
+
+    def lines(self, start, end):
+        """
+        Return the text of a range of lines.
+
+        Only the requested lines are copied out of storage.
+
+        Args:
+            start: An int representing the first line to return. Line numbers
+                index at 1, counting from the start of the accessible part.
+            end: An int representing the line to stop at (exclusive).
+
+        Returns:
+            A list of strings representing the lines, without their newlines.
+            Lines past the end of the accessible part are left out.
+        """
+        return list(self.iter_lines(start, end))
+
+    def iter_lines(self, start_line=1, end_line=None):
+        """
+        Return the text of a range of lines, one line at a time.
+
+        The lines are read out of storage in chunks as the generator is
+        consumed, so the text is never copied out whole. Do not edit the
+        buffer while iterating. To read from another thread, pin a version.
+
+        Args:
+            start_line: An int representing the first line to return. Line
+                numbers index at 1, counting from the start of the accessible
+                part.
+            end_line: An int representing the line to stop at (exclusive), or
+                None to read to the end of the accessible part.
+
+        Returns:
+            A generator of strings representing the lines, without their
+            newlines. Lines past the end of the accessible part are left out.
+        """
+        lines = self._shared.lines
+        first = self._first_line()
+        # Lines index at 1 in the buffer, but at 0 in the index.
+        start = max(0, start_line - 1) + first
+        if end_line is None:
+            end = first + self.line_count
+        else:
+            end = end_line - 1 + first
+        if start >= end:
+            return iter(())
+
+        # Lines past the end are found by where the first line lands rather
+        # than by counting lines, which would read through a mapped file
+        start_pos = self._clamp_accessible(lines.line_start(start))
+        if lines.line_of(start_pos) < start:
+            return iter(())
+        end_pos = self._clamp_accessible(lines.line_end(end - 1))
+        return _split_lines(self.iter_chunks(start_pos, end_pos, CHUNK_SIZE))
+
+    def iter_chunks(self, start=None, end=None, size=CHUNK_SIZE):
+        """
+        Return the text between two positions in chunks.
+
+        Only one chunk is copied out of storage at a time. Do not edit the
+        buffer while iterating. To read from another thread, pin a version.
+
+        Args:
+            start: An int representing the position to start at, or None for
+                the start of the accessible part.
+            end: An int representing the position to end at (exclusive), or
+                None for the end of the accessible part.
+            size: An int representing the number of characters in a chunk.
+
+        Returns:
+            A generator of strings, each at most size characters long.
+        """
+        start = self.point_min if start is None else self._normalize_pos(start)
+        end = self.point_max if end is None else self._normalize_pos(end)
+        return _iter_slices(self._shared.storage, start, end, size)
+
+    def narrow(self, start, end):
+        """
+        Restrict the buffer to the text between two positions.
+
+        Nothing is copied. Point, mark, and every command stay within the
+        restriction, and lines count from its start, until the buffer is
+        widened. Text inserted at the end of the restriction goes inside it.
+
+        Args:
+            start: An int representing where the accessible part starts.
+            end: An int representing where the accessible part ends.
+        """
+        self.widen()
+        start, end = sorted((start, end))
+        self._restriction = (self.make_marker(start),
+                             self.make_marker(end, advance=True))
+
+        self.set_point(self.point)
+        self.set_mark(self.mark)
+        self._display_line = 1
+
+    def widen(self):
+        """
+        Remove any restriction, making the whole buffer accessible.
         """
-        text = self.text
-        return text.count("\n") + 1
+        if self._restriction is None:
+            return
+        # Keep the same text at the top of the view
+        self._display_line += self._first_line()
+        for marker in self._restriction:
+            self.delete_marker(marker)
+        self._restriction = None
 
     @property
     def modeline(self):
@@ -189,6 +634,8 @@ class Buffer:
         major_mode_name = major_mode.name
 
         right = f"{major_mode_name}"
+        if self.narrowed:
+            right += " Narrow"
 
         return (left, right)
 
@@ -198,15 +645,208 @@ class Buffer:
         """
         Normalize a point to ensure it lies in the range of the buffer.
 
-        The range of the buffer is from 0 to the length of the text.
+        The range of the buffer is from point_min to point_max, which is all
+        of the text unless the buffer is narrowed.
 
         Args:
             pos: An int representing a point in the buffer.
 
         Returns:
-            An int between 0 and the length of the text in the buffer.
+            An int between point_min and point_max.
+        """
+        return self._clamp_accessible(pos)
+
+    def substring(self, start, end):
+        """
+        Return the text between two positions in the buffer.
+
+        Only the requested text is copied out of storage.
+
+        Args:
+            start: An int representing the position to start at.
+            end: An int representing the position to end at (exclusive).
+
+        Returns:
+            A string representing the text between start and end.
+        """
+        return self._shared.storage.slice(start, end)
+
+    def snapshot(self):
+        """
+        Return a frozen copy of the buffer as it is now.
+
+        The copy shares the structure of the storage, which copies what it
+        needs to on the next edit, so taking a snapshot is O(1). Edits to the
+        buffer afterwards never show up in it, so it can be handed to a
+        background thread to save, search, or read from.
+
+        Returns:
+            A BufferSnapshot.
+        """
+        return BufferSnapshot(self._shared.storage.snapshot(), self.point,
+                              self.mark, self.name)
+
+    def pin_version(self):
+        """
+        Pin a version of the buffer as it is now, for reading from another
+        thread.
+
+        Unlike snapshot, this may be called from any thread while the main
+        loop keeps editing. Edits never wait for the reader: they publish a
+        new version and leave the pinned one as it was. Readers pinning the
+        same version share it, and it is freed once they all release it.
+
+            with buff.pin_version() as version:
+                search(version.text)
+
+        Returns:
+            A PinnedVersion. Release it when done reading.
+        """
+        shared = self._shared
+        with shared.versions.lock:
+            version, storage = shared.versions.pin(shared.storage,
+                                                   shared.tick)
+            return PinnedVersion(shared.versions, version, storage,
+                                 self.point, self.mark, self.name)
+
+    def _set_storage(self, storage):
+        """
+        Replace the storage holding the buffer text.
+
+        Rebuilds the line index for the new text. Indirect buffers see the new
+        text too. Counts as a change of the whole text.
+
+        Args:
+            storage: A TextStorage instance holding the new text.
+        """
+        shared = self._shared
+        # The lengths are only worked out for hooks, since a mapped file has
+        # to be read through to know its length
+        change = None
+        if shared.before_change or shared.after_change:
+            change = (0, len(shared.storage), len(storage))
+        for function in shared.before_change:
+            function(*change)
+        with shared.versions.lock:
+            shared.set_storage(storage)
+            shared.tick += 1
+        for function in shared.after_change:
+            function(*change)
+
+    def _replace_text(self, edits):
+        """
+        Replace spans of text in storage.
+
+        Every editing method goes through this, so this is the one place the
+        storage, the line index, the markers, and the bookkeeping about the
+        file are kept in step. Point and mark are markers, so they move with
+        the text like any other.
+
+        Change hooks are called once around the whole call, with the span
+        covering every edit.
+
+        Args:
+            edits: A list of (start, end, text) tuples, sorted by position and
+                not overlapping. Positions are those before any of the edits.
+
+        Returns:
+            A list of strings representing the text each edit replaced.
+        """
+        shared = self._shared
+        change = _change_span(edits)
+        if change is not None:
+            for function in shared.before_change:
+                function(*change)
+
+        # Readers pinning a version wait for the edit to be done, so they
+        # never see text and tick out of step
+        with shared.versions.lock:
+            deleted = shared.storage.replace_many(edits)
+
+            # Back to front, like the storage, so positions stay valid
+            lines = shared.lines
+            for start, end, text in reversed(edits):
+                if start < end:
+                    lines.delete(start, end)
+                if text:
+                    lines.insert(start, text)
+            if shared.markers:
+                shared.markers.adjust(edits)
+            for tree in (shared.properties, shared.overlays):
+                if tree:
+                    for start, end, text in reversed(edits):
+                        tree.replace(start, end, len(text))
+            if change is not None:
+                shared.tick += 1
+
+        self._shared.modified = True
+        for start, end, text in edits:
+            if start < end or text:
+                self._note_unsaved(start)
+                break
+
+        # Nobody can undo in a read only buffer, so do not keep a log for it
+        if not self._read_only:
+            self._record_undo(edits, deleted)
+
+        if change is not None:
+            for function in shared.after_change:
+                function(*change)
+        return deleted
+
+    def _record_undo(self, edits, deleted):
+        """
+        Log edits to the undo log.
+
+        The log replays edits one after another, so each is logged at its
+        position after the edits before it.
+
+        Args:
+            edits: A sorted list of (start, end, text) tuples, as given to
+                _replace_text.
+            deleted: A list of strings representing the text each edit
+                replaced.
+        """
+        log = self._shared.undo_log
+        offset = 0
+        for (start, _, text), old in zip(edits, deleted):
+            if old or text:
+                log.record(start + offset, old, text)
+            offset += len(text) - len(old)
+
+    def _insert_text(self, pos, text):
+        """
+        Insert text into storage at a position.
+
+        Args:
+            pos: An int representing where to insert the text.
+            text: A string to insert.
+        """
+        self._replace_text([(pos, pos, text)])
+
+    def _delete_text(self, start, end):
+        """
+        Delete text from storage between two positions.
+
+        Args:
+            start: An int representing where to start deleting.
+            end: An int representing where to stop deleting (exclusive).
+
+        Returns:
+            A string representing the deleted text.
         """
-        return max(0, min(pos, len(self.text)))
+        return self._replace_text([(start, end, "")])[0]
+
+    def _note_unsaved(self, pos):
+        """
+        Record that the text at or after a position differs from the file.
+
+        Args:
+            pos: An int representing where an edit happened.
+        """
+        unsaved_start = self._shared.unsaved_start
+        if unsaved_start is None or pos < unsaved_start:
+            self._shared.unsaved_start = pos
 
     # Disk operations
     def revert(self):
@@ -215,45 +855,147 @@ class Buffer:
 
         Updates modified state to False.
 
+        Read only buffers memory map the file rather than reading it, so they
+        open in constant time no matter how big the file is.
+
         If the file does not exist, print error to *messages* buffer.
 
         Returns:
             A bool representing whether or not the revert was successful.
         """
         path = self.path
-        with open(path, "r") as disk_file:
-            self._text = disk_file.read()
+        if self.read_only:
+            self._set_storage(MmapStorage(path))
+        else:
+            storage_class = self._shared.storage_class
+            # Huge files are always held in a rope
+            if os.path.getsize(path) > ROPE_THRESHOLD:
+                storage_class = Rope
 
+            self._set_storage(storage_class.from_file(path))
+            # Mapped text is never appended to, so only this needs it
+            self._shared.saved_length = len(self._shared.storage)
+
+        # The buffer now matches the file
+        self._shared.disk_state = file_state(path)
+
+        self.widen()
         self._point = 0
         self._mark = 0
-        self._modified = False
+        self._shared.modified = False
 
     def save_buffer(self):
         """
         Save modified buffer to associated path.
 
-        Updates modified state to False.
-        """
-        path = self.path
-        with open(path, "w") as disk_file:
-            disk_file.write(self.text)
+        The save runs on a background thread from a snapshot of the text, and
+        replaces the file atomically.
+
+        If the buffer has only been added to at the end since it was last saved
+        or reverted, and the file has not changed on disk since then, only the
+        new text is appended to the file.
 
-        self._modified = False
+        Updates modified state to False. If the save fails, the buffer is
+        marked modified again when the failure is published, the next time
+        modified is read or a save is started.
+
+        Returns:
+            A Future whose result is the number of bytes written, or which
+            raises the error that stopped the save.
+        """
+        return self._save(self.path)
 
     def write_file(self, path):
         """
         Update associated path and write buffer to new associated path.
 
+        Saves in the background, like save_buffer.
+
         Updates modified state to False.
-        """
-        with open(path, "w") as disk_file:
-            disk_file.write(self.text)
 
+        Returns:
+            A Future whose result is the number of bytes written.
+        """
         self._path = path
-        self._modified = False
         # TODO: Update buffer name to the file name. I should look
         # into path handling in python so I don't end up hardcoding
         # with unix forward slashes.
+        return self._save(path)
+
+    def _save(self, path):
+        """
+        Start a background save of the buffer text to path.
+
+        Args:
+            path: A string representing the file to save to.
+
+        Returns:
+            A Future whose result is the number of bytes written.
+        """
+        shared = self._shared
+        self._publish_saves()
+
+        # Edits made while the save runs do not show up in the snapshot
+        snapshot = self.snapshot()
+
+        # Appending is possible if every edit since the last save happened
+        # past the end of the text that was saved.
+        append_from = None
+        saved_length = shared.saved_length
+        if (saved_length is not None and shared.unsaved_start is not None
+                and shared.unsaved_start >= saved_length):
+            append_from = saved_length
+
+        # What the file should hold before this save: as of the last save
+        # published, or of the save still running before this one. The save
+        # only touches outcome, the rest is published from this thread.
+        disk_state = shared.disk_state
+        previous = shared.pending_saves[-1][1] if shared.pending_saves \
+            else None
+        outcome = {}
+
+        def save():
+            # Runs after any earlier save has finished
+            expected = disk_state if previous is None \
+                else previous.get("disk_state")
+            if (append_from is not None and expected is not None
+                    and file_state(path) == expected):
+                written = append_to_file(
+                    path, snapshot.iter_chunks(append_from))
+            else:
+                written = write_atomic(path, snapshot.iter_chunks())
+            outcome["disk_state"] = file_state(path)
+            return written
+
+        future = save_in_background(save, previous=shared.save_future)
+        shared.save_generation += 1
+        shared.pending_saves.append((future, outcome,
+                                     shared.save_generation))
+        shared.save_future = future
+        shared.saved_length = snapshot.length
+        shared.unsaved_start = None
+        shared.modified = False
+        return future
+
+    def _publish_saves(self):
+        """
+        Record the results of the saves that have finished, in order.
+
+        Saves run on other threads, but only this method, run from the thread
+        editing the buffer, changes the state of the buffer after them. A save
+        that failed leaves the file unknown, and the buffer modified unless a
+        later save was started.
+        """
+        shared = self._shared
+        pending = shared.pending_saves
+        while pending and pending[0][0].done():
+            future, outcome, generation = pending.pop(0)
+            if not future.cancelled() and future.exception() is None:
+                shared.disk_state = outcome["disk_state"]
+                continue
+            shared.disk_state = None
+            if generation == shared.save_generation:
+                shared.modified = True
 
     # Movement
 
@@ -265,7 +1007,7 @@ class Buffer:
            pos: An int representing where in the buffer to set point.
         """
         pos = self._normalize_pos(pos)
-        self._point = pos
+        self._shared.markers.move(self._point_marker, pos)
 
     def set_mark(self, pos):
         """
@@ -275,34 +1017,250 @@ class Buffer:
             pos: An int representing where in the buffer to set mark.
         """
         pos = self._normalize_pos(pos)
-        self._mark = pos
+        self._shared.markers.move(self._mark_marker, pos)
 
-    def scroll_buffer(self, lines):
+    # Markers
+
+    def make_marker(self, pos=None, advance=False):
         """
-        Scroll buffer by N lines.
+        Make a marker that keeps track of a position as the buffer is edited.
 
-        Ensures that it will always be bound between 1 and the total number of
-        lines.
+        Args:
+            pos: An int representing where to put the marker. Defaults to
+                point.
+            advance: A bool representing whether the marker advances past
+                text inserted right at it. If False, it stays before the text.
+
+        Returns:
+            A Marker.
+        """
+        if pos is None:
+            pos = self.point
+        # Markers may sit anywhere in the text, even outside a restriction
+        marker = Marker(self, max(0, min(pos, self.length)), advance)
+        self._shared.markers.add(marker)
+        return marker
+
+    def set_marker(self, marker, pos):
+        """
+        Move a marker of this buffer to another position.
 
         Args:
-            lines: An int representing the number of lines to scroll buffer.
-                Can be negative.
+            marker: A Marker made by make_marker.
+            pos: An int representing where in the buffer to move the marker.
         """
-        current_line = self.display_line
-        total_lines = self.line_count
+        self._shared.markers.move(marker, max(0, min(pos, self.length)))
 
-        self._display_line = max(1, min(total_lines, current_line + lines))
+    def delete_marker(self, marker):
+        """
+        Stop keeping track of a marker.
 
-    # Base editing operations. These all return values because that will
-    # be useful for say, pushing to the kill ring.
+        Markers cost a little on every edit after them, so delete them when
+        they are no longer needed. The position of a deleted marker is None.
 
-    def insert(self, *args):
+        Args:
+            marker: A Marker made by make_marker.
         """
-        Insert args at point in buffer.
+        self._shared.markers.delete(marker)
 
-        Updates state of _text, _point, and _mark attributes.
+    # Text properties and overlays
 
-        Does nothing if buffer is read only.
+    def put_text_property(self, start, end, name, value):
+        """
+        Set a property of the text between two positions.
+
+        The property moves with the text. Text inserted inside the span gets
+        the property too, but text inserted at either end does not.
+
+        Args:
+            start: An int representing where to start setting the property.
+            end: An int representing where to stop (exclusive).
+            name: A string representing the name of the property.
+            value: The value of the property.
+        """
+        start, end = sorted((self._normalize_pos(start),
+                             self._normalize_pos(end)))
+        self._cut_text_property(start, end, name)
+        if start < end:
+            interval = Interval({name: value}, front_advance=True,
+                                evaporate=True)
+            self._shared.properties.add(interval, start, end)
+
+    def remove_text_property(self, start, end, name):
+        """
+        Remove a property from the text between two positions.
+
+        Args:
+            start: An int representing where to start removing the property.
+            end: An int representing where to stop (exclusive).
+            name: A string representing the name of the property.
+        """
+        start, end = sorted((self._normalize_pos(start),
+                             self._normalize_pos(end)))
+        self._cut_text_property(start, end, name)
+
+    def _cut_text_property(self, start, end, name):
+        """
+        Take a property off the text between two positions, keeping it on the
+        text around them.
+        """
+        properties = self._shared.properties
+        for interval, left, right in properties.overlapping(start, end):
+            if name not in interval.properties:
+                continue
+            properties.remove(interval)
+            for piece_start, piece_end in ((left, start), (end, right)):
+                if piece_start < piece_end:
+                    piece = Interval(dict(interval.properties),
+                                     front_advance=True, evaporate=True)
+                    properties.add(piece, piece_start, piece_end)
+
+    def get_text_property(self, pos, name):
+        """
+        Return a property of the character at a position.
+
+        Args:
+            pos: An int representing a position in the buffer.
+            name: A string representing the name of the property.
+
+        Returns:
+            The value of the property, or None if it is not set.
+        """
+        return self.text_properties_at(pos).get(name)
+
+    def text_properties_at(self, pos):
+        """
+        Return the properties of the character at a position.
+
+        Args:
+            pos: An int representing a position in the buffer.
+
+        Returns:
+            A dict of property names to values.
+        """
+        properties = {}
+        for interval, _, _ in self._shared.properties.at(pos):
+            properties.update(interval.properties)
+        return properties
+
+    def make_overlay(self, start, end, front_advance=False,
+                     rear_advance=False):
+        """
+        Make an overlay on the text between two positions.
+
+        An overlay is a span of text with properties of its own, like a face
+        to draw the text in. Overlays move with the text, but unlike text
+        properties, they belong to the buffer rather than the text, and stay
+        around when the text they cover is deleted.
+
+        Args:
+            start: An int representing where the overlay starts.
+            end: An int representing where the overlay ends (exclusive).
+            front_advance: A bool representing whether text inserted at the
+                start goes before the overlay (True) or inside it (False).
+            rear_advance: A bool representing whether text inserted at the end
+                goes inside the overlay (True) or after it (False).
+
+        Returns:
+            An Interval. Set its properties through its properties dict.
+        """
+        overlay = Interval(front_advance=front_advance,
+                           rear_advance=rear_advance, owner=self)
+        self._shared.overlays.add(overlay, self._normalize_pos(start),
+                                  self._normalize_pos(end))
+        return overlay
+
+    def move_overlay(self, overlay, start, end):
+        """
+        Move an overlay of this buffer to cover other text.
+
+        Args:
+            overlay: An Interval made by make_overlay.
+            start: An int representing where the overlay starts.
+            end: An int representing where the overlay ends (exclusive).
+        """
+        self._shared.overlays.move(overlay, self._normalize_pos(start),
+                                   self._normalize_pos(end))
+
+    def delete_overlay(self, overlay):
+        """
+        Remove an overlay. Its start and end become None.
+
+        Args:
+            overlay: An Interval made by make_overlay.
+        """
+        self._shared.overlays.remove(overlay)
+
+    def overlays_in(self, start, end):
+        """
+        Return the overlays of this buffer overlapping two positions.
+
+        Args:
+            start: An int representing where to start looking.
+            end: An int representing where to stop looking (exclusive).
+
+        Returns:
+            A list of Intervals, in order of start.
+        """
+        return [overlay for overlay, _, _
+                in self._shared.overlays.overlapping(start, end)
+                if overlay.owner is self]
+
+    def properties_in(self, start, end):
+        """
+        Return the spans of text properties and overlays between two positions.
+
+        Only the intervals overlapping the range are looked at, so this is
+        cheap however many there are elsewhere in the text.
+
+        Args:
+            start: An int representing where to start looking.
+            end: An int representing where to stop looking (exclusive).
+
+        Returns:
+            A list of (start, end, properties) tuples, clipped to the range.
+            Text properties come first, then overlays, so a property set by an
+            overlay wins over the same property of the text.
+        """
+        spans = []
+        shared = self._shared
+        for tree in (shared.properties, shared.overlays):
+            for interval, left, right in tree.overlapping(start, end):
+                if tree is shared.overlays and interval.owner is not self:
+                    continue
+                if left < right:
+                    spans.append((max(left, start), min(right, end),
+                                  interval.properties))
+        return spans
+
+    def scroll_buffer(self, lines):
+        """
+        Scroll buffer by N lines.
+
+        Ensures that it will always be bound between 1 and the total number of
+        lines.
+
+        Args:
+            lines: An int representing the number of lines to scroll buffer.
+                Can be negative.
+        """
+        current_line = self.display_line
+        total_lines = self.line_count
+
+        self._display_line = max(1, min(total_lines, current_line + lines))
+
+    # Base editing operations. These all return values because that will
+    # be useful for say, pushing to the kill ring.
+
+    def insert(self, *args):
+        """
+        Insert args at point in buffer.
+
+        Edits the storage of the shared text, which moves the point and mark
+        markers along with every other marker, and records the edit for
+        undo.
+
+        Does nothing if buffer is read only.
 
         Args:
             args: A tuple of strings to insert.
@@ -314,20 +1272,10 @@ class Buffer:
         if self.read_only:
             return False
 
-        point = self.point
-        mark = self.mark
-
         insert_text = "".join(args)
-        insert_len = len(insert_text)
-
-        # The side effects
-        self._text = self.text[:point] + insert_text + self.text[point:]
-        self._point = point + insert_len
-
-        if mark > point:
-            self._mark = mark + insert_len
 
-        self._modified = True
+        # The side effects. Point advances past the text, mark stays before it.
+        self._insert_text(self.point, insert_text)
 
         # Return inserted text
         return insert_text
@@ -336,7 +1284,9 @@ class Buffer:
         """
         Delete characters from buffer at point.
 
-        Updates state of _text, _point, and _mark attributes.
+        Edits the storage of the shared text, which moves the point and mark
+        markers along with every other marker, and records the edit for
+        undo.
 
         Does nothing if buffer is read only.
 
@@ -357,26 +1307,9 @@ class Buffer:
         start = min(points)
         end = max(points)
 
-        # Info about what we are deleting
-        deleted_text = self.text[start:end]
-        deleted_len = len(deleted_text)
-
-        # The side effects
-        self._text = self.text[:start] + self.text[end:]
-
-        # If deleting text before point, move point backwards
-        if chars < 0:
-            self._point = start
-
-        # Handle the mark, move as would be expected
-        mark = self.mark
-
-        if start <= mark <= end:
-            self._mark = start
-        elif mark > end:
-            self._mark = mark - deleted_len
-
-        self._modified = True
+        # The side effects. Point and mark in the deleted text move to its
+        # start, after it they move back.
+        deleted_text = self._delete_text(start, end)
 
         # Return deleted text
         return deleted_text
@@ -385,7 +1318,9 @@ class Buffer:
         """
         Delete text in region defined by point and mark.
 
-        Updates state of _text, _point, and _mark attributes.
+        Edits the storage of the shared text, which moves the point and mark
+        markers along with every other marker, and records the edit for
+        undo.
 
         Does nothing if buffer is read only.
 
@@ -396,17 +1331,12 @@ class Buffer:
         if self.read_only:
             return False
 
-        start = min(self.point, self.mark)
-        end = max(self.point, self.mark)
-
-        deleted_text = self.text[start:end]
-
-        # Side effects
-        self._text = self.text[:start] + self.text[end:]
-        self._point = start
-        self._mark = start
+        # Mark may have been left outside a restriction
+        start = self._normalize_pos(min(self.point, self.mark))
+        end = self._normalize_pos(max(self.point, self.mark))
 
-        self._modified = True
+        # Side effects. Point and mark both end up at start.
+        deleted_text = self._delete_text(start, end)
 
         # Handle the return
         return deleted_text
@@ -424,6 +1354,487 @@ class Buffer:
             A string representing the text appended to the buffer. False if
             buffer is read only.
         """
-        self._modified = True
-        self._text = self._text + text
+        # Point would advance past text appended right at it
+        point = self.point
+        self._insert_text(len(self._shared.storage), text)
+        self._point = point
         return text
+
+    def trim_lines(self, max_lines):
+        """
+        Delete the oldest lines so that at most max_lines are left.
+
+        Only lines ending with a newline count. Like append, works in read
+        only buffers. With a RingStorage, this costs O(1) per line deleted.
+
+        Args:
+            max_lines: An int representing the number of lines to keep.
+
+        Returns:
+            A string representing the text deleted.
+        """
+        lines = self._shared.lines
+        excess = lines.line_count - 1 - max_lines
+        if excess <= 0:
+            return ""
+        return self._delete_text(0, lines.line_start(excess))
+
+    def undo(self):
+        """
+        Undo the last group of edits.
+
+        Point is left at the end of the text the undo put back.
+
+        Does nothing if buffer is read only.
+
+        Returns:
+            A bool representing whether anything was undone.
+        """
+        if self.read_only:
+            return False
+        span = self._shared.undo_log.undo(self._replace_for_undo)
+        if span is None:
+            return False
+        self.set_point(span[1])
+        return True
+
+    def redo(self):
+        """
+        Redo the last group of edits undone.
+
+        Any edit made after an undo, other than another undo or redo, makes
+        what was undone impossible to redo.
+
+        Does nothing if buffer is read only.
+
+        Returns:
+            A bool representing whether anything was redone.
+        """
+        if self.read_only:
+            return False
+        span = self._shared.undo_log.redo(self._replace_for_undo)
+        if span is None:
+            return False
+        self.set_point(span[1])
+        return True
+
+    def _replace_for_undo(self, start, end, text):
+        """
+        Replace the text between start and end with text, for the undo log.
+
+        The log's positions are in the whole text, so they are not clamped to
+        any restriction.
+        """
+        self._replace_text([(start, end, text)])
+
+    def undo_boundary(self):
+        """
+        End the current undo group, so one undo stops here.
+
+        The controller calls this after every command.
+        """
+        self._shared.undo_log.boundary()
+
+    def undo_amalgamate(self):
+        """
+        Mark the current command as typing a character.
+
+        Characters typed one after another are undone together, up to
+        undo.COALESCE_LIMIT of them.
+        """
+        self._shared.undo_log.amalgamate()
+
+    def apply_edits(self, edits):
+        """
+        Apply many inserts and deletes in one go.
+
+        Every edit is given in terms of the text as it was before any of them,
+        so callers never have to work out how one edit shifts the next. The
+        storage and line index see all of them in one pass, and point and mark
+        are moved once at the end. Inserting N strings this way costs about as
+        much as inserting one.
+
+        Point moves past text inserted where it stands, like insert. Mark
+        stays put. Inside a replaced span, both move to its start (point then
+        moves past any text inserted there).
+
+        Does nothing if buffer is read only.
+
+        Args:
+            edits: An iterable of (start, end, text) tuples. The text between
+                start and end is replaced by text, so (pos, pos, text) is an
+                insert and (start, end, "") is a delete. Several inserts at the
+                same position are inserted in the order given. Spans must not
+                overlap.
+
+        Returns:
+            A list of strings representing the text each edit replaced, in
+            order of position. False if buffer is read only.
+
+        Raises:
+            ValueError: If two edits overlap.
+        """
+        if self.read_only:
+            return False
+
+        edits = self._normalize_edits(edits)
+        if not edits:
+            return []
+        return self._replace_text(edits)
+
+    def _normalize_edits(self, edits):
+        """
+        Clamp, sort, and merge a list of edits for apply_edits.
+
+        Args:
+            edits: An iterable of (start, end, text) tuples.
+
+        Returns:
+            A sorted list of (start, end, text) tuples that do not overlap.
+            Inserts at the same position are merged into one.
+
+        Raises:
+            ValueError: If two edits overlap.
+        """
+        normalized = []
+        for start, end, text in edits:
+            start = self._normalize_pos(start)
+            end = self._normalize_pos(end)
+            if start > end:
+                start, end = end, start
+            if start < end or text:
+                normalized.append((start, end, text))
+
+        # Sorting is stable, so inserts at the same spot keep their order.
+        normalized.sort(key=lambda edit: (edit[0], edit[1]))
+
+        merged = []
+        for start, end, text in normalized:
+            if merged:
+                last_start, last_end, last_text = merged[-1]
+                if start < last_end:
+                    raise ValueError("Edits overlap at "
+                                     f"{start}-{end} and "
+                                     f"{last_start}-{last_end}")
+                if start == end == last_start == last_end:
+                    merged[-1] = (start, end, last_text + text)
+                    continue
+            merged.append((start, end, text))
+        return merged
+
+    @contextmanager
+    def transaction(self):
+        """
+        Collect edits and apply them all at once when the block ends.
+
+        Use as:
+
+            with buff.transaction() as edits:
+                edits.insert(pos, "text")
+                edits.delete(start, end)
+
+        Positions are those of the text before the transaction started. If the
+        block raises, none of the edits are applied.
+
+        Yields:
+            A Transaction to record edits in.
+        """
+        transaction = Transaction()
+        yield transaction
+        self.apply_edits(transaction.edits)
+
+
+def _change_span(edits):
+    """
+    Return the span of text a list of edits changes, for change hooks.
+
+    Args:
+        edits: A sorted list of (start, end, text) tuples that do not overlap.
+
+    Returns:
+        A tuple (start, old_end, new_end) covering every edit, or None if the
+        edits change nothing.
+    """
+    growth = 0
+    changed = False
+    for start, end, text in edits:
+        if start < end or text:
+            changed = True
+        growth += len(text) - (end - start)
+    if not changed:
+        return None
+    old_end = edits[-1][1]
+    return (edits[0][0], old_end, old_end + growth)
+
+
+def _iter_slices(storage, start, end, size):
+    """
+    Return the text of storage between two positions in chunks.
+
+    Args:
+        storage: A TextStorage to read from.
+        start: An int representing the position to start at.
+        end: An int representing the position to end at (exclusive).
+        size: An int representing the number of characters in a chunk.
+
+    Returns:
+        A generator of strings, each at most size characters long.
+    """
+    for chunk_start in range(start, end, size):
+        yield storage.slice(chunk_start, min(chunk_start + size, end))
+
+
+def _split_lines(chunks):
+    """
+    Split chunks of text into lines.
+
+    A line split across chunks is joined once, when its end is reached, so a
+    long line costs no more than a short one per character.
+
+    Args:
+        chunks: An iterable of strings.
+
+    Returns:
+        A generator of strings representing the lines, without their
+        newlines. There is always one more line than there are newlines.
+    """
+    partial = []
+    for chunk in chunks:
+        if "\n" not in chunk:
+            partial.append(chunk)
+            continue
+        pieces = chunk.split("\n")
+        partial.append(pieces[0])
+        yield "".join(partial)
+        yield from pieces[1:-1]
+        partial = [pieces[-1]]
+    yield "".join(partial)
+
+
+class BufferSnapshot:
+    """
+    A frozen copy of a buffer at one moment, made by Buffer.snapshot.
+
+    Attributes:
+        _storage: A TextStorage holding the text. It is never edited.
+        _lines: A line index for the text, built the first time a line is
+            asked for, or None.
+        _point: An int representing the position of point.
+        _mark: An int representing the position of mark.
+        _name: A string representing the name of the buffer.
+    """
+
+    def __init__(self, storage, point, mark, name):
+        """
+        Initialize snapshot.
+
+        Args:
+            storage: A TextStorage holding the text, which is never edited.
+            point: An int representing the position of point.
+            mark: An int representing the position of mark.
+            name: A string representing the name of the buffer.
+        """
+        self._storage = storage
+        self._lines = None
+        self._point = point
+        self._mark = mark
+        self._name = name
+
+    @property
+    def text(self):
+        """
+        Return text of the snapshot.
+        """
+        return self._storage.text
+
+    @property
+    def length(self):
+        """
+        Return the number of characters in the snapshot.
+        """
+        return len(self._storage)
+
+    @property
+    def point(self):
+        """
+        Return position of point when the snapshot was taken.
+        """
+        return self._point
+
+    @property
+    def mark(self):
+        """
+        Return position of mark when the snapshot was taken.
+        """
+        return self._mark
+
+    @property
+    def name(self):
+        """
+        Return name of the buffer the snapshot was taken of.
+        """
+        return self._name
+
+    def substring(self, start, end):
+        """
+        Return the text between two positions.
+        """
+        return self._storage.slice(start, end)
+
+    def iter_chunks(self, start=0, end=None, size=CHUNK_SIZE):
+        """
+        Return the text between two positions in chunks, like
+        Buffer.iter_chunks.
+
+        Args:
+            start: An int representing the position to start at.
+            end: An int representing the position to end at (exclusive), or
+                None for the end of the text.
+            size: An int representing the number of characters in a chunk.
+
+        Returns:
+            A generator of strings, each at most size characters long.
+        """
+        if end is None:
+            end = self.length
+        return _iter_slices(self._storage, start, end, size)
+
+    def _line_index(self):
+        """
+        Return the line index of the snapshot, building it if needed.
+        """
+        if self._lines is None:
+            self._lines = self._storage.line_index()
+        return self._lines
+
+    @property
+    def line_count(self):
+        """
+        Return the number of lines in the snapshot.
+        """
+        return self._line_index().line_count
+
+    def lines(self, start, end):
+        """
+        Return the text of a range of lines, like Buffer.lines.
+
+        Args:
+            start: An int representing the first line to return. Line numbers
+                index at 1.
+            end: An int representing the line to stop at (exclusive).
+
+        Returns:
+            A list of strings representing the lines, without their newlines.
+        """
+        return list(self.iter_lines(start, end))
+
+    def iter_lines(self, start_line=1, end_line=None):
+        """
+        Return the text of a range of lines, one line at a time, like
+        Buffer.iter_lines.
+
+        Args:
+            start_line: An int representing the first line to return. Line
+                numbers index at 1.
+            end_line: An int representing the line to stop at (exclusive), or
+                None to read to the end.
+
+        Returns:
+            A generator of strings representing the lines, without their
+            newlines.
+        """
+        lines = self._line_index()
+        start = max(0, start_line - 1)
+        end = lines.line_count
+        if end_line is not None:
+            end = min(end, end_line - 1)
+        if start >= end:
+            return iter(())
+        return _split_lines(self.iter_chunks(lines.line_start(start),
+                                             lines.line_end(end - 1),
+                                             CHUNK_SIZE))
+
+
+# pylint: disable=R0903
+class PinnedVersion(BufferSnapshot):
+    """
+    A version of a buffer pinned by a reader, made by Buffer.pin_version.
+
+    Reads like a BufferSnapshot until released. Can be used as a context
+    manager, which releases it on exit.
+
+    Attributes:
+        tick: An int representing the modification tick of the version.
+        _table: The VersionTable the version is pinned in.
+        _version: The pinned version, or None once released.
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, table, version, storage, point, mark, name):
+        """
+        Initialize pinned version.
+
+        Args:
+            table: The VersionTable the version is pinned in.
+            version: The pinned version.
+            storage: A TextStorage holding the text of the version.
+            point: An int representing the position of point.
+            mark: An int representing the position of mark.
+            name: A string representing the name of the buffer.
+        """
+        super().__init__(storage, point, mark, name)
+        self.tick = version.tick
+        self._table = table
+        self._version = version
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def release(self):
+        """
+        Unpin the version. Reading it afterwards is an error.
+
+        Releasing more than once does nothing.
+        """
+        if self._version is not None:
+            self._table.release(self._version)
+            self._version = None
+            self._storage = None
+            self._lines = None
+
+
+class Transaction:
+    """
+    A list of edits waiting to be applied to a buffer.
+
+    Attributes:
+        edits: A list of (start, end, text) tuples recorded so far.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty transaction.
+        """
+        self.edits = []
+
+    def insert(self, pos, text):
+        """
+        Record an insert of text at pos.
+        """
+        self.edits.append((pos, pos, text))
+
+    def delete(self, start, end):
+        """
+        Record a delete of the text between start and end.
+        """
+        self.edits.append((start, end, ""))
+
+    def replace(self, start, end, text):
+        """
+        Record replacing the text between start and end with text.
+        """
+        self.edits.append((start, end, text))
+
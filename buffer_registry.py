@@ -0,0 +1,197 @@
+"""
+Registry of the buffers of an Ihmacs session.
+
+Buffers are found by name far more often than they are created or killed: every
+message looks up *messages*, for one. The registry keeps a dict from name to
+buffer, so lookups are O(1) however many buffers are open.
+
+It also keeps the buffers in most recently used order, as a circular doubly
+linked list threaded through two dicts. Selecting a buffer moves it to the
+front, and stepping to the next or previous buffer follows a link, all in O(1).
+
+Names are unique. A name already in use gets a suffix, like Emacs does: the
+second *scratch* is *scratch*<2>.
+"""
+
+
+class BufferRegistry:
+    """
+    The buffers of a session, by name and in most recently used order.
+
+    Attributes:
+        _by_name: A dict mapping names to buffers. Iterates in the order the
+            buffers were added.
+        _newer: A dict mapping every buffer to the buffer used next more
+            recently, wrapping around from the most recent to the least.
+        _older: A dict mapping every buffer to the buffer used next less
+            recently, wrapping around from the least recent to the most.
+        _most_recent: The most recently used buffer, or None if there are no
+            buffers.
+        _suffixes: A dict mapping names to the next suffix to try when making
+            a unique name from them.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty registry.
+        """
+        self._by_name = {}
+        self._newer = {}
+        self._older = {}
+        self._most_recent = None
+        self._suffixes = {}
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __iter__(self):
+        """
+        Iterate over the buffers in the order they were added.
+        """
+        return iter(list(self._by_name.values()))
+
+    def __contains__(self, buff):
+        return self._by_name.get(buff.name) is buff
+
+    def get(self, name):
+        """
+        Return the buffer with a name.
+
+        Args:
+            name: A string representing a buffer name.
+
+        Returns:
+            The buffer with the name, or None if there is none.
+        """
+        return self._by_name.get(name)
+
+    def unique_name(self, name):
+        """
+        Return a name no buffer has, based on name.
+
+        Returns name itself if it is free, otherwise name<2>, name<3>, and so
+        on. Suffixes already tried are remembered, so making many buffers
+        with the same name does not try every suffix every time.
+
+        Args:
+            name: A string representing the name wanted.
+
+        Returns:
+            A string representing a name not in use.
+        """
+        if name not in self._by_name:
+            return name
+        suffix = self._suffixes.get(name, 2)
+        while f"{name}<{suffix}>" in self._by_name:
+            suffix += 1
+        self._suffixes[name] = suffix + 1
+        return f"{name}<{suffix}>"
+
+    def add(self, buff):
+        """
+        Add a buffer as the least recently used.
+
+        Args:
+            buff: A Buffer whose name is not in use.
+
+        Raises:
+            ValueError: If another buffer has the same name.
+        """
+        if buff.name in self._by_name:
+            raise ValueError(f"A buffer is already named {buff.name}")
+        self._by_name[buff.name] = buff
+        if self._most_recent is None:
+            self._newer[buff] = self._older[buff] = buff
+            self._most_recent = buff
+        else:
+            self._link_last(buff)
+
+    def remove(self, buff):
+        """
+        Remove a buffer.
+
+        Args:
+            buff: A Buffer in the registry.
+        """
+        del self._by_name[buff.name]
+        if self._older[buff] is buff:
+            self._most_recent = None
+        elif self._most_recent is buff:
+            self._most_recent = self._older[buff]
+        self._unlink(buff)
+        del self._newer[buff]
+        del self._older[buff]
+
+    def touch(self, buff):
+        """
+        Make a buffer the most recently used.
+
+        Args:
+            buff: A Buffer in the registry.
+        """
+        if buff is self._most_recent:
+            return
+        self._unlink(buff)
+        # Just older than the least recent is just newer than the most recent
+        self._link_last(buff)
+        self._most_recent = buff
+
+    def _link_last(self, buff):
+        """
+        Link a buffer into the list as the least recently used.
+        """
+        first = self._most_recent
+        last = self._newer[first]
+        self._older[last] = buff
+        self._newer[buff] = last
+        self._older[buff] = first
+        self._newer[first] = buff
+
+    def _unlink(self, buff):
+        """
+        Join the neighbours of a buffer, taking it out of the list.
+        """
+        newer = self._newer[buff]
+        older = self._older[buff]
+        self._older[newer] = older
+        self._newer[older] = newer
+
+    @property
+    def most_recent(self):
+        """
+        Return the most recently used buffer, or None if there are none.
+        """
+        return self._most_recent
+
+    def next(self, buff):
+        """
+        Return the buffer used next less recently than a buffer.
+
+        Wraps around from the least recently used to the most.
+
+        Args:
+            buff: A Buffer in the registry.
+        """
+        return self._older[buff]
+
+    def previous(self, buff):
+        """
+        Return the buffer used next more recently than a buffer.
+
+        Wraps around from the most recently used to the least.
+
+        Args:
+            buff: A Buffer in the registry.
+        """
+        return self._newer[buff]
+
+    def in_use_order(self):
+        """
+        Return the buffers, most recently used first.
+        """
+        order = []
+        buff = self._most_recent
+        for _ in range(len(self._by_name)):
+            order.append(buff)
+            buff = self._older[buff]
+        return order
@@ -5,6 +5,12 @@ Has facilities for reading keychords and executing the associated command.
 """
 
 import curses
+from functools import cache
+from inspect import signature
+
+
+# How many milliseconds to wait for a key before checking on background work.
+KEY_TIMEOUT = 100
 
 
 class Controller:
@@ -42,7 +48,12 @@ class Controller:
 
         This will be appended to the global keychord in a string form.
 
-        Appends the read key to the global keychord.
+        Appends the read key to the global keychord. Waits at most
+        KEY_TIMEOUT milliseconds for a key, so the editing loop can report
+        background work meanwhile.
+
+        Returns:
+            A bool representing whether a key was read.
         """
         window = self.window
         keychord = self.keychord
@@ -54,7 +65,10 @@ class Controller:
         # treated like a sticky keys version of meta. Unfortunately, it can
         # chain into itself, which would be confusing.
         key = []
+        window.timeout(KEY_TIMEOUT)
         char = window.getch()
+        if char == -1:
+            return False
         key.append(char)
 
         # If we have a meta-key combination (alt, or esc sequence).
@@ -63,7 +77,7 @@ class Controller:
             char = window.getch()
             key.append(char)
 
-        window.nodelay(False)
+        window.timeout(KEY_TIMEOUT)
 
         # Convert the raw key array into a string that's human readable and
         # consistent with the keymap dictionary.
@@ -119,18 +133,34 @@ class Controller:
 
         # Side Effects
         keychord.append(control+meta+facekey)
+        return True
 
-    def run_edit(self, func):
+    def run_edit(self, func, num=None):
         """
         Run an editing function on the active buffer.
 
-        If point moved, ensure it lies within a valid range of the view.
+        Every command is its own undo group, so an undo boundary is set after
+        it runs. If point moved, ensure it lies within a valid range of the
+        view.
 
         Args:
             func: A function to run on the buffer.
+            num: An int representing the prefix argument, or None if none was
+                typed. Passed as num to commands that take one, and ignored
+                by the rest.
         """
         ihmacs_state = self.ihmacs_state
-        func(ihmacs_state)
+        buff = ihmacs_state.active_buff()
+        if num is not None and takes_num(func):
+            func(ihmacs_state, num=num)
+        else:
+            func(ihmacs_state)
+
+        # The command may have switched buffers, end the group in both. Each
+        # buffer gets one boundary, a second would end a run of typing.
+        buff.undo_boundary()
+        if ihmacs_state.active_buff() is not buff:
+            ihmacs_state.active_buff().undo_boundary()
 
         # Ensure point lies within a valid range of the view.
         self._ensure_valid_point()
@@ -167,3 +197,19 @@ class Controller:
             buff.scroll_buffer(current_line-view_min)
         if current_line >= view_max:
             buff.scroll_buffer(current_line-view_max+1)
+
+
+@cache
+def takes_num(func):
+    """
+    Return whether a command takes a prefix argument.
+
+    Commands take one as a parameter called num. Looked up once per command.
+
+    Args:
+        func: A function representing an editing command.
+
+    Returns:
+        A bool, True if the command has a num parameter.
+    """
+    return "num" in signature(func).parameters
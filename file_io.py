@@ -0,0 +1,155 @@
+"""
+Saving buffers to disk for Ihmacs.
+
+Saves never write over a file in place. The text is streamed in chunks to a
+temporary file next to the target, synced to disk, and then renamed over the
+target. Renaming is atomic, so a crash mid-save leaves either the old file or
+the new one, never half of each.
+
+Saves run on a pool of background threads so the editor does not freeze while
+a big buffer is written out. Each save works from a snapshot of the text taken
+when the save was requested, so the buffer can keep being edited meanwhile.
+"""
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+# How many characters to encode and write at a time.
+CHUNK_SIZE = 1024 * 1024
+
+ENCODING = "utf-8"
+
+# The pool all saves run on. Its threads are not daemons, so the editor waits
+# for saves in progress to finish before exiting.
+SAVE_EXECUTOR = ThreadPoolExecutor(max_workers=4,
+                                   thread_name_prefix="ihmacs-save")
+
+
+def iter_text_chunks(text, size=CHUNK_SIZE):
+    """
+    Split a string into chunks.
+
+    Args:
+        text: A string to split.
+        size: An int representing the number of characters in a chunk.
+
+    Returns:
+        A generator of strings, each at most size characters long.
+    """
+    for start in range(0, len(text), size):
+        yield text[start:start+size]
+
+
+def write_atomic(path, chunks):
+    """
+    Write chunks of text to a file atomically.
+
+    Writes to a temporary file in the same directory, syncs it, and renames it
+    over path. If the file already exists, its permissions are kept.
+
+    Args:
+        path: A string representing the path of the file to write.
+        chunks: An iterable of strings to write, in order.
+
+    Returns:
+        An int representing the number of bytes written.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    temp_fd, temp_path = tempfile.mkstemp(prefix=f".{name}.",
+                                          suffix=".tmp",
+                                          dir=directory)
+    written = 0
+    try:
+        with os.fdopen(temp_fd, "wb") as temp_file:
+            for chunk in chunks:
+                data = chunk.encode(ENCODING)
+                temp_file.write(data)
+                written += len(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode)
+        except FileNotFoundError:
+            # New file, mkstemp's permissions are too strict for it
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return written
+
+
+def append_to_file(path, chunks):
+    """
+    Append chunks of text to the end of a file.
+
+    This is not atomic, but a crash can only lose part of the appended text.
+    The existing contents of the file are never touched.
+
+    Args:
+        path: A string representing the path of the file to append to.
+        chunks: An iterable of strings to write, in order.
+
+    Returns:
+        An int representing the number of bytes written.
+    """
+    written = 0
+    with open(path, "ab") as disk_file:
+        for chunk in chunks:
+            data = chunk.encode(ENCODING)
+            disk_file.write(data)
+            written += len(data)
+        disk_file.flush()
+        os.fsync(disk_file.fileno())
+    return written
+
+
+def file_state(path):
+    """
+    Return what a file looks like on disk.
+
+    Used to tell whether a file has changed since it was last read or written.
+
+    Args:
+        path: A string representing the path of a file.
+
+    Returns:
+        A tuple (path, size, mtime) where path is the absolute path, size is the
+        size in bytes, and mtime is the modification time in nanoseconds. None
+        if the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def save_in_background(save, previous=None):
+    """
+    Run a save on a background thread.
+
+    Args:
+        save: A function of no arguments that does the save and returns the
+            number of bytes written.
+        previous: A Future of an earlier save of the same buffer, or None. The
+            new save waits for it, so saves land on disk in order.
+
+    Returns:
+        A Future whose result is the number of bytes written.
+    """
+    def run():
+        if previous is not None:
+            # An earlier save failing does not stop this one
+            previous.exception()
+        return save()
+
+    return SAVE_EXECUTOR.submit(run)
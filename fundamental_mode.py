@@ -5,7 +5,7 @@ All major modes inherit from FundamentalMode class.
 """
 
 
-import re
+from syntax_table import SyntaxTable, WORD, OPEN, CLOSE, STRING
 
 
 class FundamentalMode:
@@ -14,19 +14,35 @@ class FundamentalMode:
 
     Contains no syntax highlighting rules, indentation rules, or keymap.
 
+    Modes that treat some characters differently make their syntax table by
+    extending the one of the mode they inherit from, for example:
+
+        _syntax_table = FundamentalMode._syntax_table.extend({"'": "\""})
+
     Attributes:
         _name: A string representing a printed name of the mode.
         _modemap: A dictionary of dictionaries representing the modemap. This
             is the keymap specific to the mode.
-        _word_delimiters: A list of regular expressions used to represent what
-            the word delimiters are for the given mode. This is a list because
-            it's easier to expand or delete for other modes.
+        _syntax_table: A SyntaxTable representing the syntax class of every
+            character for the mode. It is a class attribute, so it is built
+            once for each mode, not for each buffer.
     """
 
     _name = "Fundamental"
     _modemap = {}
-    # Words are separated by whitespace, dashes, and underscores
-    _word_delimiters = [r"\s", r"\-", r"_"]
+    # Words are separated by whitespace, dashes, and underscores. Parens and
+    # quotes have their own classes for matching, but are still part of words.
+    _syntax_table = SyntaxTable({
+        "-": ".",
+        "_": ".",
+        "(": "()",
+        ")": ")(",
+        "[": "(]",
+        "]": ")[",
+        "{": "(}",
+        "}": "){",
+        "\"": "\"",
+    }, word_classes=(WORD, OPEN, CLOSE, STRING))
 
     # Properties
     @property
@@ -43,27 +59,30 @@ class FundamentalMode:
         """
         return self._modemap
 
+    @property
+    def syntax_table(self):
+        """
+        Return the syntax table of the mode.
+        """
+        return self._syntax_table
+
     @property
     def word_delimiters(self):
         """
-        Return the word delimiters list.
+        Return the word delimiters list, from the syntax table.
         """
-        return self._word_delimiters
+        return self._syntax_table.word_delimiters
 
     @property
     def word_delimiters_regex(self):
         """
         Return the regex that finds word delimiters.
         """
-        delimiters = self.word_delimiters
-        regex_str = "[" + "".join(delimiters) + "]+"
-        return re.compile(regex_str)
+        return self._syntax_table.word_delimiters_regex
 
     @property
     def word_regex(self):
         """
         Return the regex that finds words.
         """
-        delimiters = self.word_delimiters
-        regex_str = "[^" + "".join(delimiters) + "]+"
-        return re.compile(regex_str)
+        return self._syntax_table.word_regex
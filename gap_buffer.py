@@ -0,0 +1,197 @@
+"""
+Gap buffer text storage for Ihmacs buffers.
+
+A gap buffer keeps the text in one array with a hole (the gap) in it. The gap
+sits wherever the last edit happened. Inserting at the gap fills it in, and
+deleting next to the gap widens it, so runs of edits at one spot cost O(1)
+each. The gap only moves when an edit happens somewhere else, and moving it
+costs O(distance moved).
+
+The array is a bytearray holding the text encoded as UTF-32, so every
+character takes exactly 4 bytes and character positions map straight onto
+byte offsets.
+"""
+
+from text_storage import TextStorage
+
+
+# The encoding used for the array. Every character is 4 bytes.
+ENCODING = "utf-32-le"
+CHAR_SIZE = 4
+
+# The smallest gap left after the array grows, in characters.
+MIN_GAP = 4096
+
+
+class GapBuffer(TextStorage):
+    """
+    Store text in a gap buffer.
+
+    Attributes:
+        _array: A bytearray holding the encoded text and the gap.
+        _gap_start: An int representing the character index the gap starts
+            at. This is also the position of the gap in the text.
+        _gap_end: An int representing the character index just past the gap.
+        _cache: A string representing the materialized text, or None if the
+            buffer has been edited since the text was last materialized.
+        _shared: A bool representing whether _array is shared with a
+            snapshot, and must be copied before it is edited.
+    """
+
+    def __init__(self, text=""):
+        super().__init__(text)
+        self._array = bytearray(text.encode(ENCODING))
+        # Start with the gap at the end of the text
+        self._gap_start = len(text)
+        self._gap_end = len(text)
+        self._cache = text
+        self._shared = False
+
+    def __len__(self):
+        return len(self._array) // CHAR_SIZE - self.gap_size
+
+    @property
+    def gap_size(self):
+        """
+        Return the number of free characters in the gap.
+        """
+        return self._gap_end - self._gap_start
+
+    @property
+    def gap_position(self):
+        """
+        Return the position of the gap in the text.
+        """
+        return self._gap_start
+
+    @property
+    def text(self):
+        if self._cache is None:
+            self._cache = self.slice(0, len(self))
+        return self._cache
+
+    def _decode(self, start, end):
+        """
+        Decode the characters between two indexes of the array.
+
+        Args:
+            start: An int representing the character index to start at.
+            end: An int representing the character index to end at.
+
+        Returns:
+            A string representing the decoded characters.
+        """
+        if start >= end:
+            return ""
+        return self._array[start*CHAR_SIZE:end*CHAR_SIZE].decode(ENCODING)
+
+    def slice(self, start, end):
+        if self._cache is not None:
+            return self._cache[start:end]
+
+        end = min(end, len(self))
+        gap_start = self._gap_start
+        gap_size = self.gap_size
+
+        if end <= gap_start:
+            return self._decode(start, end)
+        if start >= gap_start:
+            return self._decode(start + gap_size, end + gap_size)
+        return (self._decode(start, gap_start) +
+                self._decode(self._gap_end, end + gap_size))
+
+    def snapshot(self):
+        # Share the array until the next edit copies it
+        snapshot = GapBuffer()
+        snapshot._array = self._array
+        snapshot._gap_start = self._gap_start
+        snapshot._gap_end = self._gap_end
+        snapshot._cache = self._cache
+        snapshot._shared = True
+        self._shared = True
+        return snapshot
+
+    def _unshare(self):
+        """
+        Copy the array if a snapshot shares it, before editing it.
+        """
+        if self._shared:
+            self._array = bytearray(self._array)
+            self._shared = False
+
+    def _move_gap(self, pos):
+        """
+        Move the gap to a position in the text.
+
+        Copies the characters between the old and new positions across the
+        gap.
+
+        Args:
+            pos: An int representing the new position of the gap.
+        """
+        array = self._array
+        gap_start = self._gap_start
+        gap_end = self._gap_end
+
+        if pos < gap_start:
+            # Move the characters before the gap to after it
+            moved = gap_start - pos
+            array[(gap_end-moved)*CHAR_SIZE:gap_end*CHAR_SIZE] = \
+                array[pos*CHAR_SIZE:gap_start*CHAR_SIZE]
+        elif pos > gap_start:
+            # Move the characters after the gap to before it
+            moved = pos - gap_start
+            array[gap_start*CHAR_SIZE:pos*CHAR_SIZE] = \
+                array[gap_end*CHAR_SIZE:(gap_end+moved)*CHAR_SIZE]
+            moved = -moved
+        else:
+            return
+
+        self._gap_start -= moved
+        self._gap_end -= moved
+
+    def _grow_gap(self, chars):
+        """
+        Widen the gap so it can hold at least chars characters.
+
+        The gap grows in proportion to the text, so growing is amortized O(1)
+        per inserted character.
+
+        Args:
+            chars: An int representing the number of characters the gap must
+                be able to hold.
+        """
+        extra = max(chars, MIN_GAP, len(self) // 8) - self.gap_size
+        gap_end = self._gap_end * CHAR_SIZE
+        self._array[gap_end:gap_end] = bytes(extra * CHAR_SIZE)
+        self._gap_end += extra
+
+    def insert(self, pos, text):
+        if text == "":
+            return
+
+        self._unshare()
+        self._move_gap(pos)
+        if len(text) > self.gap_size:
+            self._grow_gap(len(text))
+
+        gap_start = self._gap_start
+        self._array[gap_start*CHAR_SIZE:(gap_start+len(text))*CHAR_SIZE] = \
+            text.encode(ENCODING)
+        self._gap_start += len(text)
+        self._cache = None
+
+    def delete(self, start, end):
+        if start >= end:
+            return ""
+
+        deleted_text = self.slice(start, end)
+        self._unshare()
+        if end == self._gap_start:
+            # Deleting backwards from the gap, just widen it.
+            self._gap_start = start
+        else:
+            self._move_gap(start)
+            self._gap_end += end - start
+        self._cache = None
+        return deleted_text
@@ -7,25 +7,36 @@ but cannot be tested. IhmacsSansCurses can be tested.
 """
 
 import curses
+import queue
+from copy import deepcopy
+from string import digits
 
 from buff import Buffer
+from buffer_registry import BufferRegistry
+from keymap import define_key
+from text_storage import PieceTable
 from view import View
 from controller import Controller
 from basic_editing import (
     command_undefined,
     DEFAULT_GLOBAL_KEYMAP,
+    MESSAGE_LOG_MAX,
 )
 
 
+# Keys typed in a prefix argument after C-u, or after meta to start one
+DIGIT_KEYS = frozenset(digits + "-")
+
+
 # pylint: disable=R0902
 class IhmacsSansCurses:
     """
     Class representing top level of an Ihmacs session.
 
     Attributes:
-        _buffers: List of all active buffers.
+        _buffers: A BufferRegistry of all active buffers.
         _keymap: A dictionary of dictionaries representing the global keymap.
-        _active_buff: An int representing the index of the active buffer.
+        _active_buff: The active buffer, or None if there is none yet.
         keychord: A list of strings representing the current keychord being
             inputted.
         end_session: A bool representing whether or not to continue the editing
@@ -34,6 +45,10 @@ class IhmacsSansCurses:
             For those not familiar with Emacs reading this code, this is a
             clipboard, with infinite history of copies.
         echo: A string to display in the echo area.
+        message_log_max: An int representing the most lines to keep in the
+            *messages* buffer, or None to keep them all.
+        _pending: A queue of functions other threads asked the editing loop to
+            run.
     """
 
     def __init__(self, files):
@@ -44,10 +59,11 @@ class IhmacsSansCurses:
             files: A tuple of strings representing file paths to open as
                 buffers.
         """
-        # Global editor state
-        self._keymap = DEFAULT_GLOBAL_KEYMAP
-        self._active_buff = 0
-        self._buffers = []
+        # Global editor state. Copied so rebinding keys in one session leaves
+        # the default alone. Buffers keep a reference to it, not a copy.
+        self._keymap = deepcopy(DEFAULT_GLOBAL_KEYMAP)
+        self._active_buff = None
+        self._buffers = BufferRegistry()
         self.create_buffer(name="*scratch*")
 
         # This need to be mutated by the controller and are thus public.
@@ -55,18 +71,32 @@ class IhmacsSansCurses:
         self.end_session = False
         self.kill_ring = []
         self.echo = ""
+        self.message_log_max = MESSAGE_LOG_MAX
+        self._pending = queue.SimpleQueue()
 
     @property
     def active_buff_index(self):
         """
-        Return the index of the active buffer.
+        Return the index of the active buffer in the list of buffers.
+
+        The index is found by searching the list. Prefer active_buff.
         """
-        return self._active_buff
+        buffers = self.buffers
+        if self._active_buff in buffers:
+            return buffers.index(self._active_buff)
+        return 0
 
     @property
     def buffers(self):
         """
-        Return the list of buffers.
+        Return the list of buffers, in the order they were created.
+        """
+        return list(self._buffers)
+
+    @property
+    def buffer_registry(self):
+        """
+        Return the BufferRegistry of all buffers.
         """
         return self._buffers
 
@@ -77,7 +107,50 @@ class IhmacsSansCurses:
         """
         return self._keymap
 
+    def global_set_key(self, keychord, command):
+        """
+        Bind a keychord to a command in the global keymap.
+
+        Every buffer sees the new binding right away, unless a local, minor
+        mode, or major mode binding shadows it.
+
+        Args:
+            keychord: A list of strings representing a keychord.
+            command: A function representing an editing command, or None to
+                remove the binding.
+        """
+        define_key(self._keymap, keychord, command)
+
     # Helper methods
+    def call_soon(self, func):
+        """
+        Ask the editing loop to run a function.
+
+        Safe to call from any thread. Work done in the background, like
+        saving, reports back through this, so only the editing loop ever
+        touches buffers.
+
+        Args:
+            func: A function of no arguments.
+        """
+        self._pending.put(func)
+
+    def run_pending(self):
+        """
+        Run the functions queued by call_soon, oldest first.
+
+        Returns:
+            A bool representing whether any function was run.
+        """
+        ran = False
+        while True:
+            try:
+                func = self._pending.get_nowait()
+            except queue.Empty:
+                return ran
+            func()
+            ran = True
+
     def active_buff(self):
         """
         Return the active buffer.
@@ -85,10 +158,10 @@ class IhmacsSansCurses:
         Does NOT return the index of the active buffer; rather, it returns the
         actual buffer object.
 
-        If the buffer list is empty, create a new scratch buffer and return it.
+        If there are no buffers, create a new scratch buffer and return it.
 
-        If the index is invalid, set the active buffer to be the last buffer in
-        the list.
+        If the active buffer was killed, the most recently used buffer becomes
+        the active buffer.
 
         Returns:
             A buffer object representing the active buffer.
@@ -96,43 +169,84 @@ class IhmacsSansCurses:
         if len(self._buffers) == 0:
             self.create_buffer(name="*scratch*")
 
-        if self.active_buff_index >= len(self._buffers):
-            self._active_buff = len(self._buffers) - 1
+        if self._active_buff is None or self._active_buff not in self._buffers:
+            self._active_buff = self._buffers.most_recent
+
+        return self._active_buff
+
+    def add_buffer(self, buff):
+        """
+        Add an existing buffer to the buffers of the session.
+
+        Does NOT switch to it.
+
+        Args:
+            buff: A Buffer whose name no other buffer has.
 
-        return self._buffers[self._active_buff]
+        Raises:
+            ValueError: If another buffer has the same name.
+        """
+        self._buffers.add(buff)
 
-    def create_buffer_no_switch(self, name="", path="", read_only=False):
+    def create_buffer_no_switch(self, name="", path="", read_only=False,
+                                storage=PieceTable):
         """
-        Create a new buffer and append it to the list of buffers.
+        Create a new buffer and add it to the buffers.
 
-        Does NOT set the active buffer index to the index of the new buffer.
+        Does NOT switch to the new buffer. If the name is taken, the buffer
+        gets a unique name made from it.
 
         Args:
             name: The name of the new buffer.
-            major_mode: The major mode of the new buffer.
+            path: The file path associated with the new buffer.
+            read_only: A bool representing whether the new buffer is read
+                only.
+            storage: A TextStorage subclass used to hold the text of the new
+                buffer. Defaults to a piece table.
+
+        Returns:
+            The new Buffer.
         """
-        buffer_list = self._buffers
-        new_buffer = Buffer(name=name,
+        new_buffer = Buffer(name=self._buffers.unique_name(name),
                             path=path,
                             keymap=self._keymap,
-                            read_only=read_only)
-        buffer_list.append(new_buffer)
+                            read_only=read_only,
+                            storage=storage)
+        self._buffers.add(new_buffer)
+        return new_buffer
 
     def create_buffer(self, name="", path="", read_only=False):
         """
-        Create a new buffer and append it to the list of buffers.
-
-        Sets the active buffer index to the index of the new buffer.
+        Create a new buffer, add it to the buffers, and switch to it.
 
         Args:
             name: The name of the new buffer.
-            major_mode: The major mode of the new buffer.
+            path: The file path associated with the new buffer.
+            read_only: A bool representing whether the new buffer is read
+                only.
+
+        Returns:
+            The new Buffer.
+        """
+        new_buffer = self.create_buffer_no_switch(name=name,
+                                                  path=path,
+                                                  read_only=read_only)
+        self.switch_to_buffer(new_buffer)
+        return new_buffer
+
+    def switch_to_buffer(self, buff, record=True):
         """
-        buffer_list = self._buffers
-        self.create_buffer_no_switch(name=name,
-                                     path=path,
-                                     read_only=read_only)
-        self._active_buff = len(buffer_list) - 1
+        Make a buffer the active buffer.
+
+        Args:
+            buff: A Buffer of the session.
+            record: A bool representing whether to make the buffer the most
+                recently used one. Cycling through the buffers does not, so
+                it keeps the order it cycles through.
+        """
+        self._active_buff = buff
+        if record:
+            self._buffers.touch(buff)
 
     def switch_buffer(self, index):
         """
@@ -145,7 +259,21 @@ class IhmacsSansCurses:
         """
         buffer_list = self.buffers
         if 0 <= index < len(buffer_list):
-            self._active_buff = index
+            self.switch_to_buffer(buffer_list[index])
+
+    def remove_buffer(self, buff):
+        """
+        Kill a buffer.
+
+        If it was the active buffer, the most recently used buffer becomes
+        the active buffer.
+
+        Args:
+            buff: A Buffer of the session.
+        """
+        self._buffers.remove(buff)
+        if buff is self._active_buff:
+            self._active_buff = self._buffers.most_recent
 
     def kill_buffer(self, index):
         """
@@ -153,35 +281,31 @@ class IhmacsSansCurses:
 
         If the index is invalid, do nothing.
         """
-        buffer_list = self._buffers
+        buffer_list = self.buffers
         if 0 <= index < len(buffer_list):
-            del buffer_list[index]
+            self.remove_buffer(buffer_list[index])
 
     def find_buffer(self, name):
         """
-        Find the first buffer whose name matches a string.
+        Find the buffer whose name matches a string.
 
         Args:
             name: A string representing a buffer name to search for.
 
         Returns:
-            The first buffer object in the list of buffers whose name matches
-            name. Returns None if no buffer with the name is found.
+            The buffer whose name is name. Returns None if no buffer with the
+            name is found.
         """
-        buffers = self._buffers
-        for buff in buffers:
-            if buff.name == name:
-                return buff
-        return None
+        return self._buffers.get(name)
 
 
 class Ihmacs(IhmacsSansCurses):
     """
     Class representing top level of an Ihmacs session.
     Attributes:
-        _buffers: List of all active buffers.
+        _buffers: A BufferRegistry of all active buffers.
         _keymap: A dictionary of dictionaries representing the global keymap.
-        _active_buff: An int representing the index of the active buffer.
+        _active_buff: The active buffer, or None if there is none yet.
         keychord: A list of strings representing the current keychord being
             inputted.
         end_session: A bool representing whether or not to continue the editing
@@ -240,6 +364,7 @@ class Ihmacs(IhmacsSansCurses):
 
         # Loop
         while not self.end_session:
+            self.run_pending()
             # Update display
             view.refresh_screen()
 
@@ -252,10 +377,14 @@ class Ihmacs(IhmacsSansCurses):
                 # Update echo area
                 view.echo()
 
-                # Read keystrokes
-                controller.read_key()
-                # Test for mapping
-                func = read_keychord_keymap(keychord, keymap)
+                # Read keystrokes. While waiting, report background work.
+                if not controller.read_key():
+                    if self.run_pending():
+                        view.refresh_screen()
+                    continue
+                # Test for mapping, after any prefix argument
+                num, command_keys = read_prefix_arg(keychord)
+                func = read_keychord_keymap(command_keys, keymap)
                 # Echo the current keychord
                 controller.echo(" ".join(keychord))
 
@@ -263,7 +392,7 @@ class Ihmacs(IhmacsSansCurses):
             controller.echo("")
 
             # Act on input
-            controller.run_edit(func)
+            controller.run_edit(func, num)
 
 
 def read_keychord_keymap(keychord, keymap):
@@ -277,7 +406,7 @@ def read_keychord_keymap(keychord, keymap):
 
     Args:
         keychord: A list representing a keychord.
-        keymap: A dictionary representing a keymap.
+        keymap: A dictionary or LayeredKeymap representing a keymap.
 
     Returns:
         A function representing a mapping, the command_undefined function if
@@ -297,3 +426,67 @@ def read_keychord_keymap(keychord, keymap):
     # Find what it maps to. If it maps to nothing, it maps to command_undefined
     value = keymap.get(key, command_undefined)
     return read_keychord_keymap(keychord[1:], value)
+
+
+def read_prefix_arg(keychord):
+    """
+    Split a keychord into a prefix argument and the keys of the command.
+
+    A prefix argument is typed like in Emacs. C-u alone is 4, and each more
+    C-u multiplies it by 4. C-u followed by digits is that number, and a -
+    right after C-u makes it negative, -1 if no digits follow. A C-u after
+    the digits ends the argument, so the command can be a digit. M-0 to M-9
+    and M-- start an argument the same way without C-u.
+
+    Args:
+        keychord: A list of strings representing a keychord.
+
+    Returns:
+        A tuple (num, command_keys). num is an int representing the prefix
+        argument, or None if there is none. command_keys is a list of the
+        keys after the prefix argument, empty if it is still being typed.
+    """
+    times_four = 1
+    sign = 1
+    number = ""
+    for index, key in enumerate(keychord):
+        # M-digits and M-- are the same as the keys without meta
+        if key.startswith("M-") and key[2:] in DIGIT_KEYS:
+            key = key[2:]
+        elif index == 0 and key != "C-u":
+            return None, keychord
+
+        if key == "C-u" and not number and sign > 0:
+            times_four *= 4
+            continue
+        if key == "-" and not number and sign > 0:
+            sign = -1
+            continue
+        if key in DIGIT_KEYS and key != "-":
+            number += key
+            continue
+        # The first key of the command. A C-u ending the argument is eaten.
+        if key == "C-u":
+            index += 1
+        return _prefix_value(times_four, sign, number), keychord[index:]
+    return _prefix_value(times_four, sign, number), []
+
+
+def _prefix_value(times_four, sign, number):
+    """
+    Return the value of a prefix argument from what was typed.
+
+    Args:
+        times_four: An int representing 4 to the power of the number of C-u
+            typed before any digits, or 1 if none were.
+        sign: 1, or -1 if - was typed.
+        number: A string representing the digits typed.
+
+    Returns:
+        An int representing the prefix argument.
+    """
+    if number:
+        return sign * int(number)
+    if sign < 0:
+        return -1
+    return times_four
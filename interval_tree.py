@@ -0,0 +1,454 @@
+"""
+Interval tree for text properties and overlays in Ihmacs buffers.
+
+Text properties and overlays attach attributes (a face to draw text in, say)
+to ranges of text. The ranges have to move with the text as it is edited, and
+the view has to find the ones touching the lines on screen without looking at
+all of them.
+
+The intervals are kept in a treap (a randomly balanced binary search tree)
+ordered by start. Every node also records the largest end in its subtree, so a
+search for the intervals overlapping a window can skip any subtree that ends
+before the window, costing O(log n + k) for k intervals found.
+
+Shifting is lazy. An edit splits the tree at the edit, adds the shift to the
+root of the part after it, and joins the parts back up, which costs O(log n)
+no matter how many intervals follow. The shift is pushed down to children only
+when a search or a later edit walks through them. Intervals that start inside
+the edited text are taken out and put back at their new places, and intervals
+that start before the edit but reach into it have their ends moved, so those
+cost O(log n) each on top.
+"""
+
+import random
+
+
+class Interval:
+    """
+    A range of text with properties attached.
+
+    Intervals are made and moved by an IntervalTree, which also keeps their
+    positions. Do not set their positions by hand.
+
+    Attributes:
+        properties: A dict of the properties attached to the range.
+        front_advance: A bool representing whether text inserted at the start
+            of the range goes before it (True) or inside it (False).
+        rear_advance: A bool representing whether text inserted at the end of
+            the range goes inside it (True) or after it (False).
+        evaporate: A bool representing whether the interval is removed when
+            an edit leaves it empty.
+        owner: Whatever the interval belongs to, for the user of the tree to
+            tell intervals apart. None by default.
+        _node: The tree node holding the interval, or None if it is not in a
+            tree.
+    """
+
+    __slots__ = ("properties", "front_advance", "rear_advance", "evaporate",
+                 "owner", "_node")
+
+    # pylint: disable=R0913
+    def __init__(self, properties=None, front_advance=False,
+                 rear_advance=False, evaporate=False, owner=None):
+        """
+        Initialize interval. Add it to a tree to give it a range.
+        """
+        self.properties = {} if properties is None else properties
+        self.front_advance = front_advance
+        self.rear_advance = rear_advance
+        self.evaporate = evaporate
+        self.owner = owner
+        self._node = None
+
+    def __repr__(self):
+        return f"<Interval {self.start}-{self.end} {self.properties}>"
+
+    def _position(self):
+        """
+        Return the (start, end) of the interval, or (None, None).
+
+        Positions stored in a node miss the shifts still pending in the nodes
+        above it, so add those up on the way to the root.
+        """
+        node = self._node
+        if node is None:
+            return (None, None)
+        shift = 0
+        parent = node.parent
+        while parent is not None:
+            shift += parent.shift
+            parent = parent.parent
+        return (node.start + shift, node.end + shift)
+
+    @property
+    def start(self):
+        """
+        Return where the interval starts, or None if it is not in a tree.
+        """
+        return self._position()[0]
+
+    @property
+    def end(self):
+        """
+        Return where the interval ends, or None if it is not in a tree.
+        """
+        return self._position()[1]
+
+
+# pylint: disable=R0902, R0903
+class _Node:
+    """
+    A node of the treap.
+
+    The start, end, and max_end of a node are only right once the shifts of
+    every node above it have been added.
+
+    Attributes:
+        interval: The Interval the node holds.
+        start: An int representing where the interval starts.
+        end: An int representing where the interval ends.
+        max_end: An int representing the largest end in the subtree.
+        priority: A float. Parents have higher priorities than children.
+        left: The left child _Node, or None.
+        right: The right child _Node, or None.
+        parent: The parent _Node, or None for the root.
+        shift: An int representing a shift not yet applied to the children.
+    """
+
+    __slots__ = ("interval", "start", "end", "max_end", "priority",
+                 "left", "right", "parent", "shift")
+
+    def __init__(self, interval, start, end):
+        self.interval = interval
+        self.start = start
+        self.end = end
+        self.max_end = end
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.shift = 0
+
+
+def _shift(node, amount):
+    """
+    Shift a whole subtree by amount, lazily.
+    """
+    if node is not None and amount:
+        node.start += amount
+        node.end += amount
+        node.max_end += amount
+        node.shift += amount
+
+
+def _push(node):
+    """
+    Pass a node's pending shift on to its children.
+    """
+    if node.shift:
+        _shift(node.left, node.shift)
+        _shift(node.right, node.shift)
+        node.shift = 0
+
+
+def _update(node):
+    """
+    Recompute a node's max_end and its children's parent links.
+
+    The node's shift must have been pushed.
+    """
+    max_end = node.end
+    for child in (node.left, node.right):
+        if child is not None:
+            child.parent = node
+            if child.max_end > max_end:
+                max_end = child.max_end
+    node.max_end = max_end
+
+
+def _split(node, pos, inclusive):
+    """
+    Split a subtree by start.
+
+    Args:
+        node: The root _Node of the subtree, or None.
+        pos: An int representing where to split.
+        inclusive: A bool. If True, intervals starting at pos go left.
+
+    Returns:
+        A tuple (left, right) of subtree roots. Left holds the intervals
+        starting before pos (or at it, if inclusive), right the rest.
+    """
+    if node is None:
+        return (None, None)
+    _push(node)
+    if node.start < pos or (inclusive and node.start == pos):
+        left, right = _split(node.right, pos, inclusive)
+        node.right = left
+        _update(node)
+        node.parent = None
+        if right is not None:
+            right.parent = None
+        return (node, right)
+    left, right = _split(node.left, pos, inclusive)
+    node.left = right
+    _update(node)
+    node.parent = None
+    if left is not None:
+        left.parent = None
+    return (left, node)
+
+
+def _merge(left, right):
+    """
+    Join two subtrees, where every start in left is at most every start in
+    right.
+
+    Returns:
+        The root _Node of the joined subtree, or None.
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        _push(left)
+        left.right = _merge(left.right, right)
+        _update(left)
+        left.parent = None
+        return left
+    _push(right)
+    right.left = _merge(left, right.left)
+    _update(right)
+    right.parent = None
+    return right
+
+
+def _walk(node, nodes):
+    """
+    Append every node of a subtree to a list, in order, pushing shifts down.
+    """
+    while node is not None:
+        _push(node)
+        _walk(node.left, nodes)
+        nodes.append(node)
+        node = node.right
+
+
+def _map(pos, advance, start, end, length):
+    """
+    Return where a position ends up after replacing start to end with length
+    characters of text, like a Marker would.
+    """
+    if pos < start:
+        return pos
+    if pos <= end:
+        return start + length if advance else start
+    return pos + length - (end - start)
+
+
+class IntervalTree:
+    """
+    A set of Intervals that move with the text they cover.
+
+    Attributes:
+        _root: The root _Node of the treap, or None if it is empty.
+        _size: An int representing the number of intervals in the tree.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty tree.
+        """
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def end(self):
+        """
+        Return where the last ending interval ends, or 0 if the tree is empty.
+        """
+        if self._root is None:
+            return 0
+        return self._root.max_end
+
+    def add(self, interval, start, end):
+        """
+        Add an interval to the tree, covering start to end.
+
+        Args:
+            interval: An Interval that is not in a tree.
+            start: An int representing where the interval starts.
+            end: An int representing where the interval ends.
+        """
+        if interval._node is not None:
+            raise ValueError(f"{interval!r} is already in a tree")
+        start, end = sorted((start, end))
+        node = _Node(interval, start, end)
+        interval._node = node
+        self._insert(node)
+        self._size += 1
+
+    def _insert(self, node):
+        """
+        Insert a lone node in order of start.
+        """
+        left, right = _split(self._root, node.start, inclusive=True)
+        self._root = _merge(_merge(left, node), right)
+
+    def remove(self, interval):
+        """
+        Remove an interval from the tree.
+        """
+        node = interval._node
+        if node is None:
+            raise ValueError(f"{interval!r} is not in a tree")
+
+        # Push the shifts above the node down to it, top first
+        path = []
+        parent = node.parent
+        while parent is not None:
+            path.append(parent)
+            parent = parent.parent
+        for ancestor in reversed(path):
+            _push(ancestor)
+        _push(node)
+
+        # Replace the node by the join of its children
+        joined = _merge(node.left, node.right)
+        parent = node.parent
+        if parent is None:
+            self._root = joined
+        elif parent.left is node:
+            parent.left = joined
+        else:
+            parent.right = joined
+        if joined is not None:
+            joined.parent = parent
+
+        # Fix max_end on the way back up
+        while parent is not None:
+            _update(parent)
+            parent = parent.parent
+
+        interval._node = None
+        node.left = node.right = node.parent = None
+        self._size -= 1
+
+    def move(self, interval, start, end):
+        """
+        Move an interval in the tree to cover start to end.
+        """
+        self.remove(interval)
+        self.add(interval, start, end)
+
+    def replace(self, start, end, length):
+        """
+        Move intervals to account for replacing the text between start and end
+        with length characters.
+
+        Args:
+            start: An int representing where the replaced text starts.
+            end: An int representing where the replaced text ends.
+            length: An int representing the length of the new text.
+        """
+        if self._root is None:
+            return
+        delta = length - (end - start)
+
+        before, rest = _split(self._root, start, inclusive=False)
+        inside, after = _split(rest, end, inclusive=True)
+
+        # Intervals after the edit just shift, all at once
+        _shift(after, delta)
+
+        # Intervals starting before the edit may reach into it
+        self._fix_ends(before, start, end, length)
+        self._root = _merge(before, after)
+
+        # Intervals starting inside the edit go back in one at a time
+        nodes = []
+        _walk(inside, nodes)
+        for node in nodes:
+            interval = node.interval
+            node.start = _map(node.start, interval.front_advance,
+                              start, end, length)
+            node.end = max(node.start, _map(node.end, interval.rear_advance,
+                                            start, end, length))
+            node.max_end = node.end
+            node.left = node.right = node.parent = None
+            node.shift = 0
+            if interval.evaporate and node.start == node.end:
+                interval._node = None
+                self._size -= 1
+                continue
+            node.priority = random.random()
+            self._insert(node)
+
+    def _fix_ends(self, node, start, end, length):
+        """
+        Move the ends of intervals in a subtree that reach the edit.
+
+        Every interval in the subtree starts before the edit, so only ends at
+        or after its start move. Subtrees ending before it are skipped.
+        """
+        if node is None or node.max_end < start:
+            return
+        _push(node)
+        self._fix_ends(node.left, start, end, length)
+        self._fix_ends(node.right, start, end, length)
+        if node.end >= start:
+            node.end = _map(node.end, node.interval.rear_advance,
+                            start, end, length)
+        _update(node)
+
+    def overlapping(self, start, end):
+        """
+        Return the intervals overlapping a range of text, in order of start.
+
+        An interval overlaps the range if they share at least one character.
+        Empty intervals overlap the range if they lie inside it.
+
+        Args:
+            start: An int representing where the range starts.
+            end: An int representing where the range ends (exclusive).
+
+        Returns:
+            A list of tuples (interval, start, end).
+        """
+        found = []
+        self._search(self._root, start, end, found)
+        return found
+
+    def _search(self, node, start, end, found):
+        """
+        Collect the intervals of a subtree overlapping start to end.
+        """
+        while node is not None:
+            if node.max_end < start:
+                return
+            _push(node)
+            self._search(node.left, start, end, found)
+            if node.start >= end:
+                # Everything further right starts even later
+                return
+            if (node.start < end and node.end > start) or \
+                    (node.start == node.end and start <= node.start < end):
+                found.append((node.interval, node.start, node.end))
+            node = node.right
+
+    def at(self, pos):
+        """
+        Return the intervals covering the character at a position.
+
+        Args:
+            pos: An int representing a position in the text.
+
+        Returns:
+            A list of tuples (interval, start, end).
+        """
+        return [found for found in self.overlapping(pos, pos + 1)
+                if found[1] < found[2]]
@@ -0,0 +1,99 @@
+"""
+Layered keymaps.
+
+A buffer reads keys through several keymaps at once: its own local keymap, the
+keymaps of its minor modes, the modemap of its major mode, and the global
+keymap. Merging these into one tree would copy every binding into every buffer,
+and a later change to the global keymap would not reach the copies.
+
+Instead, a LayeredKeymap keeps references to the layers and looks a key up in
+each in turn, highest priority first. Nothing is copied, so making one is O(1)
+however many bindings there are, and rebinding a key in any layer is seen by
+every buffer that uses it right away.
+"""
+
+
+class LayeredKeymap:
+    """
+    A keymap made of other keymaps, looked up in order.
+
+    A key bound in an earlier layer shadows the same key in later layers. If
+    the earliest binding of a key is a prefix, the prefixes of all the layers
+    are looked into together, so a major mode binding C-c C-c does not hide a
+    global binding of C-c C-j. A command bound to a key in a later layer is
+    hidden by a prefix in an earlier one, as in Emacs.
+
+    Supports get like a dictionary, so read_keychord_keymap works with either.
+
+    Attributes:
+        _layers: A list of dictionary trees, highest priority first.
+    """
+
+    __slots__ = ("_layers",)
+
+    def __init__(self, layers):
+        """
+        Initialize a layered keymap.
+
+        Args:
+            layers: A list of dictionary trees representing keymaps, highest
+                priority first. The list is kept, not copied.
+        """
+        self._layers = layers
+
+    @property
+    def layers(self):
+        """
+        Return the list of layers, highest priority first.
+        """
+        return self._layers
+
+    def get(self, key, default=None):
+        """
+        Return what a key is bound to.
+
+        Args:
+            key: A string representing a key.
+            default: What to return if no layer binds the key.
+
+        Returns:
+            The command of the first layer binding the key, a LayeredKeymap of
+            the prefixes if the first layer binding it has a prefix, or default.
+        """
+        prefixes = []
+        for layer in self._layers:
+            value = layer.get(key)
+            if value is None:
+                continue
+            if isinstance(value, (dict, LayeredKeymap)):
+                prefixes.append(value)
+            elif not prefixes:
+                return value
+        if prefixes:
+            return LayeredKeymap(prefixes)
+        return default
+
+
+def define_key(keymap, keychord, command):
+    """
+    Bind a keychord to a command in a keymap, in place.
+
+    Prefixes are made as needed. A command bound to a prefix of the keychord
+    is replaced by a new prefix.
+
+    Args:
+        keymap: A dictionary tree representing a keymap.
+        keychord: A list of strings representing a keychord.
+        command: A function representing an editing command, or None to remove
+            the binding.
+    """
+    *prefix, last = keychord
+    for key in prefix:
+        branch = keymap.get(key)
+        if not isinstance(branch, dict):
+            branch = keymap[key] = {}
+        keymap = branch
+    if command is None:
+        keymap.pop(last, None)
+    else:
+        keymap[last] = command
@@ -0,0 +1,286 @@
+"""
+Line start index for Ihmacs buffers.
+
+Buffers need to answer "what line is this position on" and "where does this
+line start" on every keystroke: for the modeline, for keeping point in view,
+and for drawing. Counting newlines in the text each time costs O(n). A line
+index keeps a sorted list of the positions every line starts at, updates it as
+the text is edited, and answers lookups by bisection in O(log n).
+
+Line numbers index at 0 in this module. The buffer adds 1.
+"""
+
+from bisect import bisect_right
+
+
+class LineIndex:
+    """
+    A sorted list of line start positions, updated in place on edits.
+
+    An edit shifts every line start after it. Rather than adding the shift to
+    all of those entries, the index remembers one pending shift that applies to
+    every entry from some boundary onwards. The next edit only has to settle
+    the entries between the old boundary and its own position. Edits close to
+    each other (typing, for instance) therefore only touch a few entries, much
+    like the gap in a gap buffer.
+
+    Attributes:
+        _starts: A list of ints representing the position each line starts at.
+            Entries at or after _shift_from are stored without _shift added.
+        _shift_from: An int representing the index of the first entry the
+            pending shift applies to.
+        _shift: An int representing the pending shift.
+        _length: An int representing the length of the indexed text.
+    """
+
+    def __init__(self, text=""):
+        """
+        Build a line index for text.
+
+        Args:
+            text: A string representing the text to index.
+        """
+        self._starts = [0]
+        self._shift_from = 1
+        self._shift = 0
+        self._length = 0
+        self.reset(text)
+
+    def reset(self, text):
+        """
+        Rebuild the index from scratch for text.
+
+        Args:
+            text: A string representing the text to index.
+        """
+        starts = [0]
+        pos = text.find("\n")
+        while pos != -1:
+            starts.append(pos + 1)
+            pos = text.find("\n", pos + 1)
+        self._starts = starts
+        self._shift_from = len(starts)
+        self._shift = 0
+        self._length = len(text)
+
+    @property
+    def line_count(self):
+        """
+        Return the number of lines in the text.
+        """
+        return len(self._starts)
+
+    # Helper methods
+
+    def _settle(self, index):
+        """
+        Move the boundary of the pending shift to index.
+
+        Args:
+            index: An int representing the new boundary.
+        """
+        starts = self._starts
+        shift_from = self._shift_from
+        shift = self._shift
+        if index > shift_from:
+            starts[shift_from:index] = [start + shift for start in
+                                        starts[shift_from:index]]
+        elif index < shift_from:
+            starts[index:shift_from] = [start - shift for start in
+                                        starts[index:shift_from]]
+        self._shift_from = index
+
+    def _count_starts_upto(self, pos):
+        """
+        Return the number of lines starting at or before a position.
+
+        Args:
+            pos: An int representing a position in the text.
+        """
+        starts = self._starts
+        shift_from = self._shift_from
+        index = bisect_right(starts, pos, 0, shift_from)
+        if index < shift_from:
+            return index
+        return bisect_right(starts, pos - self._shift, shift_from)
+
+    # Lookups
+
+    def line_of(self, pos):
+        """
+        Return the line a position is on.
+
+        Args:
+            pos: An int representing a position in the text.
+        """
+        return self._count_starts_upto(pos) - 1
+
+    def line_start(self, line):
+        """
+        Return the position a line starts at.
+
+        Args:
+            line: An int representing a line number.
+
+        Returns:
+            An int representing where the line starts. If the line does not
+            exist, the length of the text.
+        """
+        if line >= len(self._starts):
+            return self._length
+        line = max(0, line)
+        start = self._starts[line]
+        if line >= self._shift_from:
+            start += self._shift
+        return start
+
+    def line_end(self, line):
+        """
+        Return the position a line ends at.
+
+        Args:
+            line: An int representing a line number.
+
+        Returns:
+            An int representing the position of the newline ending the line,
+            or the length of the text for the last line.
+        """
+        if line + 1 >= len(self._starts):
+            return self._length
+        return self.line_start(line + 1) - 1
+
+    def lines(self, start, end):
+        """
+        Return the spans of a range of lines.
+
+        Args:
+            start: An int representing the first line.
+            end: An int representing the line to stop at (exclusive).
+
+        Returns:
+            A list of (line_start, line_end) tuples. Lines that do not exist
+            are left out.
+        """
+        start = max(0, start)
+        end = min(end, len(self._starts))
+        return [(self.line_start(line), self.line_end(line))
+                for line in range(start, end)]
+
+    # Updates
+
+    def insert(self, pos, text):
+        """
+        Update the index for text inserted at a position.
+
+        Args:
+            pos: An int representing where the text was inserted.
+            text: A string representing the inserted text.
+        """
+        index = self._count_starts_upto(pos)
+        self._settle(index)
+
+        # Every line starting after pos moves along
+        self._shift += len(text)
+        self._length += len(text)
+
+        new_starts = []
+        newline = text.find("\n")
+        while newline != -1:
+            new_starts.append(pos + newline + 1)
+            newline = text.find("\n", newline + 1)
+        if new_starts:
+            # New entries are exact, so they go before the boundary.
+            self._starts[index:index] = new_starts
+            self._shift_from = index + len(new_starts)
+
+    def delete(self, start, end):
+        """
+        Update the index for text deleted between two positions.
+
+        Args:
+            start: An int representing where the deletion started.
+            end: An int representing where the deletion ended (exclusive).
+        """
+        first = self._count_starts_upto(start)
+        last = self._count_starts_upto(end)
+        self._settle(first)
+
+        # Lines starting inside the deleted text are gone
+        del self._starts[first:last]
+        self._shift -= end - start
+        self._length -= end - start
+
+
+class StorageLineIndex:
+    """
+    A line index for storage that already tracks its own lines.
+
+    Answers lookups by asking the storage, and ignores updates since the
+    storage keeps itself up to date.
+
+    Attributes:
+        _storage: A TextStorage instance holding the text.
+    """
+
+    def __init__(self, storage):
+        """
+        Wrap storage as a line index.
+
+        Args:
+            storage: A TextStorage instance to ask about lines.
+        """
+        self._storage = storage
+
+    def reset(self, text):
+        """
+        Do nothing, the storage keeps track of its own lines.
+        """
+
+    @property
+    def line_count(self):
+        """
+        Return the number of lines in the text.
+        """
+        return self._storage.newline_count() + 1
+
+    def line_of(self, pos):
+        """
+        Return the line a position is on.
+        """
+        return self._storage.newlines_before(pos)
+
+    def line_start(self, line):
+        """
+        Return the position a line starts at.
+        """
+        return self._storage.line_start(max(0, line))
+
+    def line_end(self, line):
+        """
+        Return the position a line ends at.
+        """
+        # Past the last line, line_start gives the end of the text, with no
+        # newline before it to step back over
+        next_start = self.line_start(line + 1)
+        if self._storage.newlines_before(next_start) <= line:
+            return next_start
+        return next_start - 1
+
+    def lines(self, start, end):
+        """
+        Return the spans of a range of lines.
+        """
+        start = max(0, start)
+        end = min(end, self.line_count)
+        return [(self.line_start(line), self.line_end(line))
+                for line in range(start, end)]
+
+    def insert(self, pos, text):
+        """
+        Do nothing, the storage keeps track of its own lines.
+        """
+
+    def delete(self, start, end):
+        """
+        Do nothing, the storage keeps track of its own lines.
+        """
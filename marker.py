@@ -0,0 +1,251 @@
+"""
+Markers for Ihmacs buffers.
+
+A marker is a position in a buffer that stays put relative to the text around
+it as the buffer is edited. Point and mark are markers, and so can be any
+number of other positions worth keeping track of, like bookmarks, search hits,
+or error locations.
+
+The markers of a buffer are kept in a list sorted by position. An edit finds
+the first marker it could affect by bisection and only moves the markers from
+there on, so an edit costs O(log n + k) for n markers of which k lie at or
+after the edit, rather than touching every marker.
+
+When text is inserted exactly at a marker, the marker either stays before it
+or advances past it, depending on its insertion type. Markers in deleted text
+end up where the deletion happened.
+"""
+
+
+class Marker:
+    """
+    A position in a buffer that moves with the text.
+
+    Markers are made by Buffer.make_marker and moved by Buffer.set_marker. Do
+    not set their attributes by hand, as the buffer relies on its markers
+    being sorted.
+
+    Attributes:
+        _pos: An int representing the position of the marker.
+        _advance: A bool representing whether text inserted at the marker goes
+            before it (True) or after it (False).
+        _buffer: The Buffer the marker is in, or None if it was deleted.
+    """
+
+    __slots__ = ("_pos", "_advance", "_buffer")
+
+    def __init__(self, buffer, pos, advance=False):
+        """
+        Initialize marker. Does not add it to the buffer.
+
+        Args:
+            buffer: The Buffer the marker is in.
+            pos: An int representing the position of the marker.
+            advance: A bool representing whether the marker advances past
+                text inserted at it.
+        """
+        self._buffer = buffer
+        self._pos = pos
+        self._advance = advance
+
+    def __repr__(self):
+        return f"<Marker at {self._pos}>"
+
+    @property
+    def position(self):
+        """
+        Return the position of the marker, or None if it was deleted.
+        """
+        if self._buffer is None:
+            return None
+        return self._pos
+
+    @property
+    def advance(self):
+        """
+        Return whether the marker advances past text inserted at it.
+        """
+        return self._advance
+
+    @property
+    def buffer(self):
+        """
+        Return the buffer the marker is in, or None if it was deleted.
+        """
+        return self._buffer
+
+    def _key(self):
+        """
+        Return the key markers are sorted by.
+
+        At the same position, markers that stay before inserted text come
+        before markers that advance past it, so inserting there keeps them
+        sorted.
+        """
+        return (self._pos, self._advance)
+
+
+# MarkerList is the one place that keeps the private state of Markers.
+# pylint: disable=W0212
+class MarkerList:
+    """
+    The markers of a buffer, sorted by position.
+
+    Attributes:
+        _markers: A list of Markers sorted by position, then by insertion
+            type.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty list of markers.
+        """
+        self._markers = []
+
+    def __len__(self):
+        return len(self._markers)
+
+    def __iter__(self):
+        return iter(self._markers)
+
+    @property
+    def end(self):
+        """
+        Return the position of the last marker, or 0 if there are none.
+        """
+        if not self._markers:
+            return 0
+        return self._markers[-1]._pos
+
+    def _bisect(self, key):
+        """
+        Return the index of the first marker whose key is at least key.
+
+        Args:
+            key: A tuple (pos, advance) as returned by Marker._key.
+        """
+        markers = self._markers
+        low = 0
+        high = len(markers)
+        while low < high:
+            middle = (low + high) // 2
+            if markers[middle]._key() < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _index(self, marker):
+        """
+        Return the index of a marker in the list.
+
+        Raises:
+            ValueError: If the marker is not in the list.
+        """
+        markers = self._markers
+        index = self._bisect(marker._key())
+        while index < len(markers) and markers[index]._pos == marker._pos:
+            if markers[index] is marker:
+                return index
+            index += 1
+        raise ValueError(f"{marker!r} is not in this buffer")
+
+    def add(self, marker):
+        """
+        Add a marker at its position.
+        """
+        key = marker._key()
+        index = self._bisect(key)
+        markers = self._markers
+        # Put it after the markers with the same key, like bisect_right
+        while index < len(markers) and markers[index]._key() == key:
+            index += 1
+        markers.insert(index, marker)
+
+    def remove(self, marker):
+        """
+        Remove a marker.
+        """
+        del self._markers[self._index(marker)]
+
+    def delete(self, marker):
+        """
+        Remove a marker for good, leaving it pointing nowhere.
+        """
+        self.remove(marker)
+        marker._buffer = None
+
+    def move(self, marker, pos):
+        """
+        Move a marker to another position.
+        """
+        if marker._pos != pos:
+            self.remove(marker)
+            marker._pos = pos
+            self.add(marker)
+
+    def adjust(self, edits):
+        """
+        Move markers to account for edits to the text.
+
+        Only the markers at or after the first edit are looked at.
+
+        Args:
+            edits: A sorted list of (start, end, text) tuples that do not
+                overlap. Positions are those before any of the edits.
+        """
+        markers = self._markers
+        first = self._bisect((edits[0][0], False))
+
+        offset = 0
+        edit = 0
+        # Markers caught in an edit all end up at its start, then need putting
+        # back in order by insertion type.
+        run_start = None
+        for index in range(first, len(markers)):
+            marker = markers[index]
+            pos = marker._pos
+            while edit < len(edits) and pos > edits[edit][1]:
+                start, end, text = edits[edit]
+                offset += len(text) - (end - start)
+                edit += 1
+                if run_start is not None:
+                    self._sort_run(run_start, index)
+                    run_start = None
+
+            if edit < len(edits) and pos >= edits[edit][0]:
+                start, _, text = edits[edit]
+                marker._pos = start + offset
+                if marker._advance:
+                    marker._pos += len(text)
+                if run_start is None:
+                    run_start = index
+            else:
+                marker._pos = pos + offset
+
+        if run_start is not None:
+            self._sort_run(run_start, len(markers))
+
+    def clamp(self, length):
+        """
+        Move markers past the end of the text back to the end.
+
+        Args:
+            length: An int representing the length of the text.
+        """
+        markers = self._markers
+        first = self._bisect((length, False))
+        for marker in markers[first:]:
+            marker._pos = length
+        self._sort_run(first, len(markers))
+
+    def _sort_run(self, start, end):
+        """
+        Put markers that just ended up at the same place back in order.
+
+        The markers from start to end are already sorted by position, except
+        that some at the same position may have their insertion types out of
+        order. Sorting is stable, so markers that were in order stay so.
+        """
+        markers = self._markers
+        markers[start:end] = sorted(markers[start:end], key=Marker._key)
@@ -122,7 +122,24 @@ def generate_sentence_from_text(text, num=1):
     Returns:
         A string representing the generated sentences.
     """
-    word_list = text.split()
+    return generate_sentence_from_lines([text], num=num)
+
+
+def generate_sentence_from_lines(lines, num=1):
+    """
+    Generate N random sentences based on a text, read a line at a time.
+
+    Only the words are kept, never the whole text.
+
+    Args:
+        lines: An iterable of strings representing the training text.
+        num: An integer representing the number of sentences to generate. If
+            0 or negative, generate no sentences.
+
+    Returns:
+        A string representing the generated sentences.
+    """
+    word_list = [word for line in lines for word in line.split()]
     markov = create_markov_chain(word_list)
 
     # Generate text
@@ -0,0 +1,287 @@
+"""
+Memory mapped read only text storage for Ihmacs buffers.
+
+Reading a huge file into a Python string means decoding all of it up front and
+holding it in memory several times over. A memory mapped storage instead maps
+the file and decodes only the parts that are asked for. Opening the file costs
+the same no matter its size, and the operating system only faults in the pages
+that are actually read.
+
+The file is split into blocks of roughly BLOCK_SIZE bytes. For every block the
+storage records the character offset, byte offset, and newline count it starts
+at. That block index is built lazily, only as far into the file as has been
+asked about, and turns positions and line numbers into byte offsets with one
+bisection.
+
+The file is assumed to be UTF-8. Invalid bytes are decoded as U+FFFD. Line
+endings become newlines like when reading in text mode, so a mapped file reads
+the same as one read into any other storage.
+"""
+
+import copy
+import mmap
+from bisect import bisect_right
+
+from line_index import StorageLineIndex
+from text_storage import TextStorage
+
+
+# Size of a block of the file, in bytes.
+BLOCK_SIZE = 64 * 1024
+
+ENCODING = "utf-8"
+
+
+def _is_continuation_byte(byte):
+    """
+    Return whether a byte continues a multibyte UTF-8 character.
+    """
+    return byte & 0b11000000 == 0b10000000
+
+
+def _translate_newlines(text):
+    """
+    Turn the CRLF and lone CR line endings in a string into newlines.
+    """
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+# pylint: disable=R0902
+class MmapStorage(TextStorage):
+    """
+    Store the text of a file by memory mapping it.
+
+    This storage is read only. Inserting or deleting raises a ValueError.
+
+    Attributes:
+        _path: A string representing the path of the mapped file.
+        _data: The mmap of the file, or empty bytes for an empty file.
+        _block_bytes: A list of ints representing the byte offset every indexed
+            block starts at. Has one more entry than there are indexed blocks.
+        _block_chars: A list of ints representing the character offset every
+            indexed block starts at.
+        _block_newlines: A list of ints representing the number of newlines
+            before every indexed block.
+        _block_ascii: A list of bools representing whether every indexed block
+            is pure ASCII with no carriage returns, in which case characters
+            and bytes line up.
+        _decoded: A tuple (block, string) of the last block decoded.
+        _cache: A string representing the materialized text, or None if it
+            has not been asked for.
+    """
+
+    def __init__(self, path):
+        """
+        Map a file.
+
+        Args:
+            path: A string representing the path of the file to map.
+        """
+        super().__init__()
+        self._path = path
+        with open(path, "rb") as disk_file:
+            try:
+                self._data = mmap.mmap(disk_file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                self._data = b""
+
+        self._block_bytes = [0]
+        self._block_chars = [0]
+        self._block_newlines = [0]
+        self._block_ascii = []
+        self._decoded = (None, "")
+        self._cache = None
+
+    @property
+    def path(self):
+        """
+        Return the path of the mapped file.
+        """
+        return self._path
+
+    @property
+    def indexed_bytes(self):
+        """
+        Return how many bytes of the file have been indexed so far.
+        """
+        return self._block_bytes[-1]
+
+    # Block index
+
+    def _index_next_block(self):
+        """
+        Index one more block of the file.
+
+        Returns:
+            A bool representing whether there was a block left to index.
+        """
+        data = self._data
+        start = self._block_bytes[-1]
+        if start >= len(data):
+            return False
+
+        # Never end a block in the middle of a character
+        end = min(start + BLOCK_SIZE, len(data))
+        while end < len(data) and _is_continuation_byte(data[end]):
+            end += 1
+        # Nor in the middle of a line ending
+        if end < len(data) and data[end-1:end+1] == b"\r\n":
+            end += 1
+
+        block = data[start:end]
+        if block.isascii() and b"\r" not in block:
+            chars = len(block)
+            newlines = block.count(b"\n")
+            self._block_ascii.append(True)
+        else:
+            text = _translate_newlines(block.decode(ENCODING,
+                                                    errors="replace"))
+            chars = len(text)
+            newlines = text.count("\n")
+            self._block_ascii.append(False)
+
+        self._block_bytes.append(end)
+        self._block_chars.append(self._block_chars[-1] + chars)
+        self._block_newlines.append(self._block_newlines[-1] + newlines)
+        return True
+
+    def _index_all(self):
+        """
+        Index every block of the file.
+        """
+        while self._index_next_block():
+            pass
+
+    def _block_of_char(self, pos):
+        """
+        Return the index of the block holding a character position.
+
+        Indexes blocks up to the position if needed. A position at or past the
+        end of the file is in the last block.
+        """
+        while (pos >= self._block_chars[-1]
+               and self._index_next_block()):
+            pass
+        block = bisect_right(self._block_chars, pos) - 1
+        return min(block, len(self._block_ascii) - 1)
+
+    def _block_text(self, block):
+        """
+        Return the decoded text of a block.
+
+        The last block decoded is kept, since lookups tend to hit the same
+        block over and over.
+        """
+        if self._decoded[0] != block:
+            data = self._data[self._block_bytes[block]:
+                              self._block_bytes[block+1]]
+            text = data.decode(ENCODING, errors="replace")
+            self._decoded = (block, _translate_newlines(text))
+        return self._decoded[1]
+
+    # Storage interface
+
+    def __len__(self):
+        self._index_all()
+        return self._block_chars[-1]
+
+    @property
+    def text(self):
+        if self._cache is None:
+            text = self._data[:].decode(ENCODING, errors="replace")
+            self._cache = _translate_newlines(text)
+        return self._cache
+
+    def clamp(self, pos):
+        # Index only as far as the position, so a position inside the file
+        # does not cost reading the rest of it
+        while pos > self._block_chars[-1] and self._index_next_block():
+            pass
+        return min(pos, self._block_chars[-1])
+
+    def slice(self, start, end):
+        if self._cache is not None:
+            return self._cache[start:end]
+        if start >= end or not self._data:
+            return ""
+
+        first = self._block_of_char(start)
+        last = self._block_of_char(end - 1)
+        block_start = self._block_chars[first]
+        if first == last and self._block_ascii[first]:
+            # Characters are bytes, so skip decoding the whole block
+            byte_start = self._block_bytes[first]
+            data = self._data[byte_start + start - block_start:
+                              byte_start + end - block_start]
+            return data.decode(ENCODING)
+
+        text = "".join(self._block_text(block)
+                       for block in range(first, last + 1))
+        return text[start-block_start:end-block_start]
+
+    def snapshot(self):
+        # The mapping is read only, so share it. The block index grows as it
+        # is read, so the snapshot gets its own copy.
+        snapshot = copy.copy(self)
+        snapshot._block_bytes = list(self._block_bytes)
+        snapshot._block_chars = list(self._block_chars)
+        snapshot._block_newlines = list(self._block_newlines)
+        snapshot._block_ascii = list(self._block_ascii)
+        return snapshot
+
+    def insert(self, pos, text):
+        raise ValueError(f"{self._path} is memory mapped read only")
+
+    def delete(self, start, end):
+        raise ValueError(f"{self._path} is memory mapped read only")
+
+    # Line lookups, answered from the block index.
+
+    def line_index(self):
+        return StorageLineIndex(self)
+
+    def newlines_before(self, pos):
+        if not self._data:
+            return 0
+        block = self._block_of_char(pos)
+        offset = pos - self._block_chars[block]
+        if self._block_ascii[block]:
+            byte_start = self._block_bytes[block]
+            in_block = self._data[byte_start:byte_start+offset].count(b"\n")
+        else:
+            in_block = self._block_text(block).count("\n", 0, offset)
+        return self._block_newlines[block] + in_block
+
+    def newline_count(self):
+        self._index_all()
+        return self._block_newlines[-1]
+
+    def line_start(self, line):
+        if line <= 0:
+            return 0
+
+        # Index until the block holding the newline ending the previous line
+        while (self._block_newlines[-1] < line
+               and self._index_next_block()):
+            pass
+        if self._block_newlines[-1] < line:
+            return self._block_chars[-1]
+
+        # The first block whose newlines reach line holds it.
+        block = bisect_right(self._block_newlines, line - 1) - 1
+        remaining = line - self._block_newlines[block]
+        if self._block_ascii[block]:
+            data = self._data
+            offset = self._block_bytes[block] - 1
+            for _ in range(remaining):
+                offset = data.find(b"\n", offset + 1)
+            return self._block_chars[block] + offset + 1 - \
+                self._block_bytes[block]
+
+        text = self._block_text(block)
+        offset = -1
+        for _ in range(remaining):
+            offset = text.index("\n", offset + 1)
+        return self._block_chars[block] + offset + 1
@@ -0,0 +1,237 @@
+"""
+Ring buffer text storage for Ihmacs buffers.
+
+Logs like *messages* are only ever added to at the end and cut from the start.
+A ring buffer storage keeps the text as a circular array of lines, so both of
+those cost O(1) per line however long the log is: appending fills in slots
+after the last line, and cutting whole lines off the start just moves the head
+of the ring along.
+
+Every line remembers where it starts. Starts are counted from the very first
+character ever stored rather than from the start of the text, so cutting lines
+off the start does not move the starts of the lines after them. Positions map
+onto lines by a binary search over the starts.
+
+Edits anywhere else are allowed, but rebuild the ring from scratch.
+"""
+
+from line_index import StorageLineIndex
+from text_storage import TextStorage
+
+
+# The number of lines the ring starts with room for. It doubles when it fills.
+MIN_CAPACITY = 64
+
+
+class RingStorage(TextStorage):
+    """
+    Store text in a ring buffer of lines.
+
+    Every line but the last ends with its newline. The last line has no
+    newline and may be empty, so there is always at least one line.
+
+    Attributes:
+        _lines: A list of strings used as a ring, holding the lines of the
+            text in order from _head. Unused slots hold None.
+        _starts: A list used as a ring alongside _lines, holding the start of
+            each line counted from the first character ever stored.
+        _head: An int representing the slot of the first line.
+        _count: An int representing the number of lines.
+        _base: An int representing the start of the first line counted from
+            the first character ever stored. Position 0 of the text.
+        _length: An int representing the number of characters stored.
+    """
+
+    def __init__(self, text=""):
+        super().__init__(text)
+        self._reset(text)
+
+    def _reset(self, text):
+        """
+        Fill the ring with text, dropping whatever it held.
+
+        Args:
+            text: A string representing the new text.
+        """
+        lines = text.split("\n")
+        capacity = MIN_CAPACITY
+        while capacity < len(lines):
+            capacity *= 2
+        self._lines = [None] * capacity
+        self._starts = [None] * capacity
+        self._lines[0] = ""
+        self._starts[0] = 0
+        self._head = 0
+        self._count = 1
+        self._base = 0
+        self._length = 0
+        self._append(text)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def text(self):
+        return "".join(self._line(index) for index in range(self._count))
+
+    @property
+    def capacity(self):
+        """
+        Return the number of lines the ring has room for before it grows.
+        """
+        return len(self._lines)
+
+    def _slot(self, index):
+        """
+        Return the slot in the ring holding a line.
+
+        Args:
+            index: An int representing a line, indexing at 0.
+        """
+        return (self._head + index) % len(self._lines)
+
+    def _line(self, index):
+        """
+        Return the text of a line, including its newline.
+        """
+        return self._lines[self._slot(index)]
+
+    def _start(self, index):
+        """
+        Return where a line starts, counted from the first character ever
+        stored.
+        """
+        return self._starts[self._slot(index)]
+
+    def _find(self, pos):
+        """
+        Return the line holding a position.
+
+        A position at the very end of the text is on the last line.
+
+        Args:
+            pos: An int representing a position in the text.
+
+        Returns:
+            An int representing a line, indexing at 0.
+        """
+        target = pos + self._base
+        low = 0
+        high = self._count
+        # Last line starting at or before target
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self._start(middle) <= target:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def _grow(self):
+        """
+        Double the room in the ring, moving the lines to the front.
+        """
+        capacity = len(self._lines)
+        order = [self._slot(index) for index in range(self._count)]
+        lines = [self._lines[slot] for slot in order]
+        starts = [self._starts[slot] for slot in order]
+        padding = [None] * (capacity * 2 - self._count)
+        self._lines = lines + padding
+        self._starts = starts + padding
+        self._head = 0
+
+    def _append(self, text):
+        """
+        Add text at the end.
+
+        Costs O(len(text)), however much text is stored.
+
+        Args:
+            text: A string to add.
+        """
+        if not text:
+            return
+        pieces = text.split("\n")
+        last = self._slot(self._count - 1)
+        self._lines[last] += pieces[0]
+        start = self._base + self._length + len(pieces[0])
+        for piece in pieces[1:]:
+            self._lines[self._slot(self._count - 1)] += "\n"
+            start += 1
+            if self._count == len(self._lines):
+                self._grow()
+            slot = self._slot(self._count)
+            self._lines[slot] = piece
+            self._starts[slot] = start
+            self._count += 1
+            start += len(piece)
+        self._length += len(text)
+
+    def _cut_front(self, end):
+        """
+        Delete the text before a position.
+
+        Whole lines are dropped from the ring, so this costs O(1) per line.
+
+        Args:
+            end: An int representing the position to delete up to.
+        """
+        if end <= 0:
+            return
+        last = self._find(end)
+        for _ in range(last):
+            slot = self._head
+            self._lines[slot] = None
+            self._starts[slot] = None
+            self._head = (slot + 1) % len(self._lines)
+            self._count -= 1
+        # A partial first line
+        slot = self._head
+        cut = end + self._base - self._starts[slot]
+        if cut:
+            self._lines[slot] = self._lines[slot][cut:]
+            self._starts[slot] += cut
+        self._base = self._starts[slot]
+        self._length -= end
+
+    def slice(self, start, end):
+        start = max(0, start)
+        end = min(end, self._length)
+        if start >= end:
+            return ""
+        first = self._find(start)
+        last = self._find(end - 1)
+        pieces = [self._line(index) for index in range(first, last + 1)]
+        text = "".join(pieces)
+        offset = self._start(first) - self._base
+        return text[start - offset:end - offset]
+
+    def insert(self, pos, text):
+        if pos == self._length:
+            self._append(text)
+            return
+        current = self.text
+        self._reset(current[:pos] + text + current[pos:])
+
+    def delete(self, start, end):
+        deleted = self.slice(start, end)
+        if start == 0:
+            self._cut_front(end)
+        elif start < end:
+            current = self.text
+            self._reset(current[:start] + current[end:])
+        return deleted
+
+    def line_index(self):
+        return StorageLineIndex(self)
+
+    def newlines_before(self, pos):
+        return self._find(min(max(0, pos), self._length))
+
+    def newline_count(self):
+        return self._count - 1
+
+    def line_start(self, line):
+        if line >= self._count:
+            return self._length
+        return self._start(line) - self._base
@@ -0,0 +1,343 @@
+"""
+Rope text storage for Ihmacs buffers.
+
+A rope stores text in the leaves of a balanced binary tree. Every node caches
+the length of its text and the number of newlines in it, so finding a position,
+a line, or a slice only walks one path from the root. Inserts and deletes
+rebuild only the nodes along that path.
+
+Nodes are never mutated once built. An edit returns a new root that shares all
+untouched nodes with the old one.
+"""
+
+from line_index import StorageLineIndex
+from text_storage import TextStorage
+
+
+# The largest number of characters stored in a single leaf.
+LEAF_SIZE = 2048
+
+
+# pylint: disable=R0903
+class RopeNode:
+    """
+    A node in a rope.
+
+    A node is either a leaf holding text, or a branch with a left and right
+    child. Nodes are immutable.
+
+    Attributes:
+        left: The left child node, or None if the node is a leaf.
+        right: The right child node, or None if the node is a leaf.
+        text: A string representing the text in a leaf, or None if the node is
+            a branch.
+        length: An int representing the number of characters under the node.
+        newlines: An int representing the number of newlines under the node.
+        height: An int representing the height of the node. Leaves have
+            height 0.
+    """
+
+    __slots__ = ("left", "right", "text", "length", "newlines", "height")
+
+    def __init__(self, left=None, right=None, text=None):
+        """
+        Initialize a rope node.
+
+        Pass text to create a leaf, or left and right to create a branch.
+
+        Args:
+            left: The left child node of a branch.
+            right: The right child node of a branch.
+            text: A string representing the text of a leaf.
+        """
+        self.left = left
+        self.right = right
+        self.text = text
+        if text is not None:
+            self.length = len(text)
+            self.newlines = text.count("\n")
+            self.height = 0
+        else:
+            self.length = left.length + right.length
+            self.newlines = left.newlines + right.newlines
+            self.height = 1 + max(left.height, right.height)
+
+
+def build_rope(text):
+    """
+    Build a balanced rope from a string.
+
+    Args:
+        text: A string representing the text to store.
+
+    Returns:
+        The root RopeNode of the rope, or None if text is empty.
+    """
+    nodes = [RopeNode(text=text[i:i+LEAF_SIZE])
+             for i in range(0, len(text), LEAF_SIZE)]
+    if not nodes:
+        return None
+
+    # Pair nodes up level by level until one is left.
+    while len(nodes) > 1:
+        paired = [RopeNode(nodes[i], nodes[i+1])
+                  for i in range(0, len(nodes) - 1, 2)]
+        if len(nodes) % 2 == 1:
+            paired.append(nodes[-1])
+        nodes = paired
+    return nodes[0]
+
+
+def _rotate_left(node):
+    """
+    Rotate a branch to the left.
+    """
+    right = node.right
+    return RopeNode(RopeNode(node.left, right.left), right.right)
+
+
+def _rotate_right(node):
+    """
+    Rotate a branch to the right.
+    """
+    left = node.left
+    return RopeNode(left.left, RopeNode(left.right, node.right))
+
+
+def _balance(node):
+    """
+    Restore the AVL balance of a branch whose children differ in height by 2.
+
+    Args:
+        node: A RopeNode whose children are balanced.
+
+    Returns:
+        A balanced RopeNode holding the same text.
+    """
+    if node.text is not None:
+        return node
+    skew = node.left.height - node.right.height
+    if skew > 1:
+        left = node.left
+        if left.right.height > left.left.height:
+            node = RopeNode(_rotate_left(left), node.right)
+        return _rotate_right(node)
+    if skew < -1:
+        right = node.right
+        if right.left.height > right.right.height:
+            node = RopeNode(node.left, _rotate_right(right))
+        return _rotate_left(node)
+    return node
+
+
+def join(left, right):
+    """
+    Concatenate two ropes, keeping the result balanced.
+
+    Costs O(difference in height of the two ropes). Two small leaves are merged
+    into one so edits do not leave a trail of tiny leaves behind.
+
+    Args:
+        left: The root RopeNode of the rope to put first, or None.
+        right: The root RopeNode of the rope to put second, or None.
+
+    Returns:
+        The root RopeNode of the concatenated rope, or None if both are empty.
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+
+    if (left.text is not None and right.text is not None
+            and left.length + right.length <= LEAF_SIZE):
+        return RopeNode(text=left.text + right.text)
+
+    if left.height > right.height + 1:
+        return _balance(RopeNode(left.left, join(left.right, right)))
+    if right.height > left.height + 1:
+        return _balance(RopeNode(join(left, right.left), right.right))
+    return RopeNode(left, right)
+
+
+def split(node, pos):
+    """
+    Split a rope in two at a position.
+
+    Args:
+        node: The root RopeNode of the rope to split, or None.
+        pos: An int representing where to split the rope.
+
+    Returns:
+        A tuple of two root RopeNodes (or None for empty ropes) holding the
+        text before and after pos.
+    """
+    if node is None:
+        return None, None
+    if pos <= 0:
+        return None, node
+    if pos >= node.length:
+        return node, None
+
+    if node.text is not None:
+        return (RopeNode(text=node.text[:pos]),
+                RopeNode(text=node.text[pos:]))
+
+    left_length = node.left.length
+    if pos < left_length:
+        left, middle = split(node.left, pos)
+        return left, join(middle, node.right)
+    middle, right = split(node.right, pos - left_length)
+    return join(node.left, middle), right
+
+
+class Rope(TextStorage):
+    """
+    Store text in a rope.
+
+    Inserts, deletes, slices, and line lookups all cost O(log n). This is
+    intended for very large buffers, where even a piece table degrades.
+
+    Attributes:
+        _root: The root RopeNode of the rope, or None if the rope is empty.
+        _cache: A string representing the materialized text, or None if the
+            rope has been edited since the text was last materialized.
+    """
+
+    def __init__(self, text=""):
+        super().__init__(text)
+        self._root = build_rope(text)
+        self._cache = None
+
+    def __len__(self):
+        root = self._root
+        return 0 if root is None else root.length
+
+    @property
+    def height(self):
+        """
+        Return the height of the rope tree.
+        """
+        root = self._root
+        return 0 if root is None else root.height
+
+    @property
+    def text(self):
+        if self._cache is None:
+            self._cache = self.slice(0, len(self))
+        return self._cache
+
+    def slice(self, start, end):
+        if self._cache is not None:
+            return self._cache[start:end]
+
+        parts = []
+        # Walk down the tree iteratively, collecting the leaves that overlap
+        # the requested span.
+        stack = [(self._root, 0)]
+        while stack:
+            node, node_start = stack.pop()
+            if node is None or end <= node_start:
+                continue
+            if node_start + node.length <= start:
+                continue
+            if node.text is not None:
+                parts.append(node.text[max(0, start-node_start):
+                                       end-node_start])
+                continue
+            # Push right first so the left is visited first
+            stack.append((node.right, node_start + node.left.length))
+            stack.append((node.left, node_start))
+        return "".join(parts)
+
+    def snapshot(self):
+        # Nodes are never modified, so a snapshot just shares the tree
+        snapshot = Rope()
+        snapshot._root = self._root
+        snapshot._cache = self._cache
+        return snapshot
+
+    def insert(self, pos, text):
+        if text == "":
+            return
+        self._root = self._insert(self._root, pos, text)
+        self._cache = None
+
+    def _insert(self, node, pos, text):
+        """
+        Return a new rope with text inserted at pos.
+
+        Text landing in a leaf with room to spare is spliced into that leaf,
+        so typing does not fragment the rope.
+        """
+        if node is None:
+            return build_rope(text)
+
+        if node.text is not None:
+            new_text = node.text[:pos] + text + node.text[pos:]
+            if len(new_text) <= LEAF_SIZE:
+                return RopeNode(text=new_text)
+            return build_rope(new_text)
+
+        left_length = node.left.length
+        if pos <= left_length:
+            return join(self._insert(node.left, pos, text), node.right)
+        return join(node.left, self._insert(node.right, pos - left_length,
+                                            text))
+
+    def delete(self, start, end):
+        if start >= end:
+            return ""
+        deleted_text = self.slice(start, end)
+        left, rest = split(self._root, start)
+        _, right = split(rest, end - start)
+        self._root = join(left, right)
+        self._cache = None
+        return deleted_text
+
+    # Line lookups. These use the newline counts cached in every node.
+
+    def line_index(self):
+        return StorageLineIndex(self)
+
+    def newlines_before(self, pos):
+        node = self._root
+        newlines = 0
+        while node is not None and pos > 0:
+            if node.text is not None:
+                return newlines + node.text.count("\n", 0, pos)
+            left = node.left
+            if pos <= left.length:
+                node = left
+            else:
+                newlines += left.newlines
+                pos -= left.length
+                node = node.right
+        return newlines
+
+    def newline_count(self):
+        root = self._root
+        return 0 if root is None else root.newlines
+
+    def line_start(self, line):
+        if line <= 0:
+            return 0
+        node = self._root
+        if node is None or line > node.newlines:
+            return len(self)
+
+        # Find the position just after the nth newline.
+        pos = 0
+        while node.text is None:
+            left = node.left
+            if line <= left.newlines:
+                node = left
+            else:
+                line -= left.newlines
+                pos += left.length
+                node = node.right
+
+        index = -1
+        for _ in range(line):
+            index = node.text.index("\n", index + 1)
+        return pos + index + 1
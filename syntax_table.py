@@ -0,0 +1,207 @@
+"""
+Syntax tables for major modes.
+
+A syntax table says what each character is to a mode: part of a word,
+whitespace, punctuation, an open or close paren, or a string quote. Commands
+that move by words or match parens ask the table instead of building patterns
+of their own, so a mode only has to say once what its characters are.
+
+Tables are built once, when the mode class is defined, along with the regexes
+commands use most. Characters a table does not list get a default class:
+whitespace for whitespace, word for everything else.
+
+Classes are written like in Emacs: a string whose first character is the
+class, and for parens, whose second character is the matching paren. So "()"
+is an open paren matched by ")".
+"""
+
+import re
+
+
+# Syntax classes
+WORD = "w"
+WHITESPACE = " "
+PUNCTUATION = "."
+OPEN = "("
+CLOSE = ")"
+STRING = "\""
+
+SYNTAX_CLASSES = (WORD, WHITESPACE, PUNCTUATION, OPEN, CLOSE, STRING)
+
+
+def _char_set(chars):
+    """
+    Return a regex character set matching any of a collection of characters.
+    """
+    return "[" + "".join(re.escape(char) for char in sorted(chars)) + "]"
+
+
+class SyntaxTable:
+    """
+    The syntax classes of characters for a mode.
+
+    Tables are not changed once made. Use extend to make a table for a mode
+    that differs from another in a few characters.
+
+    Attributes:
+        _entries: A dict mapping characters to their class strings, for the
+            characters that do not get the default class.
+        _regexes: A dict mapping frozensets of classes to compiled regexes
+            matching runs of characters in those classes.
+        word_classes: A tuple of the syntax classes words are made of.
+        word_regex: A compiled regex matching runs of characters in
+            word_classes.
+        word_delimiters_regex: A compiled regex matching runs of characters
+            in the other classes.
+        word_delimiters: A list of regexes each matching one character that
+            separates words, for code that builds its own patterns.
+        paren_regex: A compiled regex matching a single paren or string
+            quote.
+    """
+
+    def __init__(self, entries=None, word_classes=(WORD,)):
+        """
+        Initialize a syntax table.
+
+        Args:
+            entries: A dict mapping characters to class strings, such as
+                {"-": ".", "(": "()"}. Characters left out get the default
+                class.
+            word_classes: A collection of the syntax classes words are made
+                of. Word characters by default, but a mode may keep parens
+                and quotes in words too.
+
+        Raises:
+            ValueError: If a class string is not a known class, or a paren
+                has no matching paren.
+        """
+        entries = dict(entries or {})
+        for char, syntax in entries.items():
+            if syntax[:1] not in SYNTAX_CLASSES:
+                raise ValueError(f"Unknown syntax class {syntax!r} for "
+                                 f"{char!r}")
+            if syntax[0] in (OPEN, CLOSE) and len(syntax) < 2:
+                raise ValueError(f"Paren {char!r} has no matching paren")
+        self._entries = entries
+        self._regexes = {}
+        self.word_classes = tuple(word_classes)
+
+        # Precomputed for the commands that use them most
+        self.word_regex = self.runs_regex(self.word_classes)
+        others = [syntax for syntax in SYNTAX_CLASSES
+                  if syntax not in self.word_classes]
+        self.word_delimiters_regex = self.runs_regex(others)
+        self.word_delimiters = [r"\s"] + [
+            re.escape(char) for char, syntax in sorted(entries.items())
+            if syntax[0] in others and not char.isspace()]
+        self.paren_regex = re.compile(self.class_pattern([OPEN, CLOSE,
+                                                          STRING]))
+
+    def extend(self, entries):
+        """
+        Return a copy of the table with some characters changed.
+
+        The entries of the table are copied and the regexes of the new table
+        compiled. Modes call this once, when their class is defined, so none
+        of it is paid again per buffer or per command.
+
+        Args:
+            entries: A dict mapping characters to class strings, like for
+                __init__.
+
+        Returns:
+            A new SyntaxTable.
+        """
+        return SyntaxTable(self._entries | entries, self.word_classes)
+
+    def syntax(self, char):
+        """
+        Return the syntax class of a character.
+
+        Args:
+            char: A string of one character.
+
+        Returns:
+            A string of one character representing the class, such as WORD.
+        """
+        syntax = self._entries.get(char)
+        if syntax is not None:
+            return syntax[0]
+        if char.isspace():
+            return WHITESPACE
+        return WORD
+
+    def matching_paren(self, char):
+        """
+        Return the paren matching a paren.
+
+        Args:
+            char: A string of one character.
+
+        Returns:
+            A string representing the matching paren, or None if char is not
+            a paren.
+        """
+        syntax = self._entries.get(char)
+        if syntax is None or syntax[0] not in (OPEN, CLOSE):
+            return None
+        return syntax[1]
+
+    def class_pattern(self, classes):
+        """
+        Return a regex pattern matching one character in any of some classes.
+
+        Args:
+            classes: A collection of syntax class strings.
+
+        Returns:
+            A string representing an uncompiled regex.
+        """
+        classes = set(classes)
+        inside = {char for char, syntax in self._entries.items()
+                  if syntax[0] in classes}
+        outside = "".join(re.escape(char) for char in sorted(
+            set(self._entries) - inside))
+
+        # Characters with a default class are matched by a negated set that
+        # leaves out those listed otherwise. Listed characters the default
+        # would miss are added.
+        if WORD in classes and WHITESPACE in classes:
+            return f"[^{outside}]" if outside else r"[\s\S]"
+        if WORD in classes:
+            missed = {char for char in inside if char.isspace()}
+            default = f"[^\\s{outside}]"
+        elif WHITESPACE in classes:
+            missed = {char for char in inside if not char.isspace()}
+            if not any(char.isspace() for char in self._entries
+                       if char not in inside):
+                # Nothing to leave out, so one set does
+                return _char_set(missed).replace("[", r"[\s", 1)
+            default = f"[^\\S{outside}]"
+        else:
+            if not inside:
+                # Matches nothing
+                return "(?!)"
+            return _char_set(inside)
+        if not missed:
+            return default
+        return f"(?:{default}|{_char_set(missed)})"
+
+    def runs_regex(self, classes):
+        """
+        Return a compiled regex matching runs of characters in some classes.
+
+        Regexes are compiled once per table and set of classes.
+
+        Args:
+            classes: A collection of syntax class strings.
+
+        Returns:
+            A compiled regex.
+        """
+        key = frozenset(classes)
+        regex = self._regexes.get(key)
+        if regex is None:
+            regex = re.compile(self.class_pattern(key) + "+")
+            self._regexes[key] = regex
+        return regex
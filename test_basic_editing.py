@@ -4,8 +4,14 @@ Unit tests for editing commands.
 
 #pylint: skip-file
 
+import random
+import re
+import time
+
 import pytest
 
+import basic_editing
+from fundamental_mode import FundamentalMode
 from ihmacs_class import IhmacsSansCurses
 from buff import Buffer
 
@@ -28,16 +34,33 @@ from basic_editing import (
     previous_buffer,
     kill_buffer,
     kill_ihmacs,
+    save_some_buffers,
     newline,
+    narrow_to_region,
+    widen,
+    undo,
+    undo_redo,
     forward_char,
     backward_char,
     point_max,
     point_min,
     point_forward_by_delimiter,
     point_backward_by_delimiter,
+    next_line,
+    previous_line,
+    goto_line,
+    point_forward_by_list,
+    point_backward_by_list,
+    forward_list,
+    backward_list,
     beginning_of_buffer,
     end_of_buffer,
     thing_at_point_regex,
+    thing_at_point,
+    bounds_of_thing_at_point,
+    line_at_point,
+    word_at_point,
+    THING_PATTERNS,
     kill_append,
     kill_ring_save,
     kill_forward_by_delimiter,
@@ -87,7 +110,9 @@ def ihmacs_state(request, buff, kill_ring):
     """
     Return an Ihmacs instance in some original state.
 
-    The instance has N identical buffers.
+    The instance has N buffers. The first is buff and is active, the rest are
+    indirect buffers of it. Buffer names are unique, so one buffer cannot be
+    added N times.
 
     Args:
         buff: A buffer instance in some original state.
@@ -97,7 +122,13 @@ def ihmacs_state(request, buff, kill_ring):
 
     # The empty list would be argparse files
     ihmacs = IhmacsSansCurses([])
-    ihmacs._buffers = [buff] * num_buffers
+    ihmacs.kill_buffer(0)  # The scratch buffer
+    for i in range(num_buffers):
+        if i == 0:
+            ihmacs.add_buffer(buff)
+        else:
+            ihmacs.add_buffer(Buffer(name=f"{buff.name}<{i+1}>", base=buff))
+    ihmacs.switch_buffer(0)
     ihmacs.kill_ring = kill_ring
     return ihmacs
 
@@ -198,6 +229,52 @@ def test_self_insert_command(ihmacs_state, keychord):
             and og_point == new_point-1)
 
 
+@pytest.mark.parametrize("char", ["a", "7", " ", "-"])
+def test_self_insert_command_num(char, times):
+    """
+    Test that self_insert_command with a prefix argument inserts that many
+    copies of the character.
+
+    Args:
+        char: A string representing the key typed.
+        times: An integer representing how many copies to insert.
+    """
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = "xyz"
+    buff.set_point(1)
+
+    ihmacs.keychord = ["C-u", str(times), char]
+    self_insert_command(ihmacs, num=times)
+
+    assert buff.text == "x" + char * times + "yz"
+    assert buff.point == 1 + times
+
+
+def test_prefix_arg_bulk(monkeypatch):
+    """
+    Check that a large prefix argument is one edit or one move, not one per
+    repeat.
+    """
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    inserts = []
+    real_insert = buff.insert
+    monkeypatch.setattr(buff, "insert",
+                        lambda text: inserts.append(text) or real_insert(text))
+    ihmacs.keychord = ["C-u", "1", "0", "0", "0", "0", "0", "a"]
+    self_insert_command(ihmacs, num=100000)
+    assert len(inserts) == 1
+    assert buff.text == "a" * 100000
+
+    buff._text = "ab\n" * 10000
+    buff.set_point(1)
+    next_line(ihmacs, 5000)
+    assert buff.point == 5000 * 3 + 1
+    next_line(ihmacs, -5000)
+    assert buff.point == 1
+
+
 # insert
 def test_insert(ihmacs_state, insert_string):
     """
@@ -390,6 +467,44 @@ def test_kill_ihmacs(ihmacs_state):
     assert ihmacs_state.end_session
 
 
+# save_some_buffers
+def test_save_some_buffers(monkeypatch, tmp_path):
+    """
+    Check that saving every buffer returns at once and reports from the
+    editing loop, and that a file shared by indirect buffers is saved once.
+    """
+    messages = []
+    monkeypatch.setattr(basic_editing, "message",
+                        lambda ihmacs_state, string: messages.append(string))
+    ihmacs = IhmacsSansCurses([])
+    base = Buffer(name="base", path=str(tmp_path / "base.txt"))
+    base.insert("base text")
+    ihmacs.add_buffer(base)
+    ihmacs.add_buffer(Buffer(name="indirect", path=base.path, base=base))
+    other = Buffer(name="other", path=str(tmp_path / "other.txt"))
+    other.insert("other text")
+    ihmacs.add_buffer(other)
+    saves = []
+    real_save = Buffer.save_buffer
+    monkeypatch.setattr(Buffer, "save_buffer",
+                        lambda buff: saves.append(buff.name)
+                        or real_save(buff))
+
+    save_some_buffers(ihmacs)
+    assert sorted(saves) == ["base", "other"]
+    assert messages == []
+
+    # Done callbacks may run just after the result is set
+    for _ in range(500):
+        ihmacs.run_pending()
+        if messages:
+            break
+        time.sleep(0.01)
+    assert len(messages) == 1
+    assert messages[0].startswith("Saved 2 buffers")
+    assert (tmp_path / "base.txt").read_text() == "base text"
+
+
 # newline
 def test_newline(ihmacs_state, times):
     """
@@ -409,6 +524,27 @@ def test_newline(ihmacs_state, times):
     assert expected_string == buff.text[og_point:new_point]
 
 
+# undo and undo_redo
+def test_undo_redo(ihmacs_state, insert_string):
+    """
+    Test that undo takes back an insert and undo_redo puts it back.
+
+    Args:
+        ihmacs_state An instance of IhmacsSansCurses.
+        insert_string: A string to insert.
+    """
+    buff = ihmacs_state.active_buff()
+    og_text = buff.text
+    insert(ihmacs_state, insert_string + "!")
+    new_text = buff.text
+    buff.undo_boundary()
+
+    undo(ihmacs_state)
+    assert buff.text == og_text
+    undo_redo(ihmacs_state)
+    assert buff.text == new_text
+
+
 # forward_char
 def test_forward_char(ihmacs_state, times):
     """
@@ -485,6 +621,32 @@ def test_beginning_of_buffer(ihmacs_state):
     assert 0 == buff.point
 
 
+# narrow_to_region and widen
+def test_narrow_to_region(ihmacs_state):
+    """
+    Test that motion commands stay inside the region once narrowed.
+
+    Args:
+        ihmacs_state: An instance of IhmacsSansCurses.
+    """
+    buff = ihmacs_state.active_buff()
+    buff._text = LOREM_IPSUM
+    buff.set_point(70)
+    buff.set_mark(138)
+    narrow_to_region(ihmacs_state)
+
+    beginning_of_buffer(ihmacs_state)
+    assert buff.point == 70
+    end_of_buffer(ihmacs_state)
+    assert buff.point == 138
+    # The word "minim" is cut off by the end of the region
+    assert thing_at_point_regex(ihmacs_state, re.compile(r"\w+")) == "min"
+
+    widen(ihmacs_state)
+    end_of_buffer(ihmacs_state)
+    assert buff.point == len(buff.text)
+
+
 # end_of_buffer
 def test_end_of_buffer(ihmacs_state):
     """
@@ -499,6 +661,324 @@ def test_end_of_buffer(ihmacs_state):
     assert expected_point == buff.point
 
 
+# point_forward_by_delimiter and point_backward_by_delimiter
+def delimiter_ends_by_scan(buff, delimiter_regex):
+    """
+    Return every delimiter match in the accessible text, found by scanning all
+    of it, the way delimiter motion used to.
+    """
+    return list(delimiter_regex.finditer(buff.text, buff.point_min,
+                                         buff.point_max))
+
+
+delimiter_regexes = [
+    FundamentalMode().word_delimiters_regex,
+    re.compile("\n+"),
+]
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("delimiter_regex", delimiter_regexes)
+def test_point_by_delimiter(monkeypatch, seed, delimiter_regex):
+    """
+    Check that searching outward from point in small windows finds the same
+    units as scanning the whole accessible text.
+
+    Args:
+        monkeypatch: The pytest monkeypatch fixture.
+        seed: An int seeding the random text and positions.
+        delimiter_regex: A compiled regex of delimiters.
+    """
+    monkeypatch.setattr(basic_editing, "MOTION_WINDOW", 3)
+    rng = random.Random(seed)
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = "".join(rng.choice("ab -_\n") for _ in range(200))
+    if seed % 2:
+        buff.narrow(rng.randint(0, 50), rng.randint(150, 200))
+
+    for _ in range(50):
+        point = rng.randint(buff.point_min, buff.point_max)
+        num = rng.randint(1, 6)
+        buff.set_point(point)
+        matches = delimiter_ends_by_scan(buff, delimiter_regex)
+
+        unit_ends = [match.start() for match in matches
+                     if match.start() > point]
+        expected = (unit_ends[num - 1] if len(unit_ends) >= num
+                    else buff.point_max)
+        assert point_forward_by_delimiter(
+            ihmacs, delimiter_regex, num) == expected
+
+        unit_starts = [match.end() for match in matches
+                       if match.end() < point]
+        expected = (unit_starts[-num] if len(unit_starts) >= num
+                    else buff.point_min)
+        assert point_backward_by_delimiter(
+            ihmacs, delimiter_regex, num) == expected
+        assert point_forward_by_delimiter(
+            ihmacs, delimiter_regex, -num) == expected
+
+
+# next_line, previous_line, and goto_line
+def line_move_by_text(text, point, column, num):
+    """
+    Return where moving num lines from point should land, aiming for column,
+    worked out from the text alone.
+    """
+    lines = text.split("\n")
+    starts = [0]
+    for line in lines[:-1]:
+        starts.append(starts[-1] + len(line) + 1)
+    line = text.count("\n", 0, point) + num
+    if line < 0:
+        return 0
+    if line >= len(lines):
+        return len(text)
+    return starts[line] + min(column, len(lines[line]))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_next_and_previous_line(seed):
+    """
+    Check vertical motion against the text, with the column aimed for kept
+    across a run of moves.
+
+    Args:
+        seed: An int seeding the random text and moves.
+    """
+    rng = random.Random(seed)
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    text = "\n".join("x" * rng.randint(0, 12) for _ in range(40))
+    buff._text = text
+    buff.set_point(rng.randint(0, len(text)))
+    column = buff.column
+    for _ in range(30):
+        num = rng.choice([-3, -2, -1, 1, 2, 3])
+        expected = line_move_by_text(text, buff.point, column, num)
+        if num > 0:
+            next_line(ihmacs, num)
+        else:
+            previous_line(ihmacs, -num)
+        assert buff.point == expected
+
+
+def test_goal_column_reset():
+    """
+    Check that the goal column is forgotten once point moves some other way,
+    or the text changes.
+    """
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = "long line\nab\nlong line"
+    buff.set_point(7)
+    next_line(ihmacs)
+    assert buff.point == 12
+    next_line(ihmacs)
+    assert buff.point == 20
+
+    buff.set_point(12)
+    next_line(ihmacs)
+    assert buff.point == 15
+
+    buff.set_point(7)
+    next_line(ihmacs)
+    buff.append("!")
+    next_line(ihmacs)
+    assert buff.point == 15
+
+
+def test_goto_line():
+    """
+    Check that goto_line goes to the start of a line, counting from the start
+    of the accessible part.
+    """
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = "one\ntwo\nthree\nfour"
+    goto_line(ihmacs, 3)
+    assert buff.point == 8
+    goto_line(ihmacs, 0)
+    assert buff.point == 0
+    goto_line(ihmacs, 10)
+    assert buff.point == len(buff.text)
+
+    buff.narrow(4, 14)
+    goto_line(ihmacs, 2)
+    assert buff.point == 8
+    goto_line(ihmacs, 5)
+    assert buff.point == 14
+
+
+# point_forward_by_list and point_backward_by_list
+list_cases = [
+    ("(a b) c", 0, 1, 5),
+    ("(a (b [c]) {d}) e", 0, 1, 15),
+    ("(a (b [c]) {d}) e", 3, 1, 10),
+    ("(a (b [c]) {d}) e", 3, 2, 14),
+    ("x (a) (b) (c)", 0, 3, 13),
+    ("(a \")\" b)", 0, 1, 9),
+    ("(a b] c", 0, 1, None),
+    ("(a b", 0, 1, None),
+    ("a) b", 0, 1, None),
+    ("(a) b", 0, 2, None),
+    ("(a b) c", 2, 1, None),
+    ("(a b) c", 0, 0, 0),
+]
+
+
+@pytest.mark.parametrize("text,point,num,result", list_cases)
+def test_point_forward_by_list(monkeypatch, text, point, num, result):
+    """
+    Check moving forward over balanced groups of parens, with strings hiding
+    the parens inside them.
+    """
+    monkeypatch.setattr(basic_editing, "MOTION_WINDOW", 2)
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = text
+    buff.set_point(point)
+    assert point_forward_by_list(ihmacs, num) == result
+
+
+@pytest.mark.parametrize("text,point,num,result", list_cases)
+def test_point_backward_by_list(monkeypatch, text, point, num, result):
+    """
+    Check that moving backward over the group just moved over forward comes
+    back to where it started.
+    """
+    if result is None or num == 0:
+        return
+    monkeypatch.setattr(basic_editing, "MOTION_WINDOW", 2)
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = text
+    buff.set_point(point)
+    starts = []
+    for _ in range(num):
+        forward_list(ihmacs)
+        starts.append(point_backward_by_list(ihmacs))
+    assert point_backward_by_list(ihmacs, num) == starts[0]
+    assert point_forward_by_list(ihmacs, -1) == starts[-1]
+    backward_list(ihmacs)
+    assert buff.point == starts[-1]
+
+
+def test_list_motion_unbalanced(monkeypatch):
+    """
+    Check that point stays put if the parens do not balance.
+    """
+    messages = []
+    monkeypatch.setattr(basic_editing, "message",
+                        lambda ihmacs_state, string: messages.append(string))
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = "(a] b)"
+    forward_list(ihmacs)
+    assert buff.point == 0
+    buff.set_point(len(buff.text))
+    backward_list(ihmacs)
+    assert buff.point == len(buff.text)
+    assert messages == ["Unbalanced parentheses"] * 2
+
+
+# thing_at_point
+thing_tokens = ["a", "bc", " ", " ", ".", "!", "?", "\n", "\n", "\t", "-",
+                ":", "http://x.y/z", "'", "\"", ")"]
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("thing", list(THING_PATTERNS))
+def test_thing_at_point_windowed(monkeypatch, seed, thing):
+    """
+    Check that searching a small window around point finds the same thing as
+    searching the whole accessible text.
+
+    Args:
+        monkeypatch: The pytest monkeypatch fixture.
+        seed: An int seeding the random text and positions.
+        thing: A string naming a kind of thing.
+    """
+    monkeypatch.setattr(basic_editing, "THING_WINDOW", 2)
+    rng = random.Random(seed)
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = "".join(rng.choice(thing_tokens) for _ in range(150))
+    if seed % 2:
+        buff.narrow(rng.randint(0, 40), rng.randint(120, len(buff.text)))
+    pattern, _ = THING_PATTERNS[thing]
+    if callable(pattern):
+        pattern = pattern(buff)
+    text = buff.substring(buff.point_min, buff.point_max)
+
+    for _ in range(30):
+        point = rng.randint(buff.point_min, buff.point_max)
+        buff.set_point(point)
+        offset = point - buff.point_min
+        expected = None
+        for unit in pattern.finditer(text):
+            start, end = unit.span()
+            if start <= offset <= end:
+                expected = (start + buff.point_min, end + buff.point_min)
+                break
+        assert bounds_of_thing_at_point(ihmacs, thing) == expected
+
+
+thing_cases = [
+    ("word", 12, "brown"),
+    ("symbol", 28, "set-point"),
+    ("line", 8, "The quick brown fox. It (set-point) jumps?"),
+    ("sentence", 8, "The quick brown fox."),
+    ("sentence", 38, "It (set-point) jumps?"),
+    ("sentence", 50, "Over the dog."),
+    ("sentence", 60, "See http://example.com/a_b."),
+    ("paragraph", 46, "The quick brown fox. It (set-point) jumps?\n"
+                      "Over the dog.\n"),
+    ("paragraph", 70, "See http://example.com/a_b."),
+    ("url", 69, "http://example.com/a_b"),
+    ("url", 8, ""),
+]
+
+
+@pytest.mark.parametrize("thing,point,result", thing_cases)
+def test_thing_at_point(thing, point, result):
+    """
+    Check each kind of thing on a small text.
+
+    Args:
+        thing: A string naming a kind of thing.
+        point: An int representing where to put point.
+        result: A string representing the thing expected at point.
+    """
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = ("The quick brown fox. It (set-point) jumps?\n"
+                  "Over the dog.\n"
+                  "\n"
+                  "See http://example.com/a_b.")
+    buff.set_point(point)
+    assert thing_at_point(ihmacs, thing) == result
+
+
+def test_new_thing(monkeypatch):
+    """
+    Check that new kinds of things can be added, and that words and lines
+    still work through the old helpers.
+    """
+    number = (re.compile(r"\d+"), basic_editing.WHITESPACE_BOUNDARY)
+    monkeypatch.setitem(THING_PATTERNS, "number", number)
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    buff._text = "line 1234 here\nnext"
+    buff.set_point(7)
+    assert thing_at_point(ihmacs, "number") == "1234"
+    assert word_at_point(ihmacs) == "1234"
+    assert line_at_point(ihmacs) == "line 1234 here"
+    with pytest.raises(KeyError):
+        thing_at_point(ihmacs, "nothing")
+
+
 # kill_append
 def test_kill_append(ihmacs_state, insert_string):
     """
@@ -10,7 +10,12 @@ being used by the project.
 
 import pytest
 
+import buff as buff_module
 from buff import Buffer
+from ring_storage import RingStorage
+from rope import Rope
+from text_storage import PieceTable
+from utf8_storage import Utf8Storage
 
 
 LOREM_IPSUM = (
@@ -671,3 +676,534 @@ def test_append_modified(buff, insert_string):
     """
     buff.append(insert_string)
     assert buff.modified
+
+
+# lines
+def test_lines(buff):
+    """
+    Check that every range of lines matches splitting the text on newlines.
+
+    Args:
+        buff: An Ihmacs buffer.
+    """
+    split_text = buff.text.split("\n")
+    for start in range(1, len(split_text) + 2):
+        for end in range(start, len(split_text) + 3):
+            assert buff.lines(start, end) == split_text[start-1:end-1]
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 10000])
+def test_iter_chunks_and_lines(buff, size, monkeypatch):
+    """
+    Check that streaming the text in chunks and lines matches slicing and
+    splitting it, including lines spread over several chunks.
+
+    Args:
+        buff: An Ihmacs buffer.
+        size: An int representing the number of characters in a chunk.
+    """
+    text = buff.text
+    chunks = list(buff.iter_chunks(10, 400, size))
+    assert "".join(chunks) == text[10:400]
+    assert all(0 < len(chunk) <= size for chunk in chunks)
+    assert "".join(buff.iter_chunks(size=size)) == text
+
+    monkeypatch.setattr(buff_module, "CHUNK_SIZE", size)
+    assert list(buff.iter_lines()) == text.split("\n")
+    assert list(buff.iter_lines(3)) == text.split("\n")[2:]
+    assert list(buff.snapshot().iter_lines(2, 5)) == text.split("\n")[1:4]
+
+    buff.narrow(100, 300)
+    assert "".join(buff.iter_chunks()) == text[100:300]
+    assert list(buff.iter_lines()) == text[100:300].split("\n")
+
+
+def test_iter_lines_empty():
+    """
+    Check that an empty buffer has one empty line.
+    """
+    buff = Buffer()
+    assert list(buff.iter_lines()) == [""]
+    assert list(buff.iter_lines(2)) == []
+
+
+@pytest.mark.parametrize("storage", [PieceTable, RingStorage])
+def test_trim_lines(storage):
+    """
+    Check that trimming keeps the newest lines of a log, with point and mark
+    staying on the text they were on.
+    """
+    buff = Buffer(storage=storage, read_only=True)
+    buff.append("first\nsecond\n")
+    assert buff.trim_lines(5) == ""
+    buff.set_point(buff.line_start(2))
+    for number in range(200):
+        buff.append(f"message {number}\n")
+        buff.trim_lines(3)
+    assert buff.text == "message 197\nmessage 198\nmessage 199\n"
+    assert buff.line_count == 4
+    assert buff.point == 0
+    buff.set_point(buff.line_start(4))
+    buff.append("partial")
+    assert buff.trim_lines(1) == "message 197\nmessage 198\n"
+    assert buff.text == "message 199\npartial"
+    assert buff.point == 12
+
+
+# line_start and line_end
+def test_line_start_end(buff):
+    """
+    Check the start and end of every line against the text.
+
+    Args:
+        buff: An Ihmacs buffer.
+    """
+    text = buff.text
+    start = 0
+    for line, line_text in enumerate(text.split("\n"), start=1):
+        assert buff.line_start(line) == start
+        assert buff.line_end(line) == start + len(line_text)
+        assert buff.text[start:start+len(line_text)] == line_text
+        start += len(line_text) + 1
+    assert buff.line_start(buff.line_count + 1) == len(text)
+
+
+# Line and column
+def test_line_column(buff):
+    """
+    Check line and column of point against counting in the text.
+
+    Args:
+        buff: An Ihmacs buffer.
+    """
+    text_before_point = buff.text[:buff.point]
+    assert buff.line == text_before_point.count("\n") + 1
+    assert buff.column == len(text_before_point.split("\n")[-1])
+
+
+# revert
+def test_revert_rope_threshold(tmp_path, monkeypatch):
+    """
+    Check that reverting a file above the size threshold loads a rope.
+    """
+    path = tmp_path / "big.txt"
+    path.write_text(LOREM_IPSUM)
+
+    small_buff = Buffer(path=str(path))
+    small_buff.revert()
+    assert not isinstance(small_buff._shared.storage, Rope)
+
+    monkeypatch.setattr(buff_module, "ROPE_THRESHOLD", len(LOREM_IPSUM) - 1)
+    big_buff = Buffer(path=str(path))
+    big_buff.revert()
+    assert isinstance(big_buff._shared.storage, Rope)
+    assert big_buff.text == LOREM_IPSUM
+    assert big_buff.line_count == LOREM_IPSUM.count("\n") + 1
+
+
+def test_revert_utf8_storage(tmp_path):
+    """
+    Check that a buffer holding UTF-8 bytes loads its file as bytes.
+    """
+    path = tmp_path / "wide.txt"
+    path.write_text(LOREM_IPSUM + "😀")
+    buff = Buffer(path=str(path), storage=Utf8Storage)
+    buff.revert()
+    assert isinstance(buff._shared.storage, Utf8Storage)
+    assert buff.text == LOREM_IPSUM + "😀"
+
+
+# apply_edits
+edits_params = [
+    [],
+    [(10, 10, "a")],
+    [(10, 10, "a"), (10, 10, "b"), (3, 7, "")],
+    [(0, 5, "start"), (64, 64, "\n"), (200, 210, "replaced")],
+    [(445, 445, "end"), (0, 0, "beginning")],
+    [(100, 140, ""), (140, 140, "x"), (300, 400, "yz\n")],
+    [(60, 70, "in"), (130, 140, "many\nlines\n")],
+]
+
+
+@pytest.fixture(params=edits_params)
+def edits(request):
+    """
+    Return a list of (start, end, text) edits that do not overlap.
+    """
+    return request.param
+
+
+def apply_one_by_one(text, point, mark, edits):
+    """
+    Apply edits to text one at a time from the back, tracking point and mark.
+
+    Inserts at the same position are joined first, in the order given.
+
+    Returns:
+        A tuple (text, point, mark) after the edits.
+    """
+    joined = {}
+    for start, end, new in edits:
+        key = (start, end)
+        joined[key] = joined.get(key, "") + new
+
+    for (start, end), new in sorted(joined.items(), reverse=True):
+        text = text[:start] + new + text[end:]
+        delta = len(new) - (end - start)
+        point = (start + len(new) if start <= point <= end
+                 else point + delta if point > end else point)
+        mark = (start if start <= mark <= end
+                else mark + delta if mark > end else mark)
+    return text, point, mark
+
+
+def test_apply_edits(buff, edits):
+    """
+    Check text, point, and mark after applying edits in one go.
+
+    Args:
+        buff: An Ihmacs buffer.
+        edits: A list of edits to apply.
+    """
+    expected = apply_one_by_one(buff.text, buff.point, buff.mark, edits)
+    deleted = buff.apply_edits(edits)
+
+    assert (buff.text, buff.point, buff.mark) == expected
+    assert "".join(deleted) == "".join(LOREM_IPSUM[start:end]
+                                       for start, end, _ in sorted(edits))
+    assert buff.modified == bool(edits)
+    assert buff.line_count == buff.text.count("\n") + 1
+
+
+def test_apply_edits_same_position(buff):
+    """
+    Check that inserts at the same position keep the order they were given.
+    """
+    buff.apply_edits([(5, 5, "a"), (5, 5, "b"), (5, 5, "c")])
+    assert buff.text == LOREM_IPSUM[:5] + "abc" + LOREM_IPSUM[5:]
+
+
+def test_apply_edits_overlap(buff):
+    """
+    Check that overlapping edits are refused and leave the buffer alone.
+    """
+    with pytest.raises(ValueError):
+        buff.apply_edits([(5, 10, ""), (8, 12, "x")])
+    assert buff.text == LOREM_IPSUM
+    assert not buff.modified
+
+
+def test_apply_edits_read_only(buff_read_only, edits):
+    """
+    Check that edits to a read only buffer do nothing.
+    """
+    assert buff_read_only.apply_edits(edits) is False
+    assert buff_read_only.text == LOREM_IPSUM
+
+
+def test_transaction(buff):
+    """
+    Check that a transaction applies its edits when the block ends.
+    """
+    with buff.transaction() as edits:
+        edits.insert(0, "first ")
+        edits.delete(6, 12)
+        edits.replace(64, 65, " ")
+        assert buff.text == LOREM_IPSUM
+    assert buff.text == ("first " + LOREM_IPSUM[:6] + LOREM_IPSUM[12:64] +
+                         " " + LOREM_IPSUM[65:])
+
+
+def test_transaction_exception(buff):
+    """
+    Check that a transaction whose block raises applies nothing.
+    """
+    with pytest.raises(RuntimeError):
+        with buff.transaction() as edits:
+            edits.insert(0, "never")
+            raise RuntimeError
+    assert buff.text == LOREM_IPSUM
+    assert not buff.modified
+
+
+# snapshot
+def test_snapshot(buff):
+    """
+    Check that a snapshot keeps the text, point, and mark it was taken with.
+    """
+    text = buff.text
+    point = buff.point
+    snapshot = buff.snapshot()
+
+    buff.insert("edit")
+    buff.apply_edits([(0, 10, ""), (200, 200, "\n")])
+    assert snapshot.text == text
+    assert snapshot.length == len(text)
+    assert snapshot.point == point
+    assert snapshot.substring(5, 30) == text[5:30]
+    assert snapshot.lines(2, 4) == text.split("\n")[1:3]
+    assert snapshot.line_count == text.count("\n") + 1
+    assert "".join(snapshot.iter_chunks(7)) == text[7:]
+
+
+# Indirect buffers
+def test_indirect_buffer(buff):
+    """
+    Check that an indirect buffer shares text but not point, mark, or view.
+    """
+    indirect = Buffer(name="indirect", base=buff)
+    assert indirect.base is buff
+    assert indirect.text == buff.text
+    assert (indirect.point, indirect.mark) == (buff.point, buff.mark)
+
+    point = buff.point
+    indirect.set_point(0)
+    indirect.insert("from indirect ")
+    assert buff.text == indirect.text
+    assert buff.point == point + len("from indirect ")
+    assert indirect.point == len("from indirect ")
+
+    buff.set_point(buff.length)
+    buff.insert("\nfrom base")
+    assert indirect.text.endswith("\nfrom base")
+    assert indirect.point == len("from indirect ")
+
+    indirect.scroll_buffer(3)
+    assert buff.display_line == 1
+    assert indirect.modified and buff.modified
+
+    # Indirect buffers of indirect buffers share with the base
+    assert Buffer(base=indirect).base is buff
+
+
+# Narrowing
+narrow_params = [(0, 0), (64, 135), (70, 300), (135, 64), (420, 445), (0, 445)]
+
+
+@pytest.fixture(params=narrow_params)
+def region(request):
+    """
+    Return a tuple (start, end) of a region to narrow to.
+    """
+    return request.param
+
+
+def test_narrow_bounds(buff, region):
+    """
+    Check that point and mark cannot leave the region.
+    """
+    start, end = sorted(region)
+    buff.narrow(*region)
+    assert (buff.point_min, buff.point_max) == (start, end)
+    assert start <= buff.point <= end
+    assert start <= buff.mark <= end
+
+    buff.set_point(0)
+    assert buff.point == start
+    buff.set_point(10000)
+    assert buff.point == end
+    assert buff.delete_char(5) == ""
+
+
+def test_narrow_lines(buff, region):
+    """
+    Check that lines count from the start of the region.
+    """
+    start, end = sorted(region)
+    buff.narrow(*region)
+    accessible = LOREM_IPSUM[start:end]
+    split_text = accessible.split("\n")
+
+    assert buff.line_count == len(split_text)
+    assert buff.lines(1, len(split_text) + 2) == split_text
+    assert buff.lines(2, 3) == split_text[1:2]
+    assert buff.line_start(1) == start
+    assert buff.line_end(len(split_text)) == end
+
+    buff.set_point(end)
+    assert buff.line == len(split_text)
+    assert buff.column == len(split_text[-1])
+    assert buff.modeline[1].endswith("Narrow")
+
+
+def test_narrow_insert_at_end(buff):
+    """
+    Check that text inserted at the end of the region goes inside it.
+    """
+    buff.narrow(64, 135)
+    buff.set_point(135)
+    buff.insert("more")
+    assert buff.point_max == 139
+    buff.set_point(0)
+    buff.insert("less")
+    assert (buff.point_min, buff.point_max) == (64, 143)
+
+
+def test_widen(buff, region):
+    """
+    Check that widening makes the whole buffer accessible again.
+    """
+    buff.narrow(*region)
+    buff.widen()
+    assert not buff.narrowed
+    assert (buff.point_min, buff.point_max) == (0, len(LOREM_IPSUM))
+    assert buff.line_count == LOREM_IPSUM.count("\n") + 1
+    assert len(buff._shared.markers) == 2
+
+
+# Change hooks and modification tick
+@pytest.fixture
+def changes(buff):
+    """
+    Return a list that every change to buff is logged into.
+
+    Each change is logged as ("before" or "after", start, old_end, new_end,
+    text of the buffer at the time).
+    """
+    log = []
+    buff.before_change.append(
+        lambda *change: log.append(("before", *change, buff.text)))
+    buff.after_change.append(
+        lambda *change: log.append(("after", *change, buff.text)))
+    return log
+
+
+def test_change_hooks_insert(buff, changes, insert_string):
+    """
+    Check the hooks and tick around an insert.
+    """
+    point = buff.point
+    tick = buff.modification_tick
+    text = buff.text
+    buff.insert(insert_string)
+
+    if not insert_string:
+        assert changes == []
+        assert buff.modification_tick == tick
+        return
+    change = (point, point, point + len(insert_string))
+    assert changes == [("before", *change, text),
+                       ("after", *change, buff.text)]
+    assert buff.modification_tick == tick + 1
+
+
+def test_change_hooks_delete(buff, changes, chars):
+    """
+    Check the hooks around deleting characters and the region.
+    """
+    start, end = sorted((buff.point, max(0, min(buff.point + chars, 445))))
+    deleted = buff.delete_char(chars)
+    if deleted:
+        assert changes[-1][:4] == ("after", start, end, start)
+
+    changes.clear()
+    start, end = sorted((buff.point, buff.mark))
+    deleted = buff.delete_region()
+    if deleted:
+        assert [change[:4] for change in changes] == [
+            ("before", start, end, start), ("after", start, end, start)]
+
+
+def test_change_hooks_append_and_revert(tmp_path, buff, changes):
+    """
+    Check the hooks around appending and reverting.
+    """
+    buff.append("end")
+    assert changes[-1][:4] == ("after", 445, 445, 448)
+
+    path = tmp_path / "file.txt"
+    path.write_text("on disk")
+    buff._path = str(path)
+    tick = buff.modification_tick
+    buff.revert()
+    assert [change[:4] for change in changes[-2:]] == [
+        ("before", 0, 448, 7), ("after", 0, 448, 7)]
+    assert buff.modification_tick == tick + 1
+
+
+def test_change_hooks_batched(buff, changes):
+    """
+    Check that edits applied together are reported as one covering change.
+    """
+    buff.apply_edits([(10, 20, ""), (30, 30, "abc"), (100, 101, "xy")])
+    assert [change[:4] for change in changes] == [
+        ("before", 10, 101, 95), ("after", 10, 101, 95)]
+
+
+# Text properties and overlays
+def test_text_properties_move_with_text(buff):
+    """
+    Check that text properties follow the text they are on through edits.
+    """
+    buff.put_text_property(6, 11, "face", "bold")  # "ipsum"
+    assert buff.get_text_property(5, "face") is None
+    assert buff.get_text_property(6, "face") == "bold"
+    assert buff.get_text_property(10, "face") == "bold"
+    assert buff.get_text_property(11, "face") is None
+
+    buff.apply_edits([(0, 0, "abc"), (6, 6, "<"), (11, 11, ">")])
+    assert [(start, end, buff.substring(start, end), props)
+            for start, end, props in buff.properties_in(0, 100)] == [
+        (10, 15, "ipsum", {"face": "bold"})]
+
+    # Deleting all of the text takes the property with it
+    buff.apply_edits([(10, 15, "")])
+    assert buff.properties_in(0, 100) == []
+
+
+def test_put_text_property_replaces(buff):
+    """
+    Check that setting a property over part of a span keeps the rest.
+    """
+    buff.put_text_property(0, 20, "face", "bold")
+    buff.put_text_property(5, 10, "face", "underline")
+    buff.put_text_property(0, 20, "help", "lorem")
+    assert [buff.get_text_property(pos, "face") for pos in (4, 5, 9, 10)] \
+        == ["bold", "underline", "underline", "bold"]
+    assert buff.text_properties_at(7) == {"face": "underline",
+                                         "help": "lorem"}
+
+    buff.remove_text_property(3, 15, "face")
+    assert [buff.get_text_property(pos, "face") for pos in (2, 3, 14, 15)] \
+        == ["bold", None, None, "bold"]
+    assert buff.get_text_property(7, "help") == "lorem"
+
+
+def test_overlays(buff):
+    """
+    Check that overlays move with the text, stay when it is deleted, and are
+    only seen by their own buffer.
+    """
+    overlay = buff.make_overlay(100, 200)
+    overlay.properties["face"] = "reverse"
+    indirect = Buffer(base=buff)
+    other = indirect.make_overlay(0, 10)
+
+    indirect.apply_edits([(100, 100, "in"), (200, 200, "out")])
+    assert (overlay.start, overlay.end) == (100, 202)
+    assert buff.overlays_in(0, 445) == [overlay]
+    assert indirect.overlays_in(0, 445) == [other]
+    assert buff.properties_in(150, 300) == [(150, 202, {"face": "reverse"})]
+
+    buff.apply_edits([(90, 210, "")])
+    assert (overlay.start, overlay.end) == (90, 90)
+
+    buff.move_overlay(overlay, 5, 1)
+    assert (overlay.start, overlay.end) == (1, 5)
+    buff.delete_overlay(overlay)
+    assert overlay.start is None
+    assert buff.overlays_in(0, 445) == []
+
+
+def test_revert_drops_text_properties(tmp_path, buff):
+    """
+    Check that reverting drops text properties and clamps overlays.
+    """
+    buff.put_text_property(0, 10, "face", "bold")
+    overlay = buff.make_overlay(2, 300)
+    path = tmp_path / "file.txt"
+    path.write_text("on disk")
+    buff._path = str(path)
+    buff.revert()
+    assert buff.properties_in(0, 7) == [(2, 7, {})]
+    assert (overlay.start, overlay.end) == (2, 7)
@@ -0,0 +1,126 @@
+"""
+Unit tests for the buffer registry.
+"""
+
+
+#pylint: skip-file
+
+import pytest
+
+from buff import Buffer
+from buffer_registry import BufferRegistry
+from ihmacs_class import IhmacsSansCurses
+from basic_editing import (
+    create_buffer,
+    kill_buffer,
+    next_buffer,
+    previous_buffer,
+)
+
+
+@pytest.fixture
+def registry():
+    """
+    Return a registry of buffers named a to e, added in that order.
+    """
+    registry = BufferRegistry()
+    for name in "abcde":
+        registry.add(Buffer(name=name))
+    return registry
+
+
+def names(buffers):
+    """
+    Return the names of a list of buffers as one string.
+    """
+    return "".join(buff.name for buff in buffers)
+
+
+def test_lookup(registry):
+    """
+    Check that buffers are found by name, and names stay unique.
+    """
+    assert registry.get("c").name == "c"
+    assert registry.get("z") is None
+    assert names(registry) == "abcde"
+    with pytest.raises(ValueError):
+        registry.add(Buffer(name="c"))
+
+
+def test_in_use_order(registry):
+    """
+    Check that touching a buffer moves it to the front, and that next and
+    previous follow the order both ways.
+    """
+    assert names(registry.in_use_order()) == "abcde"
+    registry.touch(registry.get("d"))
+    registry.touch(registry.get("b"))
+    assert names(registry.in_use_order()) == "bdace"
+    # Adding order is untouched
+    assert names(registry) == "abcde"
+
+    buff = registry.most_recent
+    seen = []
+    for _ in range(5):
+        seen.append(buff)
+        buff = registry.next(buff)
+    assert names(seen) == "bdace"
+    assert buff is registry.most_recent
+    assert registry.previous(registry.most_recent).name == "e"
+
+
+def test_remove(registry):
+    """
+    Check that removing buffers keeps the order of the rest.
+    """
+    registry.touch(registry.get("c"))
+    registry.remove(registry.get("c"))
+    assert registry.most_recent.name == "a"
+    registry.remove(registry.get("e"))
+    assert names(registry.in_use_order()) == "abd"
+    assert registry.previous(registry.get("a")).name == "d"
+    for name in "abd":
+        registry.remove(registry.get(name))
+    assert len(registry) == 0
+    assert registry.most_recent is None
+
+
+def test_unique_name(registry):
+    """
+    Check that taken names get the lowest free suffix.
+    """
+    assert registry.unique_name("z") == "z"
+    registry.add(Buffer(name="a<3>"))
+    made = []
+    for _ in range(3):
+        name = registry.unique_name("a")
+        registry.add(Buffer(name=name))
+        made.append(name)
+    assert made == ["a<2>", "a<4>", "a<5>"]
+
+
+def test_session_cycles_in_use_order():
+    """
+    Check that next and previous buffer cycle through the buffers from the
+    most recently used, and that killing a buffer returns to the most recent
+    other one.
+    """
+    ihmacs = IhmacsSansCurses([])
+    for _ in range(3):
+        create_buffer(ihmacs)
+    ihmacs.switch_to_buffer(ihmacs.find_buffer("*scratch*"))
+    assert [buff.name for buff in ihmacs.buffers] == [
+        "*scratch*", "*untitled*", "*untitled*<2>", "*untitled*<3>"]
+
+    cycle = []
+    for _ in range(4):
+        next_buffer(ihmacs)
+        cycle.append(ihmacs.active_buff().name)
+    assert cycle == ["*untitled*<3>", "*untitled*<2>", "*untitled*",
+                     "*scratch*"]
+    previous_buffer(ihmacs)
+    assert ihmacs.active_buff().name == "*untitled*"
+
+    kill_buffer(ihmacs)
+    assert ihmacs.active_buff().name == "*scratch*"
+    assert ihmacs.find_buffer("*untitled*") is None
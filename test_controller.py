@@ -0,0 +1,88 @@
+"""
+Unit tests for the controller.
+
+The controller reads keys from curses, so these tests give it an Ihmacs state
+with a stand-in window and terminal size, and only run commands through it.
+"""
+
+
+#pylint: skip-file
+
+import pytest
+
+from basic_editing import forward_char, next_buffer, self_insert_command
+from controller import Controller
+from ihmacs_class import IhmacsSansCurses
+
+
+class IhmacsFakeTerminal(IhmacsSansCurses):
+    """
+    An Ihmacs session with a window that is never read from.
+    """
+
+    window = None
+    term_size = (24, 80)
+
+
+@pytest.fixture
+def ihmacs():
+    """
+    Return an Ihmacs session sans curses and a controller for it.
+    """
+    ihmacs = IhmacsFakeTerminal([])
+    ihmacs.controller = Controller(ihmacs)
+    return ihmacs
+
+
+def type_keys(ihmacs, keys):
+    """
+    Run self_insert_command through the controller for each key.
+    """
+    for key in keys:
+        ihmacs.keychord = [key]
+        ihmacs.controller.run_edit(self_insert_command)
+
+
+def test_typing_undone_together(ihmacs):
+    """
+    Check that characters typed through the controller are undone in one go.
+    """
+    buff = ihmacs.active_buff()
+    type_keys(ihmacs, "hello")
+    assert buff.text == "hello"
+    assert buff.undo()
+    assert buff.text == ""
+
+
+def test_typing_broken_by_other_commands(ihmacs):
+    """
+    Check that a command that is not typing ends a run of typing.
+    """
+    buff = ihmacs.active_buff()
+    type_keys(ihmacs, "ab")
+    ihmacs.controller.run_edit(forward_char)
+    type_keys(ihmacs, "cd")
+    assert buff.undo()
+    assert buff.text == "ab"
+
+
+def test_typing_after_switching_buffers(ihmacs):
+    """
+    Check that switching buffers ends the group in both buffers.
+    """
+    ihmacs.create_buffer_no_switch(name="other")
+    first = ihmacs.active_buff()
+    type_keys(ihmacs, "ab")
+    ihmacs.controller.run_edit(next_buffer)
+    second = ihmacs.active_buff()
+    assert second is not first
+    type_keys(ihmacs, "cd")
+    ihmacs.controller.run_edit(next_buffer)
+    type_keys(ihmacs, "ef")
+
+    assert first.text == "abef"
+    assert first.undo()
+    assert first.text == "ab"
+    assert second.undo()
+    assert second.text == ""
+
@@ -0,0 +1,203 @@
+"""
+Unit tests for saving buffers to disk.
+"""
+
+
+#pylint: skip-file
+
+import os
+import stat
+
+import pytest
+
+from file_io import (
+    iter_text_chunks,
+    write_atomic,
+)
+from buff import Buffer
+
+from test_buff import LOREM_IPSUM
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 10000])
+def test_iter_text_chunks(size):
+    """
+    Check that chunks rebuild the text and are never too big.
+    """
+    chunks = list(iter_text_chunks(LOREM_IPSUM, size))
+    assert "".join(chunks) == LOREM_IPSUM
+    assert all(len(chunk) <= size for chunk in chunks)
+
+
+def test_write_atomic(tmp_path):
+    """
+    Check that the file is written and no temporary file is left behind.
+    """
+    path = tmp_path / "file.txt"
+    written = write_atomic(str(path), iter_text_chunks("héllo\n" * 100, 13))
+    assert path.read_text(encoding="utf-8") == "héllo\n" * 100
+    assert written == len(("héllo\n" * 100).encode("utf-8"))
+    assert os.listdir(tmp_path) == ["file.txt"]
+
+
+def test_write_atomic_keeps_permissions(tmp_path):
+    """
+    Check that overwriting a file keeps its permissions.
+    """
+    path = tmp_path / "file.txt"
+    path.write_text("old")
+    os.chmod(path, 0o640)
+    write_atomic(str(path), ["new"])
+    assert path.read_text() == "new"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+
+def test_write_atomic_failure_keeps_old_file(tmp_path):
+    """
+    Check that a save failing halfway leaves the old file untouched.
+    """
+    path = tmp_path / "file.txt"
+    path.write_text("old contents")
+
+    def chunks():
+        yield "new"
+        raise RuntimeError("disk on fire")
+
+    with pytest.raises(RuntimeError):
+        write_atomic(str(path), chunks())
+    assert path.read_text() == "old contents"
+    assert os.listdir(tmp_path) == ["file.txt"]
+
+
+def test_save_buffer_snapshot(tmp_path):
+    """
+    Check that a save writes the text as it was when the save started.
+    """
+    path = tmp_path / "file.txt"
+    buff = Buffer(path=str(path))
+    buff.insert(LOREM_IPSUM)
+
+    future = buff.save_buffer()
+    buff.insert("edited after saving")
+    assert future.result() == len(LOREM_IPSUM)
+    assert path.read_text() == LOREM_IPSUM
+
+
+def test_save_buffer_modified(tmp_path):
+    """
+    Check the modified state of a buffer after saves that work and fail.
+    """
+    buff = Buffer(path=str(tmp_path / "file.txt"))
+    buff.insert("text")
+    buff.save_buffer().result()
+    assert not buff.modified
+
+    buff.insert("more")
+    future = buff.write_file(str(tmp_path / "missing" / "file.txt"))
+    with pytest.raises(FileNotFoundError):
+        future.result()
+    assert buff.modified
+
+
+def test_save_results_published_in_order(tmp_path):
+    """
+    Check that a save failing after a later save was started does not mark
+    the buffer modified, and that the save threads leave the buffer alone.
+    """
+    buff = Buffer(path=str(tmp_path / "file.txt"))
+    buff.insert("text")
+    failed = buff.write_file(str(tmp_path / "missing" / "file.txt"))
+    with pytest.raises(FileNotFoundError):
+        failed.result()
+    # Not published until the buffer is looked at again
+    assert not buff._shared.modified
+    assert buff.modified
+
+    failed = buff.write_file(str(tmp_path / "missing" / "file.txt"))
+    saved = buff.write_file(str(tmp_path / "file.txt"))
+    saved.result()
+    assert failed.exception() is not None
+    assert not buff.modified
+
+
+def test_append_saves_back_to_back(tmp_path):
+    """
+    Check that a save started before the last one finished can still append.
+    """
+    path = tmp_path / "notes.txt"
+    path.write_text(LOREM_IPSUM)
+    buff = Buffer(path=str(path))
+    buff.revert()
+    inode = os.stat(path).st_ino
+
+    for i in range(10):
+        buff.append(f"\nnote {i}")
+        future = buff.save_buffer()
+    assert future.result() == len("\nnote 9")
+    assert path.read_text() == buff.text
+    assert os.stat(path).st_ino == inode
+
+
+def test_saves_land_in_order(tmp_path):
+    """
+    Check that the last save of a buffer is the one left on disk.
+    """
+    path = tmp_path / "file.txt"
+    buff = Buffer(path=str(path))
+    for i in range(20):
+        buff.insert(str(i))
+        future = buff.save_buffer()
+    future.result()
+    assert path.read_text() == buff.text
+
+
+def test_append_only_save(tmp_path):
+    """
+    Check that text added at the end is appended to the file in place.
+
+    Appending keeps the same file, while a full save renames a new file over
+    it, so the inode tells which kind of save happened.
+    """
+    path = tmp_path / "notes.txt"
+    path.write_text(LOREM_IPSUM)
+    buff = Buffer(path=str(path))
+    buff.revert()
+    inode = os.stat(path).st_ino
+
+    buff.append("\nfirst note")
+    assert buff.save_buffer().result() == len("\nfirst note")
+    buff.append("\nsecond note")
+    buff.set_point(len(buff.text))
+    buff.delete_char(-4)
+    buff.save_buffer().result()
+
+    assert path.read_text() == buff.text
+    assert os.stat(path).st_ino == inode
+
+
+def test_append_only_save_falls_back(tmp_path):
+    """
+    Check that edits before the end, or changes on disk, rewrite the file.
+    """
+    path = tmp_path / "notes.txt"
+    path.write_text(LOREM_IPSUM)
+    buff = Buffer(path=str(path))
+    buff.revert()
+
+    # Edit in the middle
+    buff.set_point(10)
+    buff.insert("middle")
+    buff.append("end")
+    inode = os.stat(path).st_ino
+    buff.save_buffer().result()
+    assert path.read_text() == buff.text
+    assert os.stat(path).st_ino != inode
+
+    # Someone else changed the file
+    with open(path, "a") as disk_file:
+        disk_file.write("external")
+    buff.append("more")
+    inode = os.stat(path).st_ino
+    buff.save_buffer().result()
+    assert path.read_text() == buff.text
+    assert os.stat(path).st_ino != inode
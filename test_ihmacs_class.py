@@ -13,7 +13,7 @@ is unpredictable.
 
 import pytest
 
-from ihmacs_class import IhmacsSansCurses
+from ihmacs_class import IhmacsSansCurses, read_prefix_arg
 from buff import Buffer
 
 
@@ -49,9 +49,10 @@ def ihmacs_state(request):
     active_buff = request.param[1]
     # The empty list would be argparse files.
     ihmacs = IhmacsSansCurses([])
-    buffers = [Buffer(name=str(i)) for i in range(num_buffs)]
-    ihmacs._buffers = buffers
-    ihmacs._active_buff = active_buff
+    ihmacs.kill_buffer(0)  # The scratch buffer
+    for i in range(num_buffs):
+        ihmacs.add_buffer(Buffer(name=str(i)))
+    ihmacs.switch_buffer(active_buff)
     return ihmacs
 
 
@@ -203,3 +204,38 @@ def test_find_buffer(ihmacs_state, name):
             found_buffer = i
             break
     assert found_buffer == ihmacs_state.find_buffer(name)
+
+
+# read_prefix_arg
+prefix_arg_cases = [
+    (["a"], None, ["a"]),
+    (["C-x", "C-u"], None, ["C-x", "C-u"]),
+    (["M-x"], None, ["M-x"]),
+    (["C-u"], 4, []),
+    (["C-u", "a"], 4, ["a"]),
+    (["C-u", "C-u", "C-u", "C-n"], 64, ["C-n"]),
+    (["C-u", "1", "0", "0", "a"], 100, ["a"]),
+    (["C-u", "1", "0"], 10, []),
+    (["C-u", "-", "a"], -1, ["a"]),
+    (["C-u", "-", "1", "2", "C-f"], -12, ["C-f"]),
+    (["C-u", "5", "C-u", "1"], 5, ["1"]),
+    (["C-u", "5", "C-u"], 5, []),
+    (["C-u", "-", "-"], -1, ["-"]),
+    (["M-5", "a"], 5, ["a"]),
+    (["M-1", "2", "M-3", "a"], 123, ["a"]),
+    (["M--", "C-n"], -1, ["C-n"]),
+    (["M-0", "C-x", "C-x"], 0, ["C-x", "C-x"]),
+]
+
+
+@pytest.mark.parametrize("keychord,num,command_keys", prefix_arg_cases)
+def test_read_prefix_arg(keychord, num, command_keys):
+    """
+    Test that prefix arguments are read off the front of a keychord.
+
+    Args:
+        keychord: A list of strings representing a keychord.
+        num: The prefix argument expected, or None.
+        command_keys: A list of the keys expected to be left for the command.
+    """
+    assert read_prefix_arg(keychord) == (num, command_keys)
@@ -0,0 +1,174 @@
+"""
+Unit tests for the interval tree.
+"""
+
+
+#pylint: skip-file
+
+import random
+
+import pytest
+
+from interval_tree import Interval, IntervalTree
+
+
+def map_pos(pos, advance, start, end, length):
+    """
+    Move a position for an edit the slow way, one case at a time.
+    """
+    if pos < start:
+        return pos
+    if pos > end:
+        return pos + length - (end - start)
+    return start + length if advance else start
+
+
+def check(tree, model):
+    """
+    Check that a tree holds exactly the intervals of a model, at the model's
+    positions, and that its search agrees with a linear scan.
+
+    Args:
+        tree: An IntervalTree.
+        model: A dict mapping Intervals to (start, end) tuples.
+    """
+    assert len(tree) == len(model)
+    for interval, (start, end) in model.items():
+        assert (interval.start, interval.end) == (start, end)
+    for start, end in [(0, 1000), (10, 20), (50, 51), (0, 0), (30, 90)]:
+        expected = {interval for interval, (left, right) in model.items()
+                    if (left < end and right > start)
+                    or (left == right and start <= left < end)}
+        found = tree.overlapping(start, end)
+        assert {interval for interval, _, _ in found} == expected
+        assert [left for _, left, _ in found] == sorted(
+            left for _, left, _ in found)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_edits(seed):
+    """
+    Check that intervals move like markers at their ends through random
+    edits, and that searches find the right ones.
+    """
+    rand = random.Random(seed)
+    tree = IntervalTree()
+    model = {}
+    length = 200
+    for _ in range(300):
+        choice = rand.random()
+        if choice < 0.3 or not model:
+            start = rand.randint(0, length)
+            end = min(length, start + rand.randint(0, 30))
+            interval = Interval(front_advance=rand.random() < 0.5,
+                                rear_advance=rand.random() < 0.5,
+                                evaporate=rand.random() < 0.5)
+            tree.add(interval, start, end)
+            model[interval] = (start, end)
+        elif choice < 0.4:
+            interval = rand.choice(list(model))
+            tree.remove(interval)
+            del model[interval]
+            assert interval.start is None
+        else:
+            start = rand.randint(0, length)
+            end = min(length, start + rand.choice([0, 0, 1, 5, 20]))
+            new = rand.choice([0, 1, 3, 10])
+            tree.replace(start, end, new)
+            length += new - (end - start)
+            for interval, (left, right) in list(model.items()):
+                left = map_pos(left, interval.front_advance, start, end, new)
+                right = map_pos(right, interval.rear_advance, start, end, new)
+                right = max(left, right)
+                if interval.evaporate and left == right and \
+                        interval._node is None:
+                    del model[interval]
+                else:
+                    model[interval] = (left, right)
+        check(tree, model)
+
+
+def test_evaporate():
+    """
+    Check that intervals emptied by a deletion are dropped only if they
+    evaporate.
+    """
+    tree = IntervalTree()
+    evaporates = Interval(evaporate=True)
+    stays = Interval()
+    tree.add(evaporates, 10, 20)
+    tree.add(stays, 10, 20)
+    tree.replace(5, 25, 0)
+    assert len(tree) == 1
+    assert evaporates.start is None
+    assert (stays.start, stays.end) == (5, 5)
+
+
+@pytest.mark.parametrize("front_advance, rear_advance, expected", [
+    (False, False, (10, 23)),
+    (True, False, (13, 23)),
+    (False, True, (10, 23)),
+    (True, True, (13, 23)),
+])
+def test_insertion_types_at_start(front_advance, rear_advance, expected):
+    """
+    Check that text inserted at the start of an interval goes inside it
+    unless it front advances.
+    """
+    tree = IntervalTree()
+    interval = Interval(front_advance=front_advance,
+                        rear_advance=rear_advance)
+    tree.add(interval, 10, 20)
+    tree.replace(10, 10, 3)
+    assert (interval.start, interval.end) == expected
+
+
+@pytest.mark.parametrize("rear_advance, expected", [
+    (False, (10, 20)),
+    (True, (10, 23)),
+])
+def test_insertion_types_at_end(rear_advance, expected):
+    """
+    Check that text inserted at the end of an interval goes inside it only if
+    it rear advances.
+    """
+    tree = IntervalTree()
+    interval = Interval(rear_advance=rear_advance)
+    tree.add(interval, 10, 20)
+    tree.replace(20, 20, 3)
+    assert (interval.start, interval.end) == expected
+
+
+def test_shift_is_lazy():
+    """
+    Check that an edit before many intervals only touches a few nodes.
+    """
+    tree = IntervalTree()
+    intervals = [Interval() for _ in range(10000)]
+    for i, interval in enumerate(intervals):
+        tree.add(interval, 10 + 2 * i, 11 + 2 * i)
+    tree.replace(0, 0, 5)
+    pending = 0
+    stack = [tree._root]
+    while stack:
+        node = stack.pop()
+        if node is not None:
+            pending += node.shift != 0
+            stack.extend((node.left, node.right))
+    # Only the nodes on the split paths get a shift
+    assert pending < 200
+    assert (intervals[5000].start, intervals[5000].end) == (10015, 10016)
+
+
+def test_add_twice():
+    """
+    Check that an interval can only be in one place at once.
+    """
+    tree = IntervalTree()
+    interval = Interval()
+    tree.add(interval, 0, 1)
+    with pytest.raises(ValueError):
+        tree.add(interval, 2, 3)
+    tree.remove(interval)
+    with pytest.raises(ValueError):
+        tree.remove(interval)
@@ -0,0 +1,128 @@
+"""
+Unit tests for layered keymaps.
+"""
+
+
+#pylint: skip-file
+
+import pytest
+
+from basic_editing import command_undefined, DEFAULT_GLOBAL_KEYMAP
+from buff import Buffer
+from fundamental_mode import FundamentalMode
+from ihmacs_class import IhmacsSansCurses, read_keychord_keymap
+from keymap import LayeredKeymap, define_key
+
+
+def command_a(ihmacs_state):
+    pass
+
+
+def command_b(ihmacs_state):
+    pass
+
+
+def command_c(ihmacs_state):
+    pass
+
+
+class ModeWithMap(FundamentalMode):
+    _modemap = {"C-c": {"C-c": command_b}, "M-q": command_b}
+
+
+class MinorMode:
+    modemap = {"M-q": command_c}
+
+
+@pytest.fixture
+def global_keymap():
+    """
+    Return a small global keymap.
+    """
+    return {"a": command_a,
+            "M-q": command_a,
+            "C-c": {"C-j": command_a, "C-c": command_a},
+            "C-x": {"C-s": command_a}}
+
+
+lookup_cases = [
+    (["a"], "command_a"),
+    (["M-q"], "command_c"),
+    (["C-c"], False),
+    (["C-c", "C-c"], "command_b"),
+    (["C-c", "C-j"], "command_a"),
+    (["C-c", "C-k"], "command_undefined"),
+    (["C-x", "C-s"], "command_a"),
+    (["C-x"], False),
+    (["z"], "command_undefined"),
+]
+
+
+@pytest.mark.parametrize("keychord,result", lookup_cases)
+def test_layer_order(global_keymap, keychord, result):
+    """
+    Check that earlier layers shadow later ones, and that prefixes of all the
+    layers are looked into together.
+    """
+    buff = Buffer(keymap=global_keymap)
+    buff.major_mode = ModeWithMap()
+    buff.minor_modes.append(MinorMode())
+    func = read_keychord_keymap(keychord, buff.keymap)
+    name = func.__name__ if callable(func) else func
+    assert name == result
+
+
+def test_prefix_shadows_command(global_keymap):
+    """
+    Check that a command in a later layer is hidden by a prefix in an earlier
+    one.
+    """
+    keymap = LayeredKeymap([{"a": {"b": command_b}}, global_keymap])
+    assert read_keychord_keymap(["a"], keymap) is False
+    assert read_keychord_keymap(["a", "b"], keymap) is command_b
+
+
+def test_rebinding_is_shared(global_keymap):
+    """
+    Check that buffers do not copy keymaps, so later bindings reach every
+    buffer, while local bindings stay in their buffer.
+    """
+    buffs = [Buffer(keymap=global_keymap) for _ in range(3)]
+    assert buffs[0].keymap.layers[-1] is global_keymap
+
+    define_key(global_keymap, ["C-x", "C-s"], command_b)
+    define_key(global_keymap, ["C-h", "k"], command_c)
+    define_key(buffs[0].local_keymap, ["a"], command_c)
+    for buff in buffs:
+        assert read_keychord_keymap(["C-x", "C-s"], buff.keymap) is command_b
+        assert read_keychord_keymap(["C-h", "k"], buff.keymap) is command_c
+    assert read_keychord_keymap(["a"], buffs[0].keymap) is command_c
+    assert read_keychord_keymap(["a"], buffs[1].keymap) is command_a
+
+    define_key(buffs[0].local_keymap, ["a"], None)
+    assert read_keychord_keymap(["a"], buffs[0].keymap) is command_a
+
+
+def test_define_key_replaces_command_with_prefix():
+    """
+    Check that binding a longer keychord over a command makes a prefix.
+    """
+    keymap = {"a": command_a}
+    define_key(keymap, ["a", "b", "c"], command_b)
+    assert keymap == {"a": {"b": {"c": command_b}}}
+
+
+def test_global_set_key():
+    """
+    Check that global bindings of a session reach existing buffers and leave
+    the default keymap alone.
+    """
+    ihmacs = IhmacsSansCurses([])
+    buff = ihmacs.active_buff()
+    ihmacs.global_set_key(["C-c", "a"], command_a)
+    assert read_keychord_keymap(["C-c", "a"], buff.keymap) is command_a
+    assert "C-c" not in DEFAULT_GLOBAL_KEYMAP \
+        or "a" not in DEFAULT_GLOBAL_KEYMAP["C-c"]
+    other = IhmacsSansCurses([])
+    assert (read_keychord_keymap(["C-c", "a"], other.active_buff().keymap)
+            is command_undefined)
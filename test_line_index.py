@@ -0,0 +1,90 @@
+"""
+Unit tests for the line start index.
+"""
+
+
+#pylint: skip-file
+
+import pytest
+
+from line_index import LineIndex
+
+from test_buff import LOREM_IPSUM
+from test_text_storage import (
+    initial_texts,
+    random_edits,
+)
+
+
+def expected_starts(text):
+    """
+    Return the line starts of text, computed the slow way.
+    """
+    return [0] + [i + 1 for i, char in enumerate(text) if char == "\n"]
+
+
+def check_index(index, text):
+    """
+    Assert that every lookup on a line index agrees with text.
+    """
+    starts = expected_starts(text)
+    assert index.line_count == len(starts)
+    for line, start in enumerate(starts):
+        assert index.line_start(line) == start
+        end = starts[line+1] - 1 if line + 1 < len(starts) else len(text)
+        assert index.line_end(line) == end
+    assert index.line_start(len(starts)) == len(text)
+    for pos in range(0, len(text) + 1):
+        assert index.line_of(pos) == text.count("\n", 0, pos)
+
+
+@pytest.mark.parametrize("text", initial_texts)
+def test_reset(text):
+    """
+    Check an index built from scratch.
+    """
+    check_index(LineIndex(text), text)
+
+
+@pytest.mark.parametrize("text", initial_texts)
+@pytest.mark.parametrize("seed", range(5))
+def test_random_edits(text, seed):
+    """
+    Check that an index stays correct through a series of random edits.
+    """
+    index = LineIndex(text)
+    for kind, first, second in random_edits(text, seed, num_edits=100):
+        if kind == "insert":
+            index.insert(first, second)
+            text = text[:first] + second + text[first:]
+        else:
+            index.delete(first, second)
+            text = text[:first] + text[second:]
+        check_index(index, text)
+
+
+def test_lines():
+    """
+    Check the spans returned for ranges of lines.
+    """
+    index = LineIndex(LOREM_IPSUM)
+    starts = expected_starts(LOREM_IPSUM)
+    spans = [(start, LOREM_IPSUM.find("\n", start) % (len(LOREM_IPSUM) + 1))
+             for start in starts]
+    for start in range(-1, len(starts) + 2):
+        for end in range(max(0, start), len(starts) + 3):
+            assert index.lines(start, end) == spans[max(0, start):end]
+
+
+def test_edits_near_each_other_settle_few_entries():
+    """
+    Check that typing only settles the entries between consecutive edits.
+    """
+    text = "line\n" * 1000
+    index = LineIndex(text)
+    index.insert(2500, "x")
+    starts = list(index._starts)
+    for i in range(1, 100):
+        index.insert(2500 + i, "x")
+    # Nothing before or after the edit point was rewritten.
+    assert index._starts == starts
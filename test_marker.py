@@ -0,0 +1,112 @@
+"""
+Unit tests for markers.
+"""
+
+
+#pylint: skip-file
+
+import random
+
+import pytest
+
+from buff import Buffer
+
+from test_buff import LOREM_IPSUM
+
+
+def expected_position(pos, advance, start, end, text):
+    """
+    Return where a marker should be after replacing start to end with text.
+    """
+    if pos < start:
+        return pos
+    if pos <= end:
+        return start + (len(text) if advance else 0)
+    return pos + len(text) - (end - start)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_markers_follow_edits(seed):
+    """
+    Check many markers against working out their positions by hand.
+    """
+    rand = random.Random(seed)
+    buff = Buffer()
+    buff._text = LOREM_IPSUM
+    markers = [buff.make_marker(rand.randint(0, len(LOREM_IPSUM)),
+                                advance=rand.random() < 0.5)
+               for _ in range(300)]
+    expected = [marker.position for marker in markers]
+
+    for _ in range(100):
+        length = buff.length
+        start = rand.randint(0, length)
+        end = min(length, start + rand.choice([0, 0, 1, 5, 40]))
+        text = rand.choice(["", "a", "bc\n", "longer text"])
+        buff.apply_edits([(start, end, text)])
+        expected = [expected_position(pos, marker.advance, start, end, text)
+                    for pos, marker in zip(expected, markers)]
+        assert [marker.position for marker in markers] == expected
+
+    positions = [marker.position for marker in buff._shared.markers]
+    assert positions == sorted(positions)
+
+
+def test_markers_batched_edits():
+    """
+    Check markers after several edits applied at once.
+    """
+    buff = Buffer()
+    buff._text = "0123456789"
+    stay = [buff.make_marker(pos) for pos in range(11)]
+    advance = [buff.make_marker(pos, advance=True) for pos in range(11)]
+
+    buff.apply_edits([(2, 2, "ab"), (4, 6, ""), (8, 9, "xyz")])
+    assert buff.text == "01ab2367xyz9"
+    assert [m.position for m in stay] == [0, 1, 2, 5, 6, 6, 6, 7, 8, 8, 12]
+    assert [m.position for m in advance] == [0, 1, 4, 5, 6, 6, 6, 7, 11, 11,
+                                             12]
+    keys = [(m.position, m.advance) for m in buff._shared.markers]
+    assert keys == sorted(keys)
+
+
+def test_point_and_mark_are_markers():
+    """
+    Check that point advances past inserted text and mark does not.
+    """
+    buff = Buffer()
+    buff.insert("hello")
+    buff.set_mark(5)
+    buff.insert(" world")
+    assert (buff.point, buff.mark) == (11, 5)
+    assert len(buff._shared.markers) == 2
+
+
+def test_set_and_delete_marker():
+    """
+    Check moving and deleting markers.
+    """
+    buff = Buffer()
+    buff._text = LOREM_IPSUM
+    marker = buff.make_marker(10)
+    buff.set_marker(marker, 10000)
+    assert marker.position == len(LOREM_IPSUM)
+    assert marker.buffer is buff
+
+    buff.delete_marker(marker)
+    assert marker.position is None
+    assert marker.buffer is None
+    assert len(buff._shared.markers) == 2
+    with pytest.raises(ValueError):
+        buff.set_marker(marker, 0)
+
+
+def test_markers_clamped_on_new_text():
+    """
+    Check that replacing the text keeps markers inside it.
+    """
+    buff = Buffer()
+    buff._text = LOREM_IPSUM
+    marker = buff.make_marker(400)
+    buff._text = "short"
+    assert marker.position == 5
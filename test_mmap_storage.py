@@ -0,0 +1,193 @@
+"""
+Unit tests for memory mapped read only storage.
+"""
+
+
+#pylint: skip-file
+
+import pytest
+
+import mmap_storage
+from mmap_storage import MmapStorage
+from buff import Buffer
+from text_storage import StringStorage
+
+from test_buff import LOREM_IPSUM
+
+
+file_texts = [
+    "",
+    "a",
+    "\n",
+    LOREM_IPSUM,
+    LOREM_IPSUM * 20,
+    # Multibyte characters, some straddling block boundaries
+    ("Grüße aus Köln, 東京 and 🙂 emoji.\n" * 40),
+    LOREM_IPSUM + "\nnaïve café\n" + LOREM_IPSUM,
+]
+
+
+@pytest.fixture(params=file_texts)
+def file_text(request):
+    """
+    Return a string representing the contents of a file.
+    """
+    return request.param
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch, file_text):
+    """
+    Return a memory mapped storage of a file holding file_text.
+
+    Blocks are made tiny so every file spans many of them.
+    """
+    monkeypatch.setattr(mmap_storage, "BLOCK_SIZE", 37)
+    path = tmp_path / "file.txt"
+    path.write_text(file_text, encoding="utf-8")
+    return MmapStorage(str(path))
+
+
+def test_length_and_text(storage, file_text):
+    """
+    Check the length and full text of a mapped file.
+    """
+    assert len(storage) == len(file_text)
+    assert storage.text == file_text
+
+
+def test_slice(storage, file_text):
+    """
+    Check slices of a mapped file.
+    """
+    length = len(file_text)
+    for start in range(0, length + 1, 29):
+        for end in range(start, length + 2, 41):
+            assert storage.slice(start, end) == file_text[start:end]
+
+
+def test_line_lookups(storage, file_text):
+    """
+    Check newline counts and line starts of a mapped file.
+    """
+    assert storage.newline_count() == file_text.count("\n")
+    for pos in range(0, len(file_text) + 1, 3):
+        assert storage.newlines_before(pos) == file_text.count("\n", 0, pos)
+
+    starts = [0] + [i + 1 for i, char in enumerate(file_text) if char == "\n"]
+    for line, start in enumerate(starts):
+        assert storage.line_start(line) == start
+    assert storage.line_start(len(starts)) == len(file_text)
+
+
+def test_lazy_indexing(tmp_path, monkeypatch):
+    """
+    Check that opening a file reads none of it, and looking at the top of it
+    reads only the top.
+    """
+    monkeypatch.setattr(mmap_storage, "BLOCK_SIZE", 100)
+    path = tmp_path / "file.txt"
+    path.write_text(LOREM_IPSUM * 100)
+
+    storage = MmapStorage(str(path))
+    assert storage.indexed_bytes == 0
+
+    storage.slice(0, 50)
+    storage.line_start(3)
+    assert 0 < storage.indexed_bytes < 1000
+
+    assert storage.clamp(120) == 120
+    assert storage.indexed_bytes < 1000
+    assert storage.clamp(10 ** 9) == len(LOREM_IPSUM * 100)
+
+
+line_ending_files = [
+    b"a\r\nb\r\n",
+    b"a\rb\rc",
+    b"\r\n\r\r\n\n\r",
+    (b"Gr\xc3\xbc\xc3\x9fe\r\n" * 3 + b"plain\r" * 3) * 20,
+]
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 7, 64 * 1024])
+@pytest.mark.parametrize("data", line_ending_files)
+def test_line_endings(tmp_path, monkeypatch, data, block_size):
+    """
+    Check that a mapped file reads the same as a file read in text mode, with
+    \\r\\n and \\r line endings becoming newlines, even when they straddle
+    blocks.
+    """
+    monkeypatch.setattr(mmap_storage, "BLOCK_SIZE", block_size)
+    path = tmp_path / "file.txt"
+    path.write_bytes(data)
+    expected = StringStorage.from_file(str(path)).text
+
+    storage = MmapStorage(str(path))
+    for start in range(0, len(expected) + 1, 3):
+        for end in range(start, len(expected) + 2, 5):
+            assert storage.slice(start, end) == expected[start:end]
+    assert storage.newlines_before(len(expected)) == expected.count("\n")
+    starts = [0] + [i + 1 for i, char in enumerate(expected) if char == "\n"]
+    for line, start in enumerate(starts):
+        assert storage.line_start(line) == start
+    assert len(storage) == len(expected)
+    assert storage.newline_count() == expected.count("\n")
+    assert MmapStorage(str(path)).text == expected
+
+
+def test_snapshot(storage, file_text):
+    """
+    Check that a snapshot reads the same file with its own block index.
+    """
+    snapshot = storage.snapshot()
+    assert snapshot.text == file_text
+    assert snapshot.newline_count() == file_text.count("\n")
+    assert storage.indexed_bytes == 0 or file_text == ""
+
+
+def test_read_only(storage):
+    """
+    Check that a mapped file cannot be edited.
+    """
+    with pytest.raises(ValueError):
+        storage.insert(0, "a")
+    with pytest.raises(ValueError):
+        storage.delete(0, 1)
+
+
+def test_buffer_revert_read_only(tmp_path):
+    """
+    Check that reverting a read only buffer maps its file.
+    """
+    path = tmp_path / "file.txt"
+    path.write_text(LOREM_IPSUM)
+
+    buff = Buffer(path=str(path), read_only=True)
+    buff.revert()
+    assert isinstance(buff._shared.storage, MmapStorage)
+    assert buff.lines(2, 4) == LOREM_IPSUM.split("\n")[1:3]
+    assert buff.line_count == LOREM_IPSUM.count("\n") + 1
+    assert buff.insert("a") is False
+
+
+def test_buffer_revert_read_only_lazy(tmp_path, monkeypatch):
+    """
+    Check that reverting a read only buffer does not read its file, while
+    markers and overlays past the end of it still end up inside it.
+    """
+    monkeypatch.setattr(mmap_storage, "BLOCK_SIZE", 100)
+    path = tmp_path / "file.txt"
+    path.write_text("short")
+
+    buff = Buffer(path=str(path), read_only=True)
+    buff._text = LOREM_IPSUM
+    marker = buff.make_marker(400)
+    overlay = buff.make_overlay(2, 300)
+    buff.revert()
+    assert (marker.position, overlay.start, overlay.end) == (5, 2, 5)
+
+    path.write_text(LOREM_IPSUM * 100)
+    buff.revert()
+    assert buff._shared.storage.indexed_bytes < 1000
+    assert buff.lines(1, 3) == LOREM_IPSUM.split("\n")[:2]
+    assert buff._shared.storage.indexed_bytes < 1000
@@ -0,0 +1,150 @@
+"""
+Unit tests for syntax tables.
+"""
+
+
+#pylint: skip-file
+
+import random
+
+import pytest
+
+from fundamental_mode import FundamentalMode
+from syntax_table import (
+    SyntaxTable,
+    SYNTAX_CLASSES,
+    WORD,
+    WHITESPACE,
+    PUNCTUATION,
+    OPEN,
+    CLOSE,
+    STRING,
+)
+
+
+class QuoteMode(FundamentalMode):
+    _name = "Quote"
+    _syntax_table = FundamentalMode._syntax_table.extend({
+        "'": "\"",
+        "_": "w",
+        "<": "(>",
+        ">": ")<",
+    })
+
+
+syntax_cases = [
+    ("a", WORD),
+    ("7", WORD),
+    ("é", WORD),
+    (" ", WHITESPACE),
+    ("\n", WHITESPACE),
+    ("\t", WHITESPACE),
+    ("-", PUNCTUATION),
+    ("_", PUNCTUATION),
+    ("(", OPEN),
+    ("}", CLOSE),
+    ("\"", STRING),
+    ("'", WORD),
+]
+
+
+@pytest.mark.parametrize("char,syntax", syntax_cases)
+def test_syntax(char, syntax):
+    """
+    Check the classes of listed characters and the default classes of the
+    rest.
+    """
+    assert FundamentalMode().syntax_table.syntax(char) == syntax
+
+
+def test_matching_paren():
+    """
+    Check that parens know their matching paren, and other characters have
+    none.
+    """
+    table = FundamentalMode().syntax_table
+    assert table.matching_paren("(") == ")"
+    assert table.matching_paren("]") == "["
+    assert table.matching_paren("\"") is None
+    assert table.matching_paren("a") is None
+
+
+def test_extend():
+    """
+    Check that extending a table changes only the new table.
+    """
+    base = FundamentalMode().syntax_table
+    table = QuoteMode().syntax_table
+    assert table.syntax("'") == STRING
+    assert table.syntax("_") == WORD
+    assert table.matching_paren("<") == ">"
+    assert table.syntax("(") == OPEN
+    assert base.syntax("'") == WORD
+    assert base.syntax("_") == PUNCTUATION
+    assert base.syntax("<") == WORD
+
+
+def test_regexes_precomputed():
+    """
+    Check that modes share one table and its regexes are not compiled again
+    on every use.
+    """
+    assert FundamentalMode().syntax_table is FundamentalMode().syntax_table
+    mode = QuoteMode()
+    assert mode.word_regex is mode.word_regex
+    assert mode.word_delimiters_regex is mode.word_delimiters_regex
+    table = mode.syntax_table
+    assert table.runs_regex(table.word_classes) is table.word_regex
+    assert table.runs_regex([CLOSE, OPEN]) is table.runs_regex([OPEN, CLOSE])
+
+
+def test_fundamental_words():
+    """
+    Check that words in fundamental mode are separated by whitespace, dashes,
+    and underscores only, with parens and quotes part of words.
+    """
+    mode = FundamentalMode()
+    text = 'f(x) "quoted"\tsnake_case kebab-case'
+    assert mode.word_regex.findall(text) == ["f(x)", '"quoted"', "snake",
+                                             "case", "kebab", "case"]
+    assert mode.word_delimiters == [r"\s", r"\-", r"_"]
+    assert QuoteMode().word_delimiters == [r"\s", r"\-"]
+
+
+@pytest.mark.parametrize("entries", [{"a": "x"}, {"a": ""}, {"(": "("}])
+def test_bad_entries(entries):
+    """
+    Check that unknown classes and unmatched parens are refused.
+    """
+    with pytest.raises(ValueError):
+        SyntaxTable(entries)
+
+
+tables = [
+    SyntaxTable(),
+    FundamentalMode().syntax_table,
+    QuoteMode().syntax_table,
+    SyntaxTable({"\n": ".", " ": "w", "a": " ", "\\": "\"", "]": "(["}),
+]
+
+
+@pytest.mark.parametrize("table", tables)
+@pytest.mark.parametrize("seed", range(5))
+def test_class_pattern(table, seed):
+    """
+    Check that the regex for any set of classes matches exactly the
+    characters the table puts in those classes.
+
+    Args:
+        table: A SyntaxTable.
+        seed: An int seeding the random sets of classes.
+    """
+    rng = random.Random(seed)
+    chars = "ab7 \t\n-_()[]{}<>'\"\\.é"
+    for _ in range(10):
+        classes = rng.sample(SYNTAX_CLASSES,
+                             rng.randint(0, len(SYNTAX_CLASSES)))
+        regex = table.runs_regex(classes)
+        for char in chars:
+            matched = regex.fullmatch(char) is not None
+            assert matched == (table.syntax(char) in classes)
@@ -0,0 +1,411 @@
+"""
+Unit tests for the text storage engines.
+
+Every engine is checked against a plain Python string that receives the same
+edits.
+"""
+
+
+#pylint: skip-file
+
+import random
+
+import pytest
+
+from text_storage import (
+    StringStorage,
+    PieceTable,
+)
+from rope import (
+    Rope,
+    LEAF_SIZE,
+)
+from gap_buffer import GapBuffer
+from ring_storage import RingStorage
+import text_storage
+import utf8_storage
+from utf8_storage import Utf8Storage
+
+from test_buff import LOREM_IPSUM
+
+
+storage_classes = [
+    StringStorage,
+    PieceTable,
+    Rope,
+    GapBuffer,
+    Utf8Storage,
+    RingStorage,
+]
+
+
+@pytest.fixture(params=storage_classes)
+def storage_class(request):
+    """
+    Return a text storage class.
+    """
+    return request.param
+
+
+initial_texts = [
+    "",
+    "a",
+    "Hello, World!",
+    "This\nis\na\nstring.\n",
+    LOREM_IPSUM,
+    "Ünïcödé\nçà et là, 日本語のテキスト\nand an emoji 😀 too.\n",
+]
+
+
+@pytest.fixture(params=initial_texts)
+def initial_text(request):
+    """
+    Return a string to initialize storage with.
+    """
+    return request.param
+
+
+def random_edits(text, seed, num_edits=200):
+    """
+    Generate a reproducible list of random edits for a starting text.
+
+    Args:
+        text: A string representing the text the edits will start from.
+        seed: An int to seed the random number generator with.
+        num_edits: An int representing how many edits to generate.
+
+    Returns:
+        A list of tuples. Inserts are ("insert", pos, string) and deletes are
+        ("delete", start, end).
+    """
+    rng = random.Random(seed)
+    length = len(text)
+    edits = []
+    for _ in range(num_edits):
+        if rng.random() < 0.6 or length == 0:
+            pos = rng.randint(0, length)
+            string = "".join(rng.choice("abc \n") for _ in
+                             range(rng.randint(1, 12)))
+            edits.append(("insert", pos, string))
+            length += len(string)
+        else:
+            start = rng.randint(0, length)
+            end = rng.randint(start, min(length, start + 20))
+            edits.append(("delete", start, end))
+            length -= end - start
+    return edits
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_edits(storage_class, initial_text, seed):
+    """
+    Check that storage matches a string after a series of random edits.
+
+    Checks the length, the full text, and a slice after every edit.
+    """
+    storage = storage_class(initial_text)
+    expected = initial_text
+
+    for kind, first, second in random_edits(initial_text, seed):
+        if kind == "insert":
+            storage.insert(first, second)
+            expected = expected[:first] + second + expected[first:]
+        else:
+            deleted = storage.delete(first, second)
+            assert deleted == expected[first:second]
+            expected = expected[:first] + expected[second:]
+
+        assert len(storage) == len(expected)
+        assert storage.slice(first, first + 10) == expected[first:first+10]
+    assert storage.text == expected
+
+
+def test_slice(storage_class, initial_text):
+    """
+    Check that every slice of a storage matches the string slice.
+    """
+    storage = storage_class(initial_text)
+    # Break the text into several pieces first.
+    for pos in range(0, len(initial_text), 7):
+        storage.insert(pos, "")
+        storage.insert(pos, "x")
+        storage.delete(pos, pos+1)
+
+    length = len(initial_text)
+    for start in range(0, length + 1, 5):
+        for end in range(start, length + 1, 9):
+            assert storage.slice(start, end) == initial_text[start:end]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_snapshots(storage_class, initial_text, seed):
+    """
+    Check that snapshots keep their text while the storage is edited.
+    """
+    storage = storage_class(initial_text)
+    expected = initial_text
+    snapshots = []
+
+    for i, (kind, first, second) in enumerate(random_edits(initial_text,
+                                                           seed, 60)):
+        if i % 10 == 0:
+            snapshots.append((storage.snapshot(), expected))
+        if kind == "insert":
+            storage.insert(first, second)
+            expected = expected[:first] + second + expected[first:]
+        else:
+            storage.delete(first, second)
+            expected = expected[:first] + expected[second:]
+
+    assert storage.text == expected
+    for snapshot, text in snapshots:
+        assert len(snapshot) == len(text)
+        assert snapshot.slice(2, 9) == text[2:9]
+        assert snapshot.text == text
+
+
+def test_piece_table_text_cached():
+    """
+    Check that the piece table materializes text only once between edits.
+    """
+    storage = PieceTable(LOREM_IPSUM)
+    storage.insert(10, "foo")
+    text = storage.text
+    assert storage.text is text
+    storage.delete(0, 1)
+    assert storage.text is not text
+
+
+def test_piece_table_original_untouched():
+    """
+    Check that edits never modify the original text, and that inserted text
+    goes to the add buffer, continuing the block of the insertion before it.
+    """
+    storage = PieceTable(LOREM_IPSUM)
+    storage.insert(5, "inserted")
+    storage.delete(0, 20)
+    storage.insert(0, "more")
+    storage.insert(4, "!")
+    assert storage._original == LOREM_IPSUM
+    assert storage._add == ["inserted", "more!"]
+
+
+def test_piece_table_typing():
+    """
+    Check that typing a run of characters grows one piece instead of adding
+    a piece per character.
+    """
+    storage = PieceTable(LOREM_IPSUM)
+    storage.insert(100, "x")
+    pieces = storage.piece_count
+    for i in range(5000):
+        storage.insert(101 + i, "y")
+        storage.slice(0, 10)
+    assert storage.piece_count == pieces
+    assert storage.text == (LOREM_IPSUM[:100] + "x" + "y" * 5000
+                            + LOREM_IPSUM[100:])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_piece_table_typing_runs(monkeypatch, seed):
+    """
+    Check runs of typing at random places, with snapshots taken in the
+    middle of runs, against a string. Blocks are kept small so runs fill
+    them.
+    """
+    monkeypatch.setattr(text_storage, "ADD_BLOCK_SIZE", 8)
+    rng = random.Random(seed)
+    storage = PieceTable(LOREM_IPSUM[:200])
+    expected = LOREM_IPSUM[:200]
+    snapshots = []
+    for _ in range(50):
+        pos = rng.randint(0, len(expected))
+        if rng.random() < 0.2:
+            end = min(len(expected), pos + rng.randint(1, 5))
+            storage.delete(pos, end)
+            expected = expected[:pos] + expected[end:]
+            continue
+        for _ in range(rng.randint(1, 20)):
+            char = rng.choice("ab\n")
+            storage.insert(pos, char)
+            expected = expected[:pos] + char + expected[pos:]
+            pos += 1
+            if rng.random() < 0.1:
+                snapshots.append((storage.snapshot(), expected))
+        assert storage.text == expected
+    assert all(len(block) <= 8 for block in storage._add)
+    for snapshot, text in snapshots:
+        assert snapshot.text == text
+
+
+def test_line_lookups(storage_class, initial_text):
+    """
+    Check the newline counts and line starts against the string they hold.
+    """
+    storage = storage_class(initial_text)
+    storage.insert(len(initial_text) // 2, "\nmiddle\n")
+    text = initial_text[:len(initial_text)//2] + "\nmiddle\n" + \
+        initial_text[len(initial_text)//2:]
+
+    assert storage.newline_count() == text.count("\n")
+    for pos in range(len(text) + 1):
+        assert storage.newlines_before(pos) == text.count("\n", 0, pos)
+
+    line_starts = [0] + [i + 1 for i, char in enumerate(text) if char == "\n"]
+    for line, start in enumerate(line_starts):
+        assert storage.line_start(line) == start
+    assert storage.line_start(len(line_starts)) == len(text)
+
+
+def test_rope_balanced():
+    """
+    Check that a rope stays balanced after many edits at one spot.
+    """
+    text = "line of text\n" * 20000
+    rope = Rope(text)
+    for i in range(2000):
+        rope.insert(1000, "x" * 50)
+        rope.delete(len(text) // 2, len(text) // 2 + 40)
+
+    leaves = len(rope) // LEAF_SIZE + 1
+    # An AVL tree is never more than 1.45 times the optimal height.
+    assert rope.height <= 1.45 * leaves.bit_length() + 2
+    assert rope.newline_count() == rope.text.count("\n")
+
+
+def test_gap_buffer_gap_stays_at_point():
+    """
+    Check that the gap only moves when the edit position jumps.
+    """
+    storage = GapBuffer(LOREM_IPSUM)
+    storage.insert(100, "a")
+    assert storage.gap_position == 101
+    array = storage._array
+
+    # Typing and deleting at the gap does not move or reallocate anything
+    for i in range(50):
+        storage.insert(101 + i, "b")
+    storage.delete(140, 151)
+    assert storage.gap_position == 140
+    assert storage._array is array
+
+    storage.insert(10, "c")
+    assert storage.gap_position == 11
+    assert storage.text == (LOREM_IPSUM[:10] + "c" + LOREM_IPSUM[10:100] +
+                            "a" + "b" * 39 + LOREM_IPSUM[100:])
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_utf8_storage_small_chunks(monkeypatch, seed):
+    """
+    Check UTF-8 storage against a string when chunks are small enough to be
+    split, emptied, and joined by edits, with text of every width.
+    """
+    monkeypatch.setattr(utf8_storage, "CHUNK_SIZE", 16)
+    monkeypatch.setattr(utf8_storage, "STRIDE", 4)
+    rng = random.Random(seed)
+    alphabet = "ab \néß日本😀"
+    text = "".join(rng.choice(alphabet) for _ in range(300))
+    storage = Utf8Storage(text)
+    assert storage.chunk_count > 10
+    snapshot = storage.snapshot()
+    for _ in range(300):
+        start = rng.randint(0, len(text))
+        if rng.random() < 0.5:
+            string = "".join(rng.choice(alphabet)
+                             for _ in range(rng.randint(1, 40)))
+            storage.insert(start, string)
+            text = text[:start] + string + text[start:]
+        else:
+            end = rng.randint(start, min(len(text), start + 60))
+            assert storage.delete(start, end) == text[start:end]
+            text = text[:start] + text[end:]
+        assert len(storage) == len(text)
+        first = rng.randint(0, len(text))
+        last = rng.randint(first, len(text))
+        assert storage.slice(first, last) == text[first:last]
+        assert storage.newlines_before(first) == text.count("\n", 0, first)
+    assert storage.text == text
+    assert storage.byte_length == len(text.encode("utf-8"))
+    assert snapshot.text != text
+
+    line_starts = [0] + [i + 1 for i, char in enumerate(text) if char == "\n"]
+    for line, start in enumerate(line_starts):
+        assert storage.line_start(line) == start
+
+
+def test_utf8_storage_compact():
+    """
+    Check that one wide character only widens the chunk it is in.
+    """
+    text = "a" * 1000000 + "😀"
+    storage = Utf8Storage(text)
+    assert storage.byte_length == 1000004
+
+
+@pytest.mark.parametrize("storage_class", [PieceTable, Rope, Utf8Storage])
+def test_from_file(tmp_path, storage_class):
+    """
+    Check that storage read from a file holds its text, with line endings
+    turned into newlines.
+    """
+    path = tmp_path / "file.txt"
+    path.write_bytes("a😀\r\nb\rc\n".encode("utf-8") * 5000)
+    storage = storage_class.from_file(str(path))
+    assert storage.text == "a😀\nb\nc\n" * 5000
+
+
+def test_utf8_storage_from_file_not_utf8(tmp_path):
+    """
+    Check that a file that is not UTF-8 is refused, not stored as garbage.
+    """
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"a" * 100000 + b"\xff")
+    with pytest.raises(UnicodeDecodeError):
+        Utf8Storage.from_file(str(path))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_ring_storage_log(seed):
+    """
+    Check ring storage against a string when used as a log: appending at the
+    end and cutting from the start, long enough to wrap around the ring and
+    grow it.
+    """
+    rng = random.Random(seed)
+    storage = RingStorage()
+    text = ""
+    for _ in range(500):
+        if rng.random() < 0.6:
+            string = "".join(rng.choice("ab\n")
+                             for _ in range(rng.randint(1, 20)))
+            storage.insert(len(text), string)
+            text += string
+        else:
+            end = rng.randint(0, min(len(text), 30))
+            assert storage.delete(0, end) == text[:end]
+            text = text[end:]
+        assert len(storage) == len(text)
+        assert storage.newline_count() == text.count("\n")
+        first = rng.randint(0, len(text))
+        last = rng.randint(first, len(text))
+        assert storage.slice(first, last) == text[first:last]
+        assert storage.newlines_before(first) == text.count("\n", 0, first)
+    assert storage.text == text
+
+    line_starts = [0] + [i + 1 for i, char in enumerate(text) if char == "\n"]
+    for line, start in enumerate(line_starts):
+        assert storage.line_start(line) == start
+
+
+def test_ring_storage_reuses_slots():
+    """
+    Check that a log cut to a fixed number of lines stops growing the ring.
+    """
+    storage = RingStorage()
+    for number in range(10000):
+        storage.insert(len(storage), f"line {number}\n")
+        if storage.newline_count() > 100:
+            storage.delete(0, storage.line_start(1))
+    assert storage.capacity == 128
+    assert storage.text.split("\n")[0] == "line 9900"
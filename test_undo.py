@@ -0,0 +1,203 @@
+"""
+Unit tests for undo and redo.
+"""
+
+
+#pylint: skip-file
+
+import random
+
+import pytest
+
+import undo
+from undo import UndoLog
+from buff import Buffer
+
+from test_buff import LOREM_IPSUM
+
+
+@pytest.fixture
+def buff():
+    """
+    Return a buffer holding Lorem Ipsum with point at the start.
+    """
+    buff = Buffer()
+    buff._text = LOREM_IPSUM
+    return buff
+
+
+def type_text(buff, text):
+    """
+    Type text into a buffer a character at a time, like the controller does.
+    """
+    for char in text:
+        buff.undo_amalgamate()
+        buff.insert(char)
+        buff.undo_boundary()
+
+
+def test_undo_redo_random_edits(buff):
+    """
+    Check that undoing every command gets back every earlier text, and redoing
+    gets them back again in order.
+    """
+    rand = random.Random(42)
+    texts = [buff.text]
+    for _ in range(200):
+        length = len(buff.text)
+        choice = rand.random()
+        if choice < 0.4:
+            buff.set_point(rand.randint(0, length))
+            buff.insert(rand.choice(["a", "bc", "\n", "déf\nghi"]))
+        elif choice < 0.7:
+            buff.set_point(rand.randint(0, length))
+            buff.delete_char(rand.randint(-5, 5))
+        elif choice < 0.9:
+            start = rand.randint(0, length)
+            buff.apply_edits([(start, start + 3, "x"), (0, 0, "y")])
+        else:
+            buff.set_point(rand.randint(0, length))
+            buff.set_mark(rand.randint(0, length))
+            buff.delete_region()
+        buff.undo_boundary()
+        if buff.text != texts[-1]:
+            texts.append(buff.text)
+
+    for text in reversed(texts[:-1]):
+        assert buff.undo()
+        assert buff.text == text
+    assert not buff.undo()
+
+    for text in texts[1:]:
+        assert buff.redo()
+        assert buff.text == text
+    assert not buff.redo()
+
+
+def test_typing_coalesced(buff):
+    """
+    Check that typed characters are undone in runs of COALESCE_LIMIT.
+    """
+    typed = "x" * (undo.COALESCE_LIMIT + 5)
+    type_text(buff, typed)
+    assert len(buff._shared.undo_log._undo) == 2
+
+    assert buff.undo()
+    assert buff.text == "x" * undo.COALESCE_LIMIT + LOREM_IPSUM
+    assert buff.undo()
+    assert buff.text == LOREM_IPSUM
+    assert buff.point == 0
+
+
+def test_typing_not_coalesced_with_other_commands(buff):
+    """
+    Check that typing after another command starts a new undo group.
+    """
+    buff.insert("yank")
+    buff.undo_boundary()
+    type_text(buff, "abc")
+
+    assert buff.undo()
+    assert buff.text == "yank" + LOREM_IPSUM
+    assert buff.undo()
+    assert buff.text == LOREM_IPSUM
+
+
+def test_repeated_boundary():
+    """
+    Check that a second boundary with no command in between counts as a
+    command that did not type, so it ends a run of typing. The controller
+    must end each command in a buffer once.
+    """
+    log = UndoLog()
+    for pos, char in enumerate("ab"):
+        log.amalgamate()
+        log.record(pos, "", char)
+        log.boundary()
+    assert len(log._undo) == 1
+
+    log.boundary()
+    log.amalgamate()
+    log.record(2, "", "c")
+    log.boundary()
+    assert [group.records for group in log._undo] == [[(0, "", "ab")],
+                                                     [(2, "", "c")]]
+
+
+def test_backspace_coalesced():
+    """
+    Check that deleting a run of characters one at a time in one command is
+    kept as one delta.
+    """
+    log = UndoLog()
+    log.record(10, "c", "")
+    log.record(9, "b", "")
+    log.record(8, "a", "")
+    log.record(8, "d", "")
+    assert log._undo[-1].records == [(8, "abcd", "")]
+
+
+def test_new_edit_clears_redo(buff):
+    """
+    Check that editing after an undo makes redo impossible.
+    """
+    buff.insert("one")
+    buff.undo_boundary()
+    buff.undo()
+    buff.insert("two")
+    assert not buff.redo()
+    assert buff.text == "two" + LOREM_IPSUM
+
+
+def test_memory_cap():
+    """
+    Check that the oldest groups are dropped once the log is over its cap.
+    """
+    buff = Buffer()
+    buff._shared.undo_log.limit = 10000
+    for i in range(1000):
+        buff.insert(f"edit {i}\n")
+        buff.undo_boundary()
+    assert buff._shared.undo_log.size <= 10000
+
+    undone = 0
+    while buff.undo():
+        undone += 1
+    assert 0 < undone < 1000
+    # The newest edits were the ones kept
+    assert buff.text == "".join(f"edit {i}\n" for i in range(1000 - undone))
+
+
+def test_memory_cap_keeps_newest_group():
+    """
+    Check that a single group over the cap is still kept.
+    """
+    buff = Buffer()
+    buff._shared.undo_log.limit = 10
+    buff.insert(LOREM_IPSUM)
+    assert buff.undo()
+    assert buff.text == ""
+
+
+def test_read_only(buff):
+    """
+    Check that read only buffers neither log edits nor undo.
+    """
+    buff._read_only = True
+    buff.append("message")
+    assert buff._shared.undo_log.size == 0
+    assert not buff.undo()
+    assert buff.text == LOREM_IPSUM + "message"
+
+
+def test_revert_clears_log(tmp_path, buff):
+    """
+    Check that reverting forgets edits made to the old text.
+    """
+    path = tmp_path / "file.txt"
+    path.write_text("on disk")
+    buff.insert("edit")
+    buff._path = str(path)
+    buff.revert()
+    assert not buff.undo()
+    assert buff.text == "on disk"
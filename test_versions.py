@@ -0,0 +1,138 @@
+"""
+Unit tests for versioned snapshots read from other threads.
+"""
+
+
+#pylint: skip-file
+
+import threading
+import time
+
+import pytest
+
+from buff import Buffer
+from gap_buffer import GapBuffer
+from rope import Rope
+from text_storage import PieceTable, StringStorage
+from utf8_storage import Utf8Storage
+
+
+storage_classes = [StringStorage, PieceTable, GapBuffer, Rope, Utf8Storage]
+
+
+@pytest.fixture(params=storage_classes)
+def storage_class(request):
+    """
+    Return a text storage class for buffers to use.
+    """
+    return request.param
+
+
+def test_pinned_version_unchanged(storage_class):
+    """
+    Check that edits after pinning do not show up in the version.
+    """
+    buff = Buffer(storage=storage_class)
+    buff.insert("hello world")
+    with buff.pin_version() as version:
+        buff.apply_edits([(0, 5, "goodbye"), (11, 11, "!")])
+        assert version.text == "hello world"
+        assert version.tick == buff.modification_tick - 1
+        assert version.point == 11
+        assert buff.text == "goodbye world!"
+
+
+def test_versions_shared_and_freed():
+    """
+    Check that readers of the same tick share a version, and that it is freed
+    when the last one releases it.
+    """
+    buff = Buffer()
+    buff.insert("text")
+    first = buff.pin_version()
+    second = buff.pin_version()
+    shared = first._version
+    assert second._version is shared
+    assert shared.readers == 2
+
+    buff.insert("more")
+    third = buff.pin_version()
+    assert third._version is not shared
+
+    first.release()
+    first.release()
+    assert shared.readers == 1
+    assert shared.storage is not None
+    second.release()
+    assert shared.storage is None
+    assert second._storage is None
+    assert third.text == "textmore"
+    third.release()
+    assert buff._shared.versions._latest is None
+
+
+def test_indirect_buffers_share_versions():
+    """
+    Check that a version is shared by a buffer and its indirect buffers, each
+    seeing its own point.
+    """
+    buff = Buffer()
+    buff.insert("shared text")
+    indirect = Buffer(base=buff)
+    indirect.set_point(3)
+    with buff.pin_version() as one, indirect.pin_version() as two:
+        assert one._version is two._version
+        assert (one.point, two.point) == (11, 3)
+
+
+@pytest.mark.parametrize("storage_class", [PieceTable, Rope, Utf8Storage])
+def test_concurrent_readers(storage_class):
+    """
+    Check that readers in other threads only ever see whole edits while a
+    writer keeps editing, and that neither side stalls the other.
+
+    Every edit inserts an "a" at the start and a "b" at the end together, so
+    a reader seeing half an edit would see more of one than the other. The
+    length of the text also has to match the tick of the version.
+    """
+    buff = Buffer(storage=storage_class)
+    start_tick = buff.modification_tick
+    stop = threading.Event()
+    errors = []
+    reads = []
+
+    def read():
+        count = 0
+        while not stop.is_set():
+            with buff.pin_version() as version:
+                text = version.text
+                edits = version.tick - start_tick
+                if text != "a" * edits + "b" * edits:
+                    errors.append((version.tick, text))
+                    return
+                if version.line_count != 1:
+                    errors.append((version.tick, version.line_count))
+                    return
+            count += 1
+        reads.append(count)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+
+    writes = 0
+    deadline = time.monotonic() + 0.5
+    while time.monotonic() < deadline:
+        length = buff.length
+        buff.apply_edits([(0, 0, "a"), (length, length, "b")])
+        writes += 1
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert errors == []
+    assert buff.text == "a" * writes + "b" * writes
+    # Both sides made progress
+    assert writes > 100
+    assert len(reads) == 4 and min(reads) > 10
+    assert buff._shared.versions._latest is None
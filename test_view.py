@@ -0,0 +1,161 @@
+"""
+Unit tests for the view.
+
+Drawing is checked against a stand-in window that records what is drawn on
+it, so no terminal is needed.
+"""
+
+
+#pylint: skip-file
+
+import curses
+
+import pytest
+
+from ihmacs_class import IhmacsSansCurses
+from view import View, face_attributes, fit_line
+
+
+class FakeWindow:
+    """
+    A window that keeps the characters and attributes drawn on it.
+    """
+
+    def __init__(self, lines, cols):
+        self.chars = [[" "] * cols for _ in range(lines)]
+        self.attributes = [[curses.A_NORMAL] * cols for _ in range(lines)]
+        self.cursor = (0, 0)
+
+    def addstr(self, line, col, text, attributes=curses.A_NORMAL):
+        for i, char in enumerate(text):
+            self.chars[line][col + i] = char
+            self.attributes[line][col + i] = attributes
+
+    def chgat(self, line, col, num, attributes):
+        for i in range(col, col + num):
+            self.attributes[line][i] = attributes
+
+    def move(self, line, col):
+        self.cursor = (line, col)
+
+    def row(self, line):
+        return "".join(self.chars[line]).rstrip()
+
+    def attribute_row(self, line, attributes):
+        """
+        Return a line as a string with x where it has the attributes.
+        """
+        return "".join("x" if attribute == attributes else "."
+                       for attribute in self.attributes[line])
+
+
+class IhmacsFakeTerminal(IhmacsSansCurses):
+    """
+    An Ihmacs session drawing on a FakeWindow.
+    """
+
+    term_size = (6, 10)
+
+    def __init__(self, files):
+        super().__init__(files)
+        self.window = FakeWindow(*self.term_size)
+
+
+@pytest.fixture
+def ihmacs():
+    """
+    Return an Ihmacs session on a 6 by 10 fake terminal.
+    """
+    return IhmacsFakeTerminal([])
+
+
+def draw(ihmacs, point):
+    """
+    Draw the active buffer with point at a position.
+    """
+    buff = ihmacs.active_buff()
+    buff.set_point(point)
+    View(ihmacs)._redraw_buffer()
+    return ihmacs.window
+
+
+@pytest.mark.parametrize("face,attributes", [
+    ("bold", curses.A_BOLD),
+    (["bold", "underline"], curses.A_BOLD | curses.A_UNDERLINE),
+    ("sparkly", curses.A_NORMAL),
+    (["reverse", "sparkly"], curses.A_REVERSE),
+])
+def test_face_attributes(face, attributes):
+    """
+    Check that faces map to their curses attributes.
+    """
+    assert face_attributes(face) == attributes
+
+
+fit_line_cases = [
+    ("short", 10, None, ("short", 0, 5, 0)),
+    ("0123456789", 10, None, ("0123456789", 0, 10, 0)),
+    ("0123456789ab", 10, None, ("012345678$", 0, 9, 0)),
+    ("0123456789ab", 10, 9, ("012345678$", 0, 9, 0)),
+    ("0123456789ab", 10, 12, ("$456789ab ", 4, 12, -3)),
+    ("0123456789ab", 10, 10, ("$23456789$", 2, 10, -1)),
+]
+
+
+@pytest.mark.parametrize("text,term_cols,point_col,result", fit_line_cases)
+def test_fit_line(text, term_cols, point_col, result):
+    """
+    Check how lines are truncated, and scrolled to show point.
+    """
+    assert fit_line(text, term_cols, point_col) == result
+
+
+def test_faces(ihmacs):
+    """
+    Check that faces are drawn over their text, across lines.
+    """
+    buff = ihmacs.active_buff()
+    buff._text = "abc\ndefgh\nij"
+    buff.put_text_property(1, 6, "face", "bold")
+    window = draw(ihmacs, 0)
+    assert window.row(1) == "defgh"
+    assert window.attribute_row(0, curses.A_BOLD) == ".xx......."
+    assert window.attribute_row(1, curses.A_BOLD) == "xx........"
+    assert window.attribute_row(2, curses.A_BOLD) == ".........."
+
+
+def test_faces_truncated_line(ihmacs):
+    """
+    Check that faces stop before the $ of a truncated line.
+    """
+    buff = ihmacs.active_buff()
+    buff._text = "0123456789abc\nx"
+    buff.put_text_property(6, 13, "face", "underline")
+    window = draw(ihmacs, 14)
+    assert window.row(0) == "012345678$"
+    assert window.attribute_row(0, curses.A_UNDERLINE) == "......xxx."
+
+
+def test_faces_scrolled_line(ihmacs):
+    """
+    Check that faces on the line with point follow it when it scrolls
+    sideways, and are not wiped by drawing it.
+    """
+    buff = ihmacs.active_buff()
+    buff._text = "0123456789abcdef"
+    buff.put_text_property(2, 4, "face", "bold")
+    buff.put_text_property(10, 12, "face", "reverse")
+    window = draw(ihmacs, 14)
+    assert window.row(0) == "$6789abcd$"
+    assert window.attribute_row(0, curses.A_REVERSE) == ".....xx..."
+    assert window.attribute_row(0, curses.A_BOLD) == ".........."
+    assert window.cursor == (0, 9)
+
+
+def test_cursor(ihmacs):
+    """
+    Check that the cursor is put on point.
+    """
+    ihmacs.active_buff()._text = "abc\ndefgh"
+    window = draw(ihmacs, 6)
+    assert window.cursor == (1, 2)
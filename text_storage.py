@@ -0,0 +1,462 @@
+"""
+Text storage engines for Ihmacs buffers.
+
+A buffer does not hold its text as a single string. Instead it holds a storage
+object, which owns the text and knows how to edit it. Every storage engine
+implements the interface defined by TextStorage, so the buffer can swap one
+engine for another without any of the editing commands noticing.
+
+Positions are always measured in characters, and always index at 0.
+"""
+
+from line_index import LineIndex
+
+
+# The most characters a piece table adds to one block of its add buffer. A
+# run of typing grows its block, copying it, so this bounds that copy.
+ADD_BLOCK_SIZE = 16 * 1024
+
+
+class TextStorage:
+    """
+    Base class and interface for all text storage engines.
+
+    Subclasses must implement __len__, text, slice, insert, and delete.
+    """
+
+    def __init__(self, text=""):
+        """
+        Initialize storage holding text.
+
+        Args:
+            text: A string representing the initial contents of the storage.
+        """
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Make storage holding the text of a file.
+
+        Args:
+            path: A string representing the path of the file.
+
+        Returns:
+            An instance of the class.
+        """
+        with open(path, "r") as disk_file:
+            return cls(disk_file.read())
+
+    def __len__(self):
+        """
+        Return the number of characters in the storage.
+        """
+        raise NotImplementedError
+
+    @property
+    def text(self):
+        """
+        Return the entire contents of the storage as a string.
+        """
+        raise NotImplementedError
+
+    def slice(self, start, end):
+        """
+        Return the text between two positions.
+
+        Args:
+            start: An int representing the position to start at.
+            end: An int representing the position to end at (exclusive).
+
+        Returns:
+            A string representing the text between start and end.
+        """
+        raise NotImplementedError
+
+    def clamp(self, pos):
+        """
+        Return a position, or the end of the storage if it is past the end.
+
+        Storage that works out its length lazily overrides this to look only
+        as far as the position.
+
+        Args:
+            pos: An int representing a position.
+        """
+        return min(pos, len(self))
+
+    def insert(self, pos, text):
+        """
+        Insert text at a position.
+
+        Args:
+            pos: An int representing where to insert the text.
+            text: A string to insert.
+        """
+        raise NotImplementedError
+
+    def delete(self, start, end):
+        """
+        Delete the text between two positions.
+
+        Args:
+            start: An int representing the position to start deleting at.
+            end: An int representing the position to stop deleting at
+                (exclusive).
+
+        Returns:
+            A string representing the deleted text.
+        """
+        raise NotImplementedError
+
+    def replace_many(self, edits):
+        """
+        Replace several spans of text at once.
+
+        The edits are applied back to front, so the positions of edits not
+        yet applied are still valid. Engines that can do better in one pass
+        override this.
+
+        Args:
+            edits: A list of (start, end, text) tuples, sorted by position and
+                not overlapping. Positions are those before any of the edits.
+                The text between start and end is replaced by text.
+
+        Returns:
+            A list of strings representing the text each edit replaced.
+        """
+        deleted = []
+        for start, end, text in reversed(edits):
+            deleted.append(self.delete(start, end) if start < end else "")
+            if text:
+                self.insert(start, text)
+        deleted.reverse()
+        return deleted
+
+    def snapshot(self):
+        """
+        Return a storage holding a copy of the text as it is now.
+
+        The copy must not change when this storage is edited afterwards, and
+        must not be edited itself. Engines that can share their structure with
+        the copy override this to make it cheap. This fallback copies the
+        text.
+        """
+        return StringStorage(self.text)
+
+    def line_index(self):
+        """
+        Return a line index for the text in the storage.
+
+        The buffer keeps the index up to date as it edits the storage.
+        Engines that track their own lines return an index that asks them
+        instead.
+        """
+        return LineIndex(self.text)
+
+    # Line lookups. These fall back on scanning the materialized text.
+    # Engines that track newlines themselves override them.
+
+    def newlines_before(self, pos):
+        """
+        Return the number of newlines before a position.
+
+        Args:
+            pos: An int representing a position in the storage.
+        """
+        return self.text.count("\n", 0, pos)
+
+    def newline_count(self):
+        """
+        Return the number of newlines in the storage.
+        """
+        return self.text.count("\n")
+
+    def line_start(self, line):
+        """
+        Return the position a line starts at.
+
+        Args:
+            line: An int representing a line number. Lines index at 0 here.
+
+        Returns:
+            An int representing the position just after the newline ending the
+            previous line. If the line does not exist, the length of the
+            storage.
+        """
+        text = self.text
+        pos = 0
+        for _ in range(line):
+            pos = text.find("\n", pos) + 1
+            if pos == 0:
+                return len(text)
+        return pos
+
+
+class StringStorage(TextStorage):
+    """
+    Store text as a single Python string.
+
+    This is how buffers used to store text. Every edit rebuilds the entire
+    string, so edits cost O(size of the text). It is kept around because it is
+    simple and very fast for small buffers.
+
+    Attributes:
+        _text: A string representing the stored text.
+    """
+
+    def __init__(self, text=""):
+        super().__init__(text)
+        self._text = text
+
+    def __len__(self):
+        return len(self._text)
+
+    @property
+    def text(self):
+        return self._text
+
+    def slice(self, start, end):
+        return self._text[start:end]
+
+    def snapshot(self):
+        # Strings are immutable, so share it
+        return StringStorage(self._text)
+
+    def insert(self, pos, text):
+        self._text = self._text[:pos] + text + self._text[pos:]
+
+    def delete(self, start, end):
+        deleted_text = self._text[start:end]
+        self._text = self._text[:start] + self._text[end:]
+        return deleted_text
+
+    def replace_many(self, edits):
+        # Rebuild the string once rather than once per edit
+        old_text = self._text
+        parts = []
+        deleted = []
+        pos = 0
+        for start, end, text in edits:
+            parts.append(old_text[pos:start])
+            parts.append(text)
+            deleted.append(old_text[start:end])
+            pos = end
+        parts.append(old_text[pos:])
+        self._text = "".join(parts)
+        return deleted
+
+
+class PieceTable(TextStorage):
+    """
+    Store text as a piece table.
+
+    The original text is never modified. Inserted text is appended to an add
+    buffer, which is also never modified. The text of the storage is described
+    by a list of pieces, each of which points at a span of either the original
+    text or the add buffer. Edits only split, insert, and drop pieces, so they
+    cost O(pieces touched) rather than O(size of the text).
+
+    Finding the piece that holds a position requires walking the piece list.
+    The last piece found is remembered, so runs of edits at the same place
+    (typing, for instance) only walk a piece or two. Typing also grows the
+    piece it continues rather than adding a piece per character.
+
+    Attributes:
+        _original: A string representing the text the storage was created
+            with.
+        _add: A list of strings representing the add buffer, in blocks of
+            up to ADD_BLOCK_SIZE characters. An insertion continuing the one
+            before it is added to the last block, anything else starts a new
+            block.
+        _pieces: A list of (source, start, end) tuples. Source is the string
+            (either _original or a block of _add) the piece points into,
+            start and end are the span of source the piece covers.
+        _length: An int representing the number of characters in the storage.
+        _cache: A string representing the materialized text, or None if the
+            storage has been edited since the text was last materialized.
+        _cursor: A tuple (index, position) of the last piece located and the
+            position in the text where that piece starts.
+        _shared: A bool representing whether _pieces is shared with a
+            snapshot, and must be copied before it is edited.
+    """
+
+    def __init__(self, text=""):
+        super().__init__(text)
+        self._original = text
+        self._add = []
+        self._pieces = [(text, 0, len(text))] if text else []
+        self._length = len(text)
+        self._cache = text
+        self._cursor = (0, 0)
+        self._shared = False
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def text(self):
+        if self._cache is None:
+            self._cache = "".join([source[start:end]
+                                   for source, start, end in self._pieces])
+        return self._cache
+
+    def snapshot(self):
+        # The strings pieces point into are never modified, so a snapshot only
+        # needs the piece list. That is shared until the next edit copies it.
+        snapshot = PieceTable()
+        snapshot._original = self._original
+        snapshot._pieces = self._pieces
+        snapshot._length = self._length
+        snapshot._cache = self._cache
+        snapshot._shared = True
+        self._shared = True
+        return snapshot
+
+    def _unshare(self):
+        """
+        Copy the piece list if a snapshot shares it, before editing it.
+        """
+        if self._shared:
+            self._pieces = list(self._pieces)
+            self._shared = False
+
+    @property
+    def piece_count(self):
+        """
+        Return the number of pieces in the piece table.
+        """
+        return len(self._pieces)
+
+    def _locate(self, pos):
+        """
+        Find the piece containing a position.
+
+        Walks the piece list from the last piece located.
+
+        Args:
+            pos: An int between 0 and the length of the storage.
+
+        Returns:
+            A tuple (index, piece_start). Index is the index of the piece
+            containing pos, and piece_start is the position the piece starts
+            at. If pos is the end of the storage, index is the number of
+            pieces.
+        """
+        pieces = self._pieces
+        index, piece_start = self._cursor
+
+        # Walk backwards until the piece starts at or before pos.
+        while piece_start > pos:
+            index -= 1
+            source_start, source_end = pieces[index][1:]
+            piece_start -= source_end - source_start
+
+        # Walk forwards until pos lies inside the piece.
+        while index < len(pieces):
+            source_start, source_end = pieces[index][1:]
+            piece_end = piece_start + source_end - source_start
+            if pos < piece_end:
+                break
+            index += 1
+            piece_start = piece_end
+
+        self._cursor = (index, piece_start)
+        return index, piece_start
+
+    def slice(self, start, end):
+        if self._cache is not None:
+            return self._cache[start:end]
+        end = min(end, self._length)
+        if start >= end:
+            return ""
+
+        pieces = self._pieces
+        index, piece_start = self._locate(start)
+
+        parts = []
+        while piece_start < end:
+            source, source_start, source_end = pieces[index]
+            # Clip the piece to the requested span
+            offset = max(0, start - piece_start)
+            stop = min(source_end - source_start, end - piece_start)
+            parts.append(source[source_start+offset:source_start+stop])
+            piece_start += source_end - source_start
+            index += 1
+        return "".join(parts)
+
+    def insert(self, pos, text):
+        if text == "":
+            return
+
+        self._unshare()
+        pieces = self._pieces
+        index, piece_start = self._locate(pos)
+
+        # Continue the piece ending at pos if it ends at the end of the add
+        # buffer, as it does while typing
+        if pos == piece_start and index > 0 and self._add:
+            source, source_start, source_end = pieces[index-1]
+            block = self._add[-1]
+            if (source is block and source_end == len(block)
+                    and len(block) + len(text) <= ADD_BLOCK_SIZE):
+                block += text
+                self._add[-1] = block
+                pieces[index-1] = (block, source_start,
+                                   source_end + len(text))
+                self._cursor = (index-1, pos - (source_end - source_start))
+                self._length += len(text)
+                self._cache = None
+                return
+
+        self._add.append(text)
+        new_piece = (text, 0, len(text))
+        if pos == piece_start:
+            # Insert between two pieces
+            pieces.insert(index, new_piece)
+        else:
+            # Split the piece in two around the new piece
+            source, source_start, source_end = pieces[index]
+            split = source_start + pos - piece_start
+            pieces[index:index+1] = [(source, source_start, split),
+                                     new_piece,
+                                     (source, split, source_end)]
+            index += 1
+
+        self._cursor = (index, pos)
+        self._length += len(text)
+        self._cache = None
+
+    def delete(self, start, end):
+        if start >= end:
+            return ""
+
+        self._unshare()
+        pieces = self._pieces
+        index, piece_start = self._locate(start)
+
+        deleted_parts = []
+        kept_pieces = []
+        last = index
+        while piece_start < end:
+            source, source_start, source_end = pieces[last]
+            piece_end = piece_start + source_end - source_start
+
+            # Keep whatever part of the piece lies outside the deleted span.
+            cut_start = source_start + max(0, start - piece_start)
+            cut_end = source_start + min(piece_end, end) - piece_start
+            if cut_start > source_start:
+                kept_pieces.append((source, source_start, cut_start))
+            deleted_parts.append(source[cut_start:cut_end])
+            if cut_end < source_end:
+                kept_pieces.append((source, cut_end, source_end))
+
+            piece_start = piece_end
+            last += 1
+
+        # The cursor still points at the first piece touched. Whatever
+        # replaces it starts where it used to, so the cursor stays valid.
+        pieces[index:last] = kept_pieces
+        self._length -= end - start
+        self._cache = None
+
+        return "".join(deleted_parts)
@@ -0,0 +1,282 @@
+"""
+Undo and redo for Ihmacs buffers.
+
+Keeping a copy of the whole text for every edit would multiply memory by the
+number of edits. Instead every edit is logged as a delta: a tuple (position,
+deleted text, inserted text). Undoing a delta replaces the inserted text at
+position with the deleted text again, which in turn is logged as a delta to
+redo.
+
+Deltas are grouped between undo boundaries, and one undo undoes one group. The
+controller sets a boundary after every command, so one undo undoes one command.
+Runs of typed characters are the exception: they are coalesced into a single
+delta, up to COALESCE_LIMIT characters, so undo takes back a word or so of
+typing rather than one letter.
+
+The log has a memory cap. When it grows past it, the oldest groups are dropped
+first. The newest group is always kept, however big.
+"""
+
+import sys
+from collections import deque
+
+
+# Roughly how many bytes the undo log of a buffer may use.
+UNDO_LIMIT = 4 * 1024 * 1024
+
+# How many typed characters may be coalesced into one delta.
+COALESCE_LIMIT = 20
+
+# Bytes a delta tuple, its position, and its slot in a list take, on top of its
+# strings.
+RECORD_OVERHEAD = sys.getsizeof((0, "", "")) + sys.getsizeof(2**40) + 8
+
+# Bytes an empty group and its list of deltas take.
+GROUP_OVERHEAD = 64 + sys.getsizeof([])
+
+
+def _record_size(record):
+    """
+    Return roughly how many bytes a delta takes in memory.
+    """
+    _, deleted, inserted = record
+    return (RECORD_OVERHEAD + sys.getsizeof(deleted) +
+            sys.getsizeof(inserted))
+
+
+def _coalesce(last, record):
+    """
+    Join two deltas into one, if the second simply continues the first.
+
+    Inserts right after an insert are joined, and so are deletes right before
+    (backspacing) or at (deleting forward) a delete.
+
+    Args:
+        last: A tuple (pos, deleted, inserted) representing the earlier delta.
+        record: A tuple (pos, deleted, inserted) representing the later delta.
+
+    Returns:
+        A tuple representing both deltas, or None if they cannot be joined.
+    """
+    last_pos, last_deleted, last_inserted = last
+    pos, deleted, inserted = record
+    if not last_deleted and not deleted:
+        if pos == last_pos + len(last_inserted):
+            return (last_pos, "", last_inserted + inserted)
+    elif not last_inserted and not inserted:
+        if pos + len(deleted) == last_pos:
+            return (pos, deleted + last_deleted, "")
+        if pos == last_pos:
+            return (pos, last_deleted + deleted, "")
+    return None
+
+
+# pylint: disable=R0903
+class _UndoGroup:
+    """
+    The deltas of one undoable step, in the order they happened.
+
+    Attributes:
+        records: A list of (pos, deleted, inserted) tuples.
+        size: An int representing roughly how many bytes the deltas take.
+    """
+
+    __slots__ = ("records", "size")
+
+    def __init__(self):
+        self.records = []
+        self.size = GROUP_OVERHEAD
+
+    def add(self, record, coalesce=True):
+        """
+        Add a delta to the group, joining it to the last one if possible.
+
+        Returns:
+            An int representing how many bytes the group grew by.
+        """
+        records = self.records
+        before = self.size
+        if coalesce and records:
+            joined = _coalesce(records[-1], record)
+            if joined is not None:
+                self.size -= _record_size(records[-1])
+                records[-1] = joined
+                self.size += _record_size(joined)
+                return self.size - before
+        records.append(record)
+        self.size += _record_size(record)
+        return self.size - before
+
+
+class UndoLog:
+    """
+    A log of deltas that can be undone and redone.
+
+    Attributes:
+        limit: An int representing roughly how many bytes the log may use.
+        _undo: A deque of _UndoGroups that can be undone, oldest first.
+        _redo: A list of _UndoGroups that can be redone, most recently undone
+            last.
+        _open: The _UndoGroup edits are currently added to, or None if the
+            next edit starts a new group.
+        _size: An int representing roughly how many bytes the log uses.
+        _replaying: The _UndoGroup that edits made while undoing or redoing
+            are added to, or None if not undoing or redoing.
+        _typing: The _UndoGroup holding the latest run of typed characters,
+            or None if the last command was not typing.
+        _typed: A bool representing whether the current command is typing.
+    """
+
+    def __init__(self, limit=UNDO_LIMIT):
+        """
+        Initialize an empty undo log.
+
+        Args:
+            limit: An int representing roughly how many bytes the log may
+                use.
+        """
+        self.limit = limit
+        self.clear()
+
+    def clear(self):
+        """
+        Forget everything that could be undone or redone.
+        """
+        self._undo = deque()
+        self._redo = []
+        self._open = None
+        self._size = 0
+        self._replaying = None
+        self._typing = None
+        self._typed = False
+
+    @property
+    def size(self):
+        """
+        Return roughly how many bytes the log uses.
+        """
+        return self._size
+
+    def record(self, pos, deleted, inserted):
+        """
+        Log an edit.
+
+        Args:
+            pos: An int representing where the edit happened.
+            deleted: A string representing the text the edit removed.
+            inserted: A string representing the text the edit put in its
+                place.
+        """
+        record = (pos, deleted, inserted)
+
+        # Edits made by undo and redo go to the opposite list
+        if self._replaying is not None:
+            self._size += self._replaying.add(record, coalesce=False)
+            return
+
+        # A new edit makes whatever was undone impossible to redo
+        if self._redo:
+            self._size -= sum(group.size for group in self._redo)
+            self._redo.clear()
+
+        if self._open is None:
+            self._open = _UndoGroup()
+            self._undo.append(self._open)
+            self._size += self._open.size
+        self._size += self._open.add(record)
+        self._evict()
+
+    def boundary(self):
+        """
+        End the current group, so the next edit starts a new one.
+        """
+        if self._typed and self._open is not None:
+            self._typing = self._open
+        else:
+            self._typing = None
+        self._typed = False
+        self._open = None
+
+    def amalgamate(self):
+        """
+        Mark the current command as typing a character.
+
+        If the previous command was typing too, and its run is short enough,
+        the next edit continues its group instead of starting a new one.
+        """
+        self._typed = True
+        typing = self._typing
+        if (self._open is None and typing is not None
+                and self._undo and self._undo[-1] is typing
+                and len(typing.records) == 1
+                and len(typing.records[0][2]) < COALESCE_LIMIT):
+            self._open = typing
+
+    def undo(self, replace):
+        """
+        Undo the most recent group of edits.
+
+        Args:
+            replace: A function taking (start, end, text) that replaces the
+                text between start and end of the buffer with text. The edits
+                it makes are logged so they can be redone.
+
+        Returns:
+            A tuple (start, end) representing the span of the last change
+            undone, or None if there was nothing to undo.
+        """
+        self.boundary()
+        if not self._undo:
+            return None
+        group = self._undo.pop()
+        span, redo = self._replay(group, replace)
+        self._redo.append(redo)
+        return span
+
+    def redo(self, replace):
+        """
+        Redo the most recently undone group of edits.
+
+        Args:
+            replace: A function like the one given to undo.
+
+        Returns:
+            A tuple (start, end) representing the span of the last change
+            redone, or None if there was nothing to redo.
+        """
+        self.boundary()
+        if not self._redo:
+            return None
+        group = self._redo.pop()
+        span, undo = self._replay(group, replace)
+        self._undo.append(undo)
+        self._evict()
+        return span
+
+    def _replay(self, group, replace):
+        """
+        Reverse the deltas of a group, newest first.
+
+        Returns:
+            A tuple (span, group) where span is a tuple (start, end) of the
+            last change made and group is an _UndoGroup that reverses it.
+        """
+        self._size -= group.size
+        self._replaying = _UndoGroup()
+        self._size += self._replaying.size
+        try:
+            for pos, deleted, inserted in reversed(group.records):
+                replace(pos, pos + len(inserted), deleted)
+                span = (pos, pos + len(deleted))
+        finally:
+            reverse = self._replaying
+            self._replaying = None
+        return span, reverse
+
+    def _evict(self):
+        """
+        Drop the oldest groups until the log fits in its memory cap.
+        """
+        undo = self._undo
+        while self._size > self.limit and len(undo) > 1:
+            self._size -= undo.popleft().size
@@ -0,0 +1,462 @@
+"""
+UTF-8 text storage for Ihmacs buffers.
+
+CPython stores a string at 1, 2, or 4 bytes per character, whichever its widest
+character needs. A single emoji in a huge, otherwise ASCII file makes the whole
+string take 4 bytes per character. This storage holds the text as chunks of
+UTF-8 bytes instead, so every character takes only as many bytes as it needs,
+wherever it is.
+
+Positions are still measured in characters. Turning them into byte offsets goes
+through a sparse index in two levels:
+
+    1. Two Fenwick trees over the chunks, counting the characters and newlines
+       in every chunk, find the chunk holding a position or line in
+       O(log chunks), and are updated in O(log chunks) when a chunk is edited.
+    2. Within a chunk that is not pure ASCII, the byte offset of every STRIDE-th
+       character is recorded the first time it is needed, so only one stride
+       of the chunk is decoded to find a byte offset. In pure ASCII chunks,
+       characters and bytes line up and nothing needs recording.
+
+Chunks are split when they grow past twice CHUNK_SIZE bytes, and the Fenwick
+trees are rebuilt only then, or when a chunk is emptied.
+"""
+
+import codecs
+import copy
+
+from line_index import StorageLineIndex
+from text_storage import TextStorage
+
+
+# Size of a chunk of text, in bytes, when it is first stored.
+CHUNK_SIZE = 16 * 1024
+
+# How many characters apart the byte offsets of a chunk are recorded.
+STRIDE = 256
+
+ENCODING = "utf-8"
+
+
+def _is_continuation_byte(byte):
+    """
+    Return whether a byte continues a multibyte UTF-8 character.
+    """
+    return byte & 0b11000000 == 0b10000000
+
+
+def _split_chunks(data):
+    """
+    Split UTF-8 bytes into chunks of roughly CHUNK_SIZE bytes.
+
+    Never splits a character across chunks.
+
+    Args:
+        data: A bytes object of UTF-8 text.
+
+    Returns:
+        A list of bytes objects.
+    """
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = min(start + CHUNK_SIZE, len(data))
+        while end < len(data) and _is_continuation_byte(data[end]):
+            end += 1
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+def _char_count(chunk):
+    """
+    Return the number of characters in a chunk of UTF-8 bytes.
+    """
+    if chunk.isascii():
+        return len(chunk)
+    return len(chunk.decode(ENCODING))
+
+
+class _Fenwick:
+    """
+    A Fenwick tree of counts, for prefix sums and searches in O(log n).
+
+    Attributes:
+        _tree: A list of partial sums, indexing at 1.
+        _step: An int representing the highest power of two at most the
+            number of counts.
+    """
+
+    def __init__(self, counts):
+        """
+        Build a tree over a list of counts in O(n).
+        """
+        tree = [0] + list(counts)
+        size = len(counts)
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+        self._tree = tree
+        self._step = 1 << (size.bit_length() - 1) if size else 0
+
+    def add(self, index, amount):
+        """
+        Add amount to the count at index, indexing at 0.
+        """
+        tree = self._tree
+        index += 1
+        while index < len(tree):
+            tree[index] += amount
+            index += index & -index
+
+    def prefix(self, index):
+        """
+        Return the sum of the counts before index.
+        """
+        tree = self._tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def lower(self, target):
+        """
+        Find the most counts whose sum stays below target.
+
+        Returns:
+            A tuple (index, total) where total, the sum of the counts before
+            index, is below target, and adding the count at index would not
+            be.
+        """
+        tree = self._tree
+        index = 0
+        total = 0
+        step = self._step
+        while step:
+            following = index + step
+            if following < len(tree) and total + tree[following] < target:
+                index = following
+                total += tree[following]
+            step >>= 1
+        return (index, total)
+
+    def copy(self):
+        """
+        Return an independent copy of the tree.
+        """
+        clone = copy.copy(self)
+        clone._tree = list(self._tree)
+        return clone
+
+
+# pylint: disable=R0902
+class Utf8Storage(TextStorage):
+    """
+    Store text as chunks of UTF-8 bytes.
+
+    Attributes:
+        _chunks: A list of bytes objects holding the text in UTF-8.
+        _chunk_chars: A list of ints representing the number of characters in
+            every chunk.
+        _chunk_newlines: A list of ints representing the number of newlines in
+            every chunk.
+        _chars: A _Fenwick over _chunk_chars.
+        _newlines: A _Fenwick over _chunk_newlines.
+        _strides: A dict mapping the index of a chunk that is not pure ASCII
+            to a list of the byte offsets of every STRIDE-th character in it.
+        _length: An int representing the number of characters in the storage.
+        _shared: A bool representing whether the lists are shared with a
+            snapshot, and must be copied before they are edited.
+    """
+
+    def __init__(self, text=""):
+        super().__init__(text)
+        self._load(_split_chunks(text.encode(ENCODING)))
+        self._shared = False
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Make storage from UTF-8 bytes, without decoding them into one string.
+
+        Args:
+            data: A bytes object of UTF-8 text.
+
+        Returns:
+            A Utf8Storage.
+        """
+        storage = cls()
+        storage._load(_split_chunks(data))
+        return storage
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Make storage holding the text of a UTF-8 file, without decoding it
+        into one string.
+
+        The bytes are checked to be UTF-8 as they are read, and line endings
+        become newlines like when reading in text mode.
+
+        Args:
+            path: A string representing the path of the file.
+
+        Returns:
+            A Utf8Storage.
+
+        Raises:
+            UnicodeDecodeError: If the file is not UTF-8.
+        """
+        decoder = codecs.getincrementaldecoder(ENCODING)()
+        blocks = []
+        with open(path, "rb") as disk_file:
+            for block in iter(lambda: disk_file.read(CHUNK_SIZE), b""):
+                decoder.decode(block)
+                blocks.append(block)
+        decoder.decode(b"", final=True)
+        data = b"".join(blocks).replace(b"\r\n", b"\n").replace(b"\r",
+                                                                 b"\n")
+        return cls.from_bytes(data)
+
+    def _load(self, chunks):
+        """
+        Hold a new list of chunks, rebuilding the index over them.
+        """
+        self._chunks = chunks
+        self._chunk_chars = [_char_count(chunk) for chunk in chunks]
+        self._chunk_newlines = [chunk.count(b"\n") for chunk in chunks]
+        self._reindex()
+
+    def _reindex(self):
+        """
+        Rebuild the index after chunks were added or removed.
+        """
+        self._chars = _Fenwick(self._chunk_chars)
+        self._newlines = _Fenwick(self._chunk_newlines)
+        self._strides = {}
+        self._length = sum(self._chunk_chars)
+
+    @property
+    def chunk_count(self):
+        """
+        Return the number of chunks the text is split into.
+        """
+        return len(self._chunks)
+
+    @property
+    def byte_length(self):
+        """
+        Return the number of bytes the text takes in UTF-8.
+        """
+        return sum(len(chunk) for chunk in self._chunks)
+
+    # Sparse index
+
+    def _locate(self, pos):
+        """
+        Return the chunk holding a character position.
+
+        A position between two chunks is in the later one, except at the end
+        of the text, which is at the end of the last chunk.
+
+        Returns:
+            A tuple (chunk, offset) of the index of the chunk and the
+            character offset of the position in it.
+        """
+        chunk, before = self._chars.lower(pos + 1)
+        if chunk == len(self._chunks):
+            chunk -= 1
+            before -= self._chunk_chars[chunk]
+        return (chunk, pos - before)
+
+    def _byte_offset(self, chunk, offset):
+        """
+        Return the byte offset of a character offset in a chunk.
+        """
+        data = self._chunks[chunk]
+        if len(data) == self._chunk_chars[chunk]:
+            # Pure ASCII, so characters are bytes
+            return offset
+
+        strides = self._strides.get(chunk)
+        if strides is None:
+            text = data.decode(ENCODING)
+            strides = [0]
+            for start in range(0, len(text) - STRIDE, STRIDE):
+                strides.append(strides[-1] +
+                               len(text[start:start+STRIDE].encode(ENCODING)))
+            self._strides[chunk] = strides
+
+        stride, remaining = divmod(offset, STRIDE)
+        if stride >= len(strides):
+            stride = len(strides) - 1
+            remaining = offset - stride * STRIDE
+        start = strides[stride]
+        text = data[start:start + 4 * remaining].decode(ENCODING,
+                                                        errors="ignore")
+        return start + len(text[:remaining].encode(ENCODING))
+
+    def _chunk_char_offset(self, chunk, byte):
+        """
+        Return the character offset of a byte offset in a chunk.
+        """
+        data = self._chunks[chunk]
+        if len(data) == self._chunk_chars[chunk]:
+            return byte
+        return len(data[:byte].decode(ENCODING))
+
+    # Storage interface
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def text(self):
+        return b"".join(self._chunks).decode(ENCODING)
+
+    def _bytes_between(self, start, end):
+        """
+        Return the UTF-8 bytes of the text between two positions.
+        """
+        first, first_offset = self._locate(start)
+        last, last_offset = self._locate(end)
+        byte_start = self._byte_offset(first, first_offset)
+        byte_end = self._byte_offset(last, last_offset)
+        chunks = self._chunks
+        if first == last:
+            return chunks[first][byte_start:byte_end]
+        return b"".join([chunks[first][byte_start:],
+                         *chunks[first+1:last],
+                         chunks[last][:byte_end]])
+
+    def slice(self, start, end):
+        start = max(0, start)
+        end = min(end, self._length)
+        if start >= end:
+            return ""
+        return self._bytes_between(start, end).decode(ENCODING)
+
+    def snapshot(self):
+        # Chunks are bytes and never modified, so a snapshot only needs the
+        # lists. Those are shared until the next edit copies them.
+        snapshot = copy.copy(self)
+        snapshot._strides = dict(self._strides)
+        snapshot._shared = True
+        self._shared = True
+        return snapshot
+
+    def _unshare(self):
+        """
+        Copy the lists if a snapshot shares them, before editing them.
+        """
+        if self._shared:
+            self._chunks = list(self._chunks)
+            self._chunk_chars = list(self._chunk_chars)
+            self._chunk_newlines = list(self._chunk_newlines)
+            self._chars = self._chars.copy()
+            self._newlines = self._newlines.copy()
+            self._strides = dict(self._strides)
+            self._shared = False
+
+    def _set_chunk(self, chunk, data):
+        """
+        Replace the bytes of a chunk, splitting it if it got too big.
+        """
+        if len(data) > 2 * CHUNK_SIZE or not data:
+            pieces = _split_chunks(data)
+            self._chunks[chunk:chunk+1] = pieces
+            self._chunk_chars[chunk:chunk+1] = [_char_count(piece)
+                                                for piece in pieces]
+            self._chunk_newlines[chunk:chunk+1] = [piece.count(b"\n")
+                                                   for piece in pieces]
+            self._reindex()
+            return
+
+        chars = _char_count(data)
+        newlines = data.count(b"\n")
+        self._chars.add(chunk, chars - self._chunk_chars[chunk])
+        self._newlines.add(chunk, newlines - self._chunk_newlines[chunk])
+        self._length += chars - self._chunk_chars[chunk]
+        self._chunks[chunk] = data
+        self._chunk_chars[chunk] = chars
+        self._chunk_newlines[chunk] = newlines
+        self._strides.pop(chunk, None)
+
+    def insert(self, pos, text):
+        if not text:
+            return
+        self._unshare()
+        data = text.encode(ENCODING)
+        if not self._chunks:
+            self._load(_split_chunks(data))
+            return
+        chunk, offset = self._locate(pos)
+        old = self._chunks[chunk]
+        byte = self._byte_offset(chunk, offset)
+        self._set_chunk(chunk, old[:byte] + data + old[byte:])
+
+    def delete(self, start, end):
+        start = max(0, start)
+        end = min(end, self._length)
+        if start >= end:
+            return ""
+        self._unshare()
+        first, first_offset = self._locate(start)
+        last, last_offset = self._locate(end)
+        byte_start = self._byte_offset(first, first_offset)
+        byte_end = self._byte_offset(last, last_offset)
+        chunks = self._chunks
+
+        if first == last:
+            old = chunks[first]
+            deleted = old[byte_start:byte_end]
+            self._set_chunk(first, old[:byte_start] + old[byte_end:])
+            return deleted.decode(ENCODING)
+
+        deleted = b"".join([chunks[first][byte_start:],
+                            *chunks[first+1:last],
+                            chunks[last][:byte_end]])
+        # Keep the ends of the first and last chunks, drop the ones between
+        kept = [piece for piece in (chunks[first][:byte_start],
+                                    chunks[last][byte_end:]) if piece]
+        chunks[first:last+1] = kept
+        self._chunk_chars[first:last+1] = [_char_count(piece)
+                                           for piece in kept]
+        self._chunk_newlines[first:last+1] = [piece.count(b"\n")
+                                              for piece in kept]
+        self._reindex()
+        return deleted.decode(ENCODING)
+
+    # Line lookups, answered from the index.
+
+    def line_index(self):
+        return StorageLineIndex(self)
+
+    def newlines_before(self, pos):
+        pos = max(0, min(pos, self._length))
+        if not self._chunks:
+            return 0
+        chunk, offset = self._locate(pos)
+        byte = self._byte_offset(chunk, offset)
+        return (self._newlines.prefix(chunk) +
+                self._chunks[chunk].count(b"\n", 0, byte))
+
+    def newline_count(self):
+        return self._newlines.prefix(len(self._chunks))
+
+    def line_start(self, line):
+        if line <= 0:
+            return 0
+        if line > self.newline_count():
+            return self._length
+
+        # The chunk holding the newline ending the previous line
+        chunk, before = self._newlines.lower(line)
+        data = self._chunks[chunk]
+        byte = -1
+        for _ in range(line - before):
+            byte = data.find(b"\n", byte + 1)
+        return (self._chars.prefix(chunk) +
+                self._chunk_char_offset(chunk, byte + 1))
@@ -0,0 +1,96 @@
+"""
+Versioned snapshots of buffer text for background threads.
+
+Background threads (saving, indexing, searching) want to read the text of a
+buffer while the main loop keeps editing it. Reading the live storage from
+another thread would see edits half done, so readers pin a version instead: a
+snapshot of the text as of one modification tick, which no edit ever changes.
+
+Snapshots share structure with the live storage, so pinning is O(1). A version
+is only made when a reader asks for one, and readers pinning the same tick
+share it. Writers never wait for readers to finish: an edit made while a
+version is pinned simply publishes a new tick, and the storage copies what it
+needs to so the pinned version stays as it was. The one lock is held by a
+writer while it edits the storage and by a reader while it takes the O(1)
+snapshot, never while text is read.
+
+Every version counts its readers. When the last one releases it, the version
+drops its snapshot, so the old text can be freed as soon as nobody reads it.
+"""
+
+import threading
+
+
+# pylint: disable=R0903
+class _Version:
+    """
+    A snapshot of the text at one tick, shared by the readers pinning it.
+
+    Attributes:
+        storage: A TextStorage holding the text, which is never edited, or
+            None once the version is freed.
+        tick: An int representing the modification tick of the text.
+        readers: An int representing how many readers pin the version.
+    """
+
+    __slots__ = ("storage", "tick", "readers")
+
+    def __init__(self, storage, tick):
+        self.storage = storage
+        self.tick = tick
+        self.readers = 0
+
+
+class VersionTable:
+    """
+    The versions of a text pinned by readers.
+
+    Attributes:
+        lock: A threading.Lock held while the storage is edited or
+            snapshotted. Writers hold it for the edit only.
+        _latest: The _Version of the newest tick pinned, or None if no reader
+            pins it.
+    """
+
+    def __init__(self):
+        """
+        Initialize a table with no versions.
+        """
+        self.lock = threading.Lock()
+        self._latest = None
+
+    def pin(self, storage, tick):
+        """
+        Pin a version of the text as it is now.
+
+        The caller must hold the lock, so the text cannot change while it
+        reads anything else that has to match the version.
+
+        Args:
+            storage: The TextStorage holding the live text.
+            tick: An int representing the modification tick of the live text.
+
+        Returns:
+            A tuple (version, storage) of the pinned _Version and the
+            snapshot of the text it holds.
+        """
+        version = self._latest
+        if version is None or version.tick != tick:
+            version = _Version(storage.snapshot(), tick)
+            self._latest = version
+        version.readers += 1
+        return (version, version.storage)
+
+    def release(self, version):
+        """
+        Unpin a version, freeing it if no reader pins it any more.
+
+        Args:
+            version: A _Version returned by pin.
+        """
+        with self.lock:
+            version.readers -= 1
+            if version.readers == 0:
+                if self._latest is version:
+                    self._latest = None
+                version.storage = None
@@ -4,9 +4,69 @@ Ihmacs view module.
 Views the active buffer.
 """
 
+import bisect
 import curses
 
 
+# Curses attributes for the faces text properties and overlays can ask for
+# with their "face" property.
+FACES = {
+    "bold": curses.A_BOLD,
+    "underline": curses.A_UNDERLINE,
+    "reverse": curses.A_REVERSE,
+    "standout": curses.A_STANDOUT,
+    "dim": curses.A_DIM,
+}
+
+
+def face_attributes(face):
+    """
+    Return the curses attributes for a face.
+
+    Args:
+        face: A string naming a face in FACES, or a list of them. Unknown
+            faces are ignored.
+
+    Returns:
+        An int representing the curses attributes.
+    """
+    if isinstance(face, str):
+        face = [face]
+    attributes = curses.A_NORMAL
+    for name in face:
+        attributes |= FACES.get(name, curses.A_NORMAL)
+    return attributes
+
+
+def fit_line(text, term_cols, point_col=None):
+    """
+    Fit a line of text into the width of the terminal.
+
+    Lines too long for the terminal end in a $ at the last column. If point
+    is on the line past the last column, the line scrolls sideways so the
+    text just before point fills the screen, with a $ in the first column.
+
+    Args:
+        text: A string representing a line without its newline.
+        term_cols: An int representing the width of the terminal.
+        point_col: An int representing the column of point if it is on the
+            line, or None.
+
+    Returns:
+        A tuple (shown, first_col, last_col, shift). shown is the string to
+        draw. The columns of text from first_col up to last_col are on
+        screen, each shift columns from where it is in the line.
+    """
+    if point_col is not None and point_col >= term_cols:
+        first_col = point_col - term_cols + 2
+        end = " " if point_col == len(text) else "$"
+        shown = "$" + text[first_col:point_col] + end
+        return shown, first_col, point_col, 1 - first_col
+    if len(text) > term_cols:
+        return text[:term_cols-1] + "$", 0, term_cols - 1, 0
+    return text, 0, len(text), 0
+
+
 class View:
     """
     Ihmacs class for displaying text in a terminal.
@@ -55,7 +115,6 @@ class View:
         # Line numbers index at 1, but Python indexes at 0.
         point_line = buff.line - 1
         point_col = buff.column
-        text = buff.text
         # Line numbers index at 1, but Python indexes at 0.
         start_line = buff.display_line - 1
 
@@ -65,33 +124,68 @@ class View:
         # Editing area is all but the last 2 lines
         display_lines = term_lines - 2
 
-        # Draw text
-        display_text = text.split("\n")[start_line:start_line+display_lines]
-        for line, text in enumerate(display_text):
-            text = display_text[line]
-            if len(text) > term_cols:
-                text = text[:term_cols-1] + "$"
-            window.addstr(line, 0, text)
-
-        # Redraw line with point
+        # Draw text. Only the visible lines are pulled out of the buffer. The
+        # line with point scrolls sideways to keep point on screen.
+        display_text = list(buff.iter_lines(start_line+1,
+                                            start_line+1+display_lines))
         term_point_line = point_line-start_line
-        point_line_text = display_text[term_point_line]
-
-        if len(point_line_text) < term_cols:
-            window.move(term_point_line, point_col)
-        elif point_col < term_cols:
+        layouts = []
+        for line, text in enumerate(display_text):
+            layout = fit_line(text, term_cols,
+                              point_col if line == term_point_line else None)
+            window.addstr(line, 0, layout[0])
+            layouts.append(layout)
+        self._draw_faces(start_line, display_text, layouts)
+
+        # Move the cursor to point
+        if point_col < term_cols:
             window.move(term_point_line, point_col)
-        elif point_col == len(point_line_text):
-            start_index = point_col - term_cols + 2
-            text = "$"+point_line_text[start_index:point_col]+" "
-            window.addstr(term_point_line, 0, text)
-            window.move(term_point_line, term_cols-1)
         else:
-            start_index = point_col - term_cols + 2
-            text = "$"+point_line_text[start_index:point_col]+"$"
-            window.addstr(term_point_line, 0, text)
             window.move(term_point_line, term_cols-1)
 
+    def _draw_faces(self, start_line, display_text, layouts):
+        """
+        Draw the faces of the text properties and overlays on screen.
+
+        Only the intervals overlapping the visible lines are looked up.
+
+        Args:
+            start_line: An int representing the first visible line, indexing
+                at 0.
+            display_text: A list of strings representing the visible lines.
+            layouts: A list of the tuples fit_line returned for each visible
+                line.
+        """
+        if not display_text:
+            return
+        ihmacs_state = self.ihmacs_state
+        window = ihmacs_state.window
+        buff = ihmacs_state.active_buff()
+
+        # Where each visible line starts in the buffer
+        line_starts = [buff.line_start(start_line+1)]
+        for text in display_text:
+            line_starts.append(line_starts[-1] + len(text) + 1)
+        window_end = line_starts[-1] - 1
+
+        for start, end, properties in buff.properties_in(line_starts[0],
+                                                         window_end):
+            face = properties.get("face")
+            if face is None:
+                continue
+            attributes = face_attributes(face)
+            first_line = bisect.bisect_right(line_starts, start) - 1
+            last_line = bisect.bisect_left(line_starts, end)
+            for line in range(first_line, min(last_line, len(display_text))):
+                _, first_col, last_col, shift = layouts[line]
+                line_start = line_starts[line]
+                # Only the columns of the line that are on screen
+                first = max(start - line_start, first_col)
+                last = min(end - line_start, last_col)
+                if first < last:
+                    window.chgat(line, first + shift, last - first,
+                                 attributes)
+
     def _draw_modeline(self):
         """
         Draw the modeline for the active buffer.